@@ -0,0 +1,113 @@
+"""
+Бенчмарк одновременных регистраций: gunicorn WSGI против ASGI (uvicorn).
+
+Запускает заглушку hunter.io с задержкой --delay, затем по очереди сервер
+gunicorn с синхронными воркерами (как make start-production) и uvicorn
+с ASYNC_VIEWS=True, и отправляет каждому --requests регистраций с
+--concurrency одновременными соединениями. Все адреса уникальны, поэтому
+каждая регистрация ждет ответа hunter.io. Печатает пропускную способность,
+задержки и коды ответов.
+
+Пример:
+    python -m benchmarks.asgi_registration --sqlite /tmp/bench.sqlite3 --requests 500 --concurrency 100
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter
+
+import httpx
+
+from benchmarks.common import add_database_argument, free_port, print_json, setup_django, summarize, wait_ready
+
+
+def server_command(server: str, port: int, workers: int, threads: int) -> list:
+    if server == 'wsgi':
+        return [sys.executable, '-m', 'gunicorn', 'testapi.wsgi:application', '-b', f'127.0.0.1:{port}',
+                '--workers', str(workers), '--threads', str(threads)]
+    return [sys.executable, '-m', 'uvicorn', 'testapi.asgi:application', '--host', '127.0.0.1', '--port', str(port),
+            '--workers', str(workers), '--no-access-log']
+
+
+async def load(url: str, requests: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    durations = []
+    codes = Counter()
+    run = uuid.uuid4().hex[:8]
+
+    async def register(client: httpx.AsyncClient, index: int) -> None:
+        payload = {'username': f'bench_{run}_{index}', 'password': 'benchmark-password',
+                   'email': f'bench_{run}_{index}@example.com'}
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.post(url, json=payload)
+                codes[response.status_code] += 1
+            except httpx.HTTPError as exc:
+                codes[type(exc).__name__] += 1
+            durations.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=300.0, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(register(client, index) for index in range(requests)))
+        elapsed = time.perf_counter() - started
+    return {'seconds': elapsed, 'requests_per_second': requests / elapsed,
+            'status_codes': dict(codes), 'latency': summarize(durations)}
+
+
+def run_server(server: str, args, env: dict) -> dict:
+    port = free_port()
+    workers = args.wsgi_workers if server == 'wsgi' else args.asgi_workers
+    command = server_command(server, port, workers, args.wsgi_threads)
+    server_env = dict(env, ASYNC_VIEWS='True' if server == 'asgi' else 'False')
+    process = subprocess.Popen(command, env=server_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base_url = f'http://127.0.0.1:{port}'
+        wait_ready(f'{base_url}/login/', process)
+        result = asyncio.run(load(f'{base_url}/register/', args.requests, args.concurrency))
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return {'server': server, 'workers': workers,
+            'threads': args.wsgi_threads if server == 'wsgi' else None, **result}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_database_argument(parser)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--delay', type=float, default=0.5, help='Задержка ответа заглушки hunter.io, в секундах')
+    parser.add_argument('--servers', nargs='+', choices=['wsgi', 'asgi'], default=['wsgi', 'asgi'])
+    parser.add_argument('--wsgi-workers', type=int, default=1)
+    parser.add_argument('--wsgi-threads', type=int, default=1)
+    parser.add_argument('--asgi-workers', type=int, default=1)
+    parser.add_argument('--slow-hasher', action='store_true',
+                        help='Хешировать пароли PBKDF2 из настроек вместо быстрого MD5')
+    args = parser.parse_args()
+
+    setup_django(args.sqlite, migrate=bool(args.sqlite))
+    from testapi.stubs import HunterStubServer
+
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='benchmarks.server_settings', EH_CACHE_SIZE='0')
+    if args.sqlite:
+        env['BENCHMARK_SQLITE'] = os.path.abspath(args.sqlite)
+    if not args.slow_hasher:
+        env['BENCHMARK_FAST_HASHER'] = '1'
+    results = []
+    with HunterStubServer(delay=args.delay) as stub:
+        env['EH_API_URL'] = stub.url
+        for server in args.servers:
+            results.append(run_server(server, args, env))
+        hunter_requests = len(stub.requests)
+    print_json({'requests': args.requests, 'concurrency': args.concurrency, 'hunter_delay': args.delay,
+                'hunter_requests': hunter_requests, 'results': results})
+
+
+if __name__ == '__main__':
+    main()
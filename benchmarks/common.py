@@ -0,0 +1,89 @@
+"""
+Общие функции для скриптов бенчмарков.
+
+Скрипты запускаются из корня проекта как модули (python -m benchmarks.<name>)
+и используют настройки из .env. По умолчанию работа идет с базой PostgreSQL
+из настроек; параметр --sqlite PATH переключает скрипт на файл SQLite.
+"""
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+
+def setup_django(sqlite_path: str | None = None, migrate: bool = False) -> None:
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'testapi.settings')
+    from django.conf import settings
+    if sqlite_path:
+        settings.DATABASES['default'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': sqlite_path,
+        }
+    import django
+    django.setup()
+    if migrate:
+        from django.core.management import call_command
+        call_command('migrate', verbosity=0)
+
+
+def add_database_argument(parser) -> None:
+    parser.add_argument('--sqlite', metavar='PATH', default=None,
+                        help='Использовать файл SQLite вместо PostgreSQL из .env')
+
+
+@contextmanager
+def timer(results: dict, name: str):
+    started = time.perf_counter()
+    yield
+    results[name] = time.perf_counter() - started
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(durations: list) -> dict:
+    return {
+        'count': len(durations),
+        'mean_ms': statistics.fmean(durations) * 1000 if durations else 0.0,
+        'p50_ms': percentile(durations, 0.50) * 1000,
+        'p95_ms': percentile(durations, 0.95) * 1000,
+        'p99_ms': percentile(durations, 0.99) * 1000,
+        'max_ms': max(durations) * 1000 if durations else 0.0,
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    """
+    Ждет, пока запущенный бенчмарком сервер начнет отвечать по url.
+    """
+    import httpx
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Server exited with code {process.returncode}')
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError('Server did not start in time')
+
+
+def print_json(data: dict) -> None:
+    json.dump(data, sys.stdout, indent=2, default=str)
+    sys.stdout.write('\n')
@@ -0,0 +1,83 @@
+"""
+Бенчмарк повторных опросов ref-info с версиями и ETag.
+
+Создает пользователя с --referrals рефералами и измеряет
+задержку и количество запросов к БД для трех видов опроса:
+    cold         - кэш ответов пуст, страница читается из БД;
+    cached       - данные не менялись, страница берется из кэша ответов;
+    not_modified - клиент присылает If-None-Match и получает 304.
+
+Запросы выполняются тестовым клиентом Django в одном процессе, поэтому в
+задержку входит весь стек Django и DRF, но не сеть.
+
+Пример:
+    python -m benchmarks.conditional_polls --sqlite /tmp/polls.sqlite3 --requests 2000
+"""
+import argparse
+import time
+
+from benchmarks.common import add_database_argument, print_json, setup_django, summarize
+
+
+def seed(referrals: int):
+    from django.contrib.auth import get_user_model
+    from django.db import transaction
+    from testapi.models import Referral
+
+    user_model = get_user_model()
+    user_model.objects.filter(username__startswith='poll-bench-').delete()
+    with transaction.atomic():
+        user = user_model.objects.create_user(username='poll-bench-owner', email='owner@example.com')
+        invited = user_model.objects.bulk_create(
+            [user_model(username=f'poll-bench-{index}', password='!') for index in range(referrals)])
+        Referral.objects.bulk_create([Referral(referrer=user, referral=referral) for referral in invited])
+    return user
+
+
+def measure(client, url: str, params: dict, requests: int, mode: str) -> dict:
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    etag = client.get(url, params)['ETag']
+    headers = {'If-None-Match': etag} if mode == 'not_modified' else {}
+    durations, queries, statuses = [], 0, set()
+    for _ in range(requests):
+        if mode == 'cold':
+            cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = client.get(url, params, headers=headers)
+            durations.append(time.perf_counter() - started)
+        queries += len(captured)
+        statuses.add(response.status_code)
+    return {**summarize(durations), 'queries_per_request': queries / requests, 'statuses': sorted(statuses)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_database_argument(parser)
+    parser.add_argument('--referrals', type=int, default=1000, help='Количество рефералов пользователя')
+    parser.add_argument('--page-size', type=int, default=100, help='Размер страницы ref-info')
+    parser.add_argument('--requests', type=int, default=1000, help='Количество опросов в каждом режиме')
+    args = parser.parse_args()
+
+    setup_django(args.sqlite, migrate=True)
+    from django.test.utils import setup_test_environment
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    setup_test_environment()
+    user = seed(args.referrals)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+    results = {}
+    for mode in ('cold', 'cached', 'not_modified'):
+        results[mode] = measure(client, reverse('ref-info'), {'page_size': args.page_size}, args.requests, mode)
+    print_json({'referrals': args.referrals, 'page_size': args.page_size, 'results': results})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Бенчмарк запросов в секунду с постоянными соединениями и пулом psycopg и без них.
+
+Для каждого режима из --modes запускает gunicorn (потоковые воркеры) с
+соответствующими переменными DB_* и отправляет --requests запросов GET ref-info/
+с --concurrency одновременными соединениями. Каждый запрос читает пользователя
+по JWT и страницу рефералов, поэтому без пула на каждый запрос открывается
+новое соединение с PostgreSQL.
+    none       - DB_CONN_MAX_AGE=0 (как до настройки пула);
+    persistent - DB_CONN_MAX_AGE=--max-age, DB_CONN_HEALTH_CHECKS=True;
+    pool       - DB_POOL=True, DB_POOL_MAX_SIZE=--pool-size, DB_CONN_HEALTH_CHECKS=True.
+
+Нужен PostgreSQL из .env: пул и постоянные соединения к SQLite не применимы.
+
+Пример:
+    python -m benchmarks.db_pooling --requests 5000 --concurrency 32 --threads 8
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+from benchmarks.common import free_port, print_json, setup_django, summarize, wait_ready
+
+MODES = {
+    'none': {'DB_CONN_HEALTH_CHECKS': 'False', 'DB_POOL': 'False'},
+    'persistent': {'DB_CONN_HEALTH_CHECKS': 'True', 'DB_POOL': 'False'},
+    'pool': {'DB_CONN_HEALTH_CHECKS': 'True', 'DB_POOL': 'True'},
+}
+
+
+def prepare_user(referrals: int) -> str:
+    from django.contrib.auth import get_user_model
+    from rest_framework_simplejwt.tokens import AccessToken
+    from testapi.models import Referral
+
+    user_model = get_user_model()
+    user, created = user_model.objects.get_or_create(username='bench_pooling', defaults={'email': 'bench@example.com'})
+    if created:
+        for index in range(referrals):
+            referral = user_model.objects.create(username=f'bench_pooling_{index}',
+                                                 email=f'bench_pooling_{index}@example.com')
+            Referral.objects.create(referrer=user, referral=referral)
+    return str(AccessToken.for_user(user))
+
+
+async def load(url: str, token: str, requests: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    durations = []
+    codes = Counter()
+
+    async def fetch(client: httpx.AsyncClient) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.get(url)
+                codes[response.status_code] += 1
+            except httpx.HTTPError as exc:
+                codes[type(exc).__name__] += 1
+            durations.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=60.0, limits=limits, headers={'Authorization': f'Bearer {token}'}) as client:
+        await fetch(client)
+        durations.clear()
+        codes.clear()
+        started = time.perf_counter()
+        await asyncio.gather(*(fetch(client) for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+    return {'seconds': elapsed, 'requests_per_second': requests / elapsed,
+            'status_codes': dict(codes), 'latency': summarize(durations)}
+
+
+def run_mode(mode: str, args, token: str) -> dict:
+    port = free_port()
+    env = dict(os.environ, **MODES[mode], DB_CONN_MAX_AGE=str(args.max_age) if mode == 'persistent' else '0',
+               DB_POOL_MAX_SIZE=str(args.pool_size))
+    command = [sys.executable, '-m', 'gunicorn', 'testapi.wsgi:application', '-b', f'127.0.0.1:{port}',
+               '--workers', str(args.workers), '--threads', str(args.threads)]
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base_url = f'http://127.0.0.1:{port}'
+        wait_ready(f'{base_url}/login/', process)
+        result = asyncio.run(load(f'{base_url}/ref-info/?page_size=20', token, args.requests, args.concurrency))
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return {'mode': mode, **result}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--pool-size', type=int, default=8)
+    parser.add_argument('--max-age', type=int, default=60)
+    parser.add_argument('--referrals', type=int, default=50)
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+    args = parser.parse_args()
+
+    setup_django()
+    token = prepare_user(args.referrals)
+    print_json({'requests': args.requests, 'concurrency': args.concurrency, 'workers': args.workers,
+                'threads': args.threads, 'results': [run_mode(mode, args, token) for mode in args.modes]})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Бенчмарк накладных расходов testapi.instrumentation.performance_middleware.
+
+Выполняет --requests запросов к ref-info тестовым клиентом Django с промежуточным
+слоем и без него и печатает задержки и разницу медиан на один запрос.
+
+Пример:
+    python -m benchmarks.instrumentation_overhead --sqlite /tmp/metrics.sqlite3 --requests 5000
+"""
+import argparse
+import time
+
+from benchmarks.common import add_database_argument, print_json, setup_django, summarize
+
+MIDDLEWARE = 'testapi.instrumentation.performance_middleware'
+
+
+def measure(client, url: str, requests: int) -> list:
+    durations = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        client.get(url, {'page_size': 10})
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_database_argument(parser)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--referrals', type=int, default=50, help='Количество рефералов пользователя')
+    args = parser.parse_args()
+
+    setup_django(args.sqlite, migrate=True)
+    from django.conf import settings
+    from django.contrib.auth import get_user_model
+    from django.test.utils import override_settings, setup_test_environment
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+    from testapi.models import Referral
+
+    setup_test_environment()
+    user_model = get_user_model()
+    user_model.objects.filter(username__startswith='metrics-bench-').delete()
+    user = user_model.objects.create_user(username='metrics-bench-owner')
+    invited = user_model.objects.bulk_create(
+        [user_model(username=f'metrics-bench-{index}', password='!') for index in range(args.referrals)])
+    Referral.objects.bulk_create([Referral(referrer=user, referral=referral) for referral in invited])
+
+    url = reverse('ref-info')
+    results = {}
+    # Кэш ответов отключается, чтобы каждый запрос доходил до БД
+    for name, middleware in [('without', [item for item in settings.MIDDLEWARE if item != MIDDLEWARE]),
+                             ('with', settings.MIDDLEWARE)]:
+        with override_settings(MIDDLEWARE=middleware,
+                               CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            client = APIClient()
+            client.force_authenticate(user=user)
+            measure(client, url, min(200, args.requests))
+            results[name] = summarize(measure(client, url, args.requests))
+    print_json({'requests': args.requests, 'results': results,
+                'overhead_p50_ms': results['with']['p50_ms'] - results['without']['p50_ms']})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+"""
+Нагрузочный прогон основных эндпоинтов API на локальных заглушках.
+
+Запускает заглушку hunter.io с задержкой --hunter-delay, SMTP-приемник,
+сервер приложения (gunicorn или uvicorn, как в make start-production и
+make start-asgi) и send_outbox, после чего по очереди нагружает эндпоинты
+с --concurrency одновременными запросами:
+    register     - POST register/ с уникальными пользователями;
+    login        - POST login/ зарегистрированными пользователями;
+    ref-code:post - POST ref-code/, создание кода;
+    ref-code     - GET ref-code/, письмо с кодом через outbox;
+    ref-info     - GET ref-info/.
+Для каждого эндпоинта печатает JSON с пропускной способностью, задержками
+p50/p95/p99, кодами ответов и долей ошибок, а также число писем, дошедших до
+SMTP-приемника. Результат можно сохранить (--output) и сравнить со
+следующим прогоном (--baseline).
+
+По умолчанию используется PostgreSQL из .env (миграции должны быть применены),
+параметр --sqlite PATH переключает сервер на файл SQLite. SQLite допускает только
+одного пишущего, поэтому на ней часть записей (ref-code:post) завершается ошибкой
+database is locked; сравнивать версии стоит на PostgreSQL.
+
+Пример:
+    python -m benchmarks.load_test --users 500 --concurrency 50 --output before.json
+    python -m benchmarks.load_test --users 500 --concurrency 50 --baseline before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+from benchmarks.common import add_database_argument, free_port, print_json, setup_django, summarize, wait_ready
+
+
+def server_command(args, port: int) -> list:
+    if args.server == 'wsgi':
+        return [sys.executable, '-m', 'gunicorn', 'testapi.wsgi:application', '-b', f'127.0.0.1:{port}',
+                '--workers', str(args.workers), '--threads', str(args.threads)]
+    return [sys.executable, '-m', 'uvicorn', 'testapi.asgi:application', '--host', '127.0.0.1', '--port', str(port),
+            '--workers', str(args.workers), '--no-access-log']
+
+
+async def run_phase(client: httpx.AsyncClient, calls: list, concurrency: int, ok: set) -> tuple[dict, list]:
+    """
+    Выполняет вызовы calls (функции без аргументов, возвращающие корутину запроса)
+    не более чем по concurrency одновременно.
+
+    Возвращает:
+        Кортеж (статистика фазы, список успешных ответов в порядке calls; None для неуспешных).
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    durations, codes = [], Counter()
+    responses = [None] * len(calls)
+
+    async def call(index: int) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await calls[index]()
+                codes[response.status_code] += 1
+                if response.status_code in ok:
+                    responses[index] = response
+            except httpx.HTTPError as exc:
+                codes[type(exc).__name__] += 1
+            durations.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(call(index) for index in range(len(calls))))
+    elapsed = time.perf_counter() - started
+    errors = sum(count for code, count in codes.items() if code not in ok)
+    return {
+        'requests': len(calls),
+        'seconds': elapsed,
+        'requests_per_second': len(calls) / elapsed if elapsed else 0.0,
+        'errors': errors,
+        'error_rate': errors / len(calls) if calls else 0.0,
+        'status_codes': {str(code): count for code, count in codes.items()},
+        'latency': summarize(durations),
+    }, responses
+
+
+async def load(base_url: str, args) -> dict:
+    run = uuid.uuid4().hex[:8]
+    users = [{'username': f'load_{run}_{index}', 'password': 'load-test-password',
+              'email': f'load_{run}_{index}@example.com'} for index in range(args.users)]
+    expiry_date = (datetime.now(timezone.utc) + timedelta(days=30)).date().isoformat()
+    requests = args.requests or args.users
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        results['register'], _ = await run_phase(
+            client, [lambda user=user: client.post('/register/', json=user) for user in users],
+            args.concurrency, {201, 202})
+        # Асинхронная регистрация (REGISTRATION_ASYNC) создает пользователей в фоне
+        await asyncio.sleep(args.settle)
+        results['login'], responses = await run_phase(
+            client, [lambda user=users[index % len(users)]: client.post('/login/', json={
+                'username': user['username'], 'password': user['password']}) for index in range(requests)],
+            args.concurrency, {200})
+        tokens = list({response.json()['access'] for response in responses if response is not None})
+        if not tokens:
+            return results
+        headers = [{'Authorization': f'Bearer {token}'} for token in tokens]
+        results['ref-code:post'], _ = await run_phase(
+            client, [lambda auth=auth: client.post('/ref-code/', json={'expiry_date': expiry_date}, headers=auth)
+                     for auth in headers],
+            args.concurrency, {201})
+        for name, path in [('ref-code', '/ref-code/'), ('ref-info', '/ref-info/')]:
+            results[name], _ = await run_phase(
+                client, [lambda auth=headers[index % len(headers)]: client.get(path, headers=auth)
+                         for index in range(requests)],
+                args.concurrency, {200})
+    return results
+
+
+def wait_for_mail(sink, expected: int, timeout: float) -> float:
+    started = time.perf_counter()
+    while len(sink.messages) < expected and time.perf_counter() - started < timeout:
+        time.sleep(0.1)
+    return time.perf_counter() - started
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict) -> dict:
+    """
+    Сравнивает эндпоинты с прошлым прогоном: отношение пропускной способности,
+    изменение p95 в миллисекундах и изменение доли ошибок.
+    """
+    comparison = {}
+    for name, current in results.items():
+        previous = baseline.get('endpoints', {}).get(name)
+        if not previous:
+            continue
+        comparison[name] = {
+            'requests_per_second_ratio': (current['requests_per_second'] / previous['requests_per_second']
+                                          if previous['requests_per_second'] else None),
+            'p95_ms_delta': current['latency']['p95_ms'] - previous['latency']['p95_ms'],
+            'error_rate_delta': current['error_rate'] - previous['error_rate'],
+        }
+    return comparison
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_database_argument(parser)
+    parser.add_argument('--users', type=int, default=200, help='Количество регистраций')
+    parser.add_argument('--requests', type=int, default=None,
+                        help='Количество запросов login, ref-code и ref-info (по умолчанию --users)')
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--hunter-delay', type=float, default=0.2,
+                        help='Задержка ответа заглушки hunter.io, в секундах')
+    parser.add_argument('--server', choices=['wsgi', 'asgi'], default='wsgi')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4, help='Потоков на воркер gunicorn')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Таймаут одного запроса, в секундах')
+    parser.add_argument('--settle', type=float, default=0.0,
+                        help='Пауза после регистраций, например для фоновых воркеров, в секундах')
+    parser.add_argument('--mail-timeout', type=float, default=30.0,
+                        help='Сколько ждать доставки писем в SMTP-приемник, в секундах')
+    parser.add_argument('--slow-hasher', action='store_true',
+                        help='Хешировать пароли PBKDF2 из настроек вместо быстрого MD5')
+    parser.add_argument('--server-log', metavar='PATH', help='Записывать вывод сервера в файл')
+    parser.add_argument('--output', metavar='PATH', help='Сохранить результат в файл JSON')
+    parser.add_argument('--baseline', metavar='PATH', help='Сравнить с результатом прошлого прогона')
+    args = parser.parse_args()
+
+    setup_django(args.sqlite, migrate=bool(args.sqlite))
+    import django
+    from testapi.stubs import HunterStubServer, SmtpSinkServer
+
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='benchmarks.server_settings',
+               ASYNC_VIEWS='True' if args.server == 'asgi' else 'False',
+               EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+               EMAIL_USE_SSL='False', EMAIL_HOST_USER='load-test@example.com', EMAIL_HOST_PASSWORD='')
+    if args.sqlite:
+        env['BENCHMARK_SQLITE'] = os.path.abspath(args.sqlite)
+    if not args.slow_hasher:
+        env['BENCHMARK_FAST_HASHER'] = '1'
+
+    port = free_port()
+    with HunterStubServer(delay=args.hunter_delay) as hunter, SmtpSinkServer() as sink:
+        env.update(EH_API_URL=hunter.url, EMAIL_HOST=sink.host, EMAIL_PORT=str(sink.port))
+        server_log = open(args.server_log, 'w') if args.server_log else subprocess.DEVNULL
+        server = subprocess.Popen(server_command(args, port), env=env,
+                                  stdout=server_log, stderr=server_log)
+        sender = subprocess.Popen([sys.executable, 'manage.py', 'send_outbox', '--poll-interval', '0.2'], env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            base_url = f'http://127.0.0.1:{port}'
+            wait_ready(f'{base_url}/login/', server)
+            endpoints = asyncio.run(load(base_url, args))
+            expected_mail = endpoints.get('ref-code', {}).get('requests', 0) - endpoints.get('ref-code', {}).get('errors', 0)
+            mail_seconds = wait_for_mail(sink, expected_mail, args.mail_timeout)
+        finally:
+            for process in (server, sender):
+                process.terminate()
+                process.wait(timeout=30)
+        hunter_requests = len(hunter.requests)
+        delivered = len(sink.messages)
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': 'sqlite' if args.sqlite else 'postgresql',
+            'server': args.server,
+            'workers': args.workers,
+            'threads': args.threads if args.server == 'wsgi' else None,
+            'users': args.users,
+            'concurrency': args.concurrency,
+            'hunter_delay': args.hunter_delay,
+        },
+        'endpoints': endpoints,
+        'hunter': {'requests': hunter_requests},
+        'smtp': {'expected': expected_mail, 'delivered': delivered, 'drain_seconds': mail_seconds},
+    }
+    if args.baseline:
+        with open(args.baseline) as file:
+            report['comparison'] = compare(endpoints, json.load(file))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2, default=str)
+    print_json(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Бенчмарк пропускной способности входа при разном числе итераций PBKDF2.
+
+Для каждого значения --iterations пароль хешируется с этим числом итераций,
+после чего --count проверок (check_password, как при входе) выполняются:
+    inline  - последовательно в одном процессе (один поток обработки запросов);
+    threads - в пуле из --workers потоков;
+    pool    - в пуле из --workers процессов, как testapi.hashing при PASSWORD_HASH_OFFLOAD=True.
+Печатается количество проверок в секунду, в том числе на одно ядро, и задержка одной проверки.
+
+БД не нужна.
+
+Пример:
+    python -m benchmarks.password_hashing --iterations 260000 600000 1000000 --count 200
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from benchmarks.common import print_json, summarize
+
+PASSWORD = 'benchmark-password'
+
+
+def timed_check(encoded: str) -> float:
+    from django.contrib.auth.hashers import check_password
+    started = time.perf_counter()
+    if not check_password(PASSWORD, encoded):
+        raise ValueError('Password check failed')
+    return time.perf_counter() - started
+
+
+def init_worker() -> None:
+    from benchmarks.common import setup_django
+    setup_django()
+
+
+def measure(mode: str, encoded: str, count: int, workers: int) -> dict:
+    started = time.perf_counter()
+    if mode == 'inline':
+        durations = [timed_check(encoded) for _ in range(count)]
+    elif mode == 'threads':
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            durations = list(executor.map(timed_check, [encoded] * count))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+            executor.submit(time.sleep, 0).result()
+            started = time.perf_counter()
+            durations = list(executor.map(timed_check, [encoded] * count))
+    elapsed = time.perf_counter() - started
+    cores = 1 if mode == 'inline' else min(workers, os.cpu_count() or 1)
+    return {
+        'mode': mode,
+        'workers': 1 if mode == 'inline' else workers,
+        'seconds': elapsed,
+        'logins_per_second': count / elapsed,
+        'logins_per_second_per_core': count / elapsed / cores,
+        'check': summarize(durations),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, nargs='+', default=[100000, 600000, 1000000])
+    parser.add_argument('--count', type=int, default=100, help='Количество проверок пароля на каждый режим')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--modes', nargs='+', choices=['inline', 'threads', 'pool'],
+                        default=['inline', 'threads', 'pool'])
+    args = parser.parse_args()
+
+    init_worker()
+    from django.contrib.auth.hashers import PBKDF2PasswordHasher
+    hasher = PBKDF2PasswordHasher()
+    results = []
+    for iterations in args.iterations:
+        encoded = hasher.encode(PASSWORD, hasher.salt(), iterations=iterations)
+        for mode in args.modes:
+            results.append({'iterations': iterations, **measure(mode, encoded, args.count, args.workers)})
+    print_json({'cpu_count': os.cpu_count(), 'default_iterations': hasher.iterations, 'results': results})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Бенчмарк генераторов реферальных кодов.
+
+Для ключевой перестановки (feistel) генерирует --count кодов в --workers
+процессах, печатает скорость в кодах в секунду и проверяет отсутствие
+коллизий: для каждого номера проверяется decode(encode(n)) == n. Так как
+decode - функция, совпадение двух кодов означало бы совпадение номеров,
+поэтому проверка доказывает уникальность без хранения кодов в памяти.
+Для --count не больше --set-limit уникальность дополнительно проверяется
+множеством. Для генератора random считается число коллизий в множестве.
+
+БД не нужна: номера берутся из диапазона [0, count), как их выдала бы
+последовательность CodeSequence.
+
+Пример:
+    python -m benchmarks.referral_codes --count 100000000 --length 8 --workers 16
+"""
+import argparse
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.common import print_json
+
+
+def feistel_chunk(key: bytes, length: int, start: int, stop: int, collect: bool):
+    from testapi.codes import FeistelCodeGenerator
+    generator = FeistelCodeGenerator(key=key, length=length)
+    codes = [] if collect else None
+    errors = 0
+    for number in range(start, stop):
+        code = generator.encode(number)
+        if generator.decode(code) != number:
+            errors += 1
+        if collect:
+            codes.append(code)
+    return errors, codes
+
+
+def run_feistel(args) -> dict:
+    key = hashlib.blake2b(b'benchmark', digest_size=32).digest()
+    collect = args.count <= args.set_limit
+    step = -(-args.count // args.workers)
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(feistel_chunk, key, args.length, start, min(start + step, args.count), collect)
+                   for start in range(0, args.count, step)]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+    result = {
+        'generator': 'feistel',
+        'count': args.count,
+        'length': args.length,
+        'workers': args.workers,
+        'seconds': elapsed,
+        'codes_per_second': args.count / elapsed,
+        'roundtrip_errors': sum(errors for errors, _ in results),
+    }
+    if collect:
+        unique = set()
+        for _, codes in results:
+            unique.update(codes)
+        result['set_collisions'] = args.count - len(unique)
+    return result
+
+
+def run_random(args) -> dict:
+    from testapi.codes import HUMAN_ALPHABET, RandomCodeGenerator
+    generator = RandomCodeGenerator(length=args.length, alphabet=HUMAN_ALPHABET)
+    count = min(args.count, args.set_limit)
+    unique = set()
+    started = time.perf_counter()
+    for _ in range(count):
+        unique.add(generator.generate())
+    elapsed = time.perf_counter() - started
+    return {'generator': 'random', 'count': count, 'length': args.length, 'seconds': elapsed,
+            'codes_per_second': count / elapsed, 'set_collisions': count - len(unique)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=1000000)
+    parser.add_argument('--length', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--set-limit', type=int, default=10000000,
+                        help='Максимальное количество кодов для проверки уникальности множеством')
+    parser.add_argument('--generator', choices=['feistel', 'random', 'both'], default='both')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'testapi.settings')
+    results = []
+    if args.generator in ('feistel', 'both'):
+        results.append(run_feistel(args))
+    if args.generator in ('random', 'both'):
+        results.append(run_random(args))
+    print_json({'results': results})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Бенчмарк индексов и ограничений ReferralCode и Referral.
+
+Заполняет базу --users пользователями с --codes кодами каждый (активен только
+последний) и --referrals рефералами у каждого --referrer-share доли
+пользователей, затем для горячих запросов печатает планы EXPLAIN и время
+выполнения дважды: без индексов миграции 0008 (база откатывается на 0007)
+и с ними.
+
+Пример:
+    python -m benchmarks.referral_indexes --users 200000
+"""
+import argparse
+import random
+import time
+
+from benchmarks.common import add_database_argument, print_json, setup_django, summarize
+
+
+BASELINE_MIGRATION = '0007_referralstats'
+INDEXED_MIGRATION = '0008_referral_constraints'
+
+
+def seed(args, rng: random.Random) -> list:
+    from datetime import timedelta
+    from django.contrib.auth import get_user_model
+    from django.db import transaction
+    from django.utils import timezone
+    from testapi.models import Referral, ReferralCode
+
+    user_model = get_user_model()
+    expiry = timezone.now() + timedelta(days=365)
+    ids = []
+    for start in range(0, args.users, args.chunk):
+        with transaction.atomic():
+            users = user_model.objects.bulk_create(
+                [user_model(username=f'index-bench-{index}', password='!')
+                 for index in range(start, min(start + args.chunk, args.users))])
+            ReferralCode.objects.bulk_create(
+                [ReferralCode(user_id=user.pk, code=f'IB{user.pk:09d}{number:02d}', expiry_date=expiry,
+                              is_active=number == args.codes - 1)
+                 for user in users for number in range(args.codes)])
+            ids += [user.pk for user in users]
+    referrers = rng.sample(ids, max(1, int(len(ids) * args.referrer_share)))
+    edges = {(referrer, rng.choice(ids)) for referrer in referrers for _ in range(args.referrals)}
+    edges = [edge for edge in edges if edge[0] != edge[1]]
+    for start in range(0, len(edges), args.chunk):
+        Referral.objects.bulk_create([Referral(referrer_id=referrer, referral_id=referral)
+                                      for referrer, referral in edges[start:start + args.chunk]])
+    return referrers
+
+
+def hot_queries(user_id: int) -> dict:
+    from testapi.models import Referral, ReferralCode
+    return {
+        'active_code_get': ReferralCode.objects.filter(user_id=user_id, is_active=True),
+        'active_code_deactivate': ReferralCode.objects.filter(user_id=user_id, is_active=True),
+        'referrals_by_referrer': Referral.objects.filter(referrer_id=user_id).order_by('id'),
+    }
+
+
+def measure(samples: list, repeat: int) -> dict:
+    from django.db import connection, transaction
+
+    plans, timings = {}, {}
+    analyze = {'analyze': True} if connection.vendor == 'postgresql' else {}
+    for name, queryset in hot_queries(samples[0]).items():
+        plans[name] = queryset.explain(**analyze).splitlines()
+    for name in hot_queries(samples[0]):
+        durations = []
+        for _ in range(repeat):
+            for user_id in samples:
+                queryset = hot_queries(user_id)[name]
+                started = time.perf_counter()
+                if name == 'active_code_deactivate':
+                    with transaction.atomic():
+                        queryset.update(is_active=False)
+                        transaction.set_rollback(True)
+                else:
+                    list(queryset)
+                durations.append(time.perf_counter() - started)
+        timings[name] = summarize(durations)
+    return {'plans': plans, 'timings': timings}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_database_argument(parser)
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--codes', type=int, default=5, help='Кодов на пользователя')
+    parser.add_argument('--referrals', type=int, default=50, help='Рефералов на одного реферера')
+    parser.add_argument('--referrer-share', type=float, default=0.1, help='Доля пользователей-рефереров')
+    parser.add_argument('--samples', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--chunk', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    setup_django(args.sqlite, migrate=True)
+    from django.core.management import call_command
+    from django.db import connection
+
+    rng = random.Random(args.seed)
+    referrers = seed(args, rng)
+    samples = rng.sample(referrers, min(args.samples, len(referrers)))
+
+    call_command('migrate', 'testapi', BASELINE_MIGRATION, verbosity=0)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    before = measure(samples, args.repeat)
+    call_command('migrate', 'testapi', INDEXED_MIGRATION, verbosity=0)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    after = measure(samples, args.repeat)
+    call_command('migrate', verbosity=0)
+
+    for label, result in [('before', before), ('after', after)]:
+        print(f'=== {label} ===')
+        for name, plan in result['plans'].items():
+            print(f'-- {name}')
+            print('\n'.join(f'   {line}' for line in plan))
+    print_json({'users': args.users, 'vendor': connection.vendor,
+                'before': before['timings'], 'after': after['timings']})
+
+
+if __name__ == '__main__':
+    main()
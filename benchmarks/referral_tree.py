@@ -0,0 +1,119 @@
+"""
+Бенчмарк выборки дерева рефералов на синтетическом графе.
+
+Создает --users пользователей, каждый из которых (кроме первого) приглашен
+случайным более ранним пользователем, строит таблицу замыкания и сравнивает
+для выборки пользователей с крупными поддеревьями:
+    closure    - один запрос к ReferralClosure по индексу (ancestor, depth);
+    cte        - рекурсивный CTE по таблице Referral;
+    python_bfs - обход по уровням запросами из Python.
+
+Пример:
+    python -m benchmarks.referral_tree --users 2000000 --depth 5
+"""
+import argparse
+import random
+import time
+
+from benchmarks.common import add_database_argument, print_json, setup_django, summarize, timer
+
+
+def seed(users: int, chunk: int, rng: random.Random) -> list:
+    from django.contrib.auth import get_user_model
+    from django.db import transaction
+    from testapi.models import Referral
+
+    user_model = get_user_model()
+    ids = []
+    for start in range(0, users, chunk):
+        with transaction.atomic():
+            created = user_model.objects.bulk_create(
+                [user_model(username=f'tree-bench-{index}', password='!')
+                 for index in range(start, min(start + chunk, users))])
+        ids += [user.pk for user in created]
+    for start in range(1, users, chunk):
+        with transaction.atomic():
+            Referral.objects.bulk_create(
+                [Referral(referrer_id=ids[rng.randrange(index)], referral_id=ids[index])
+                 for index in range(start, min(start + chunk, users))])
+    return ids
+
+
+def closure_counts(user_id: int, depth: int) -> list:
+    from django.db.models import Count
+    from testapi.models import ReferralClosure
+    return list(ReferralClosure.objects.filter(ancestor_id=user_id, depth__lte=depth)
+                .values('depth').annotate(count=Count('id')).order_by('depth'))
+
+
+def cte_counts(user_id: int, depth: int) -> list:
+    from django.db import connection
+    from testapi.models import Referral
+    table = connection.ops.quote_name(Referral._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'WITH RECURSIVE tree(id, depth) AS ('
+            f'SELECT referral_id, 1 FROM {table} WHERE referrer_id = %s '
+            f'UNION ALL SELECT r.referral_id, t.depth + 1 FROM {table} r '
+            f'JOIN tree t ON r.referrer_id = t.id WHERE t.depth < %s) '
+            f'SELECT depth, COUNT(*) FROM tree GROUP BY depth ORDER BY depth', [user_id, depth])
+        return [{'depth': level, 'count': count} for level, count in cursor.fetchall()]
+
+
+def python_bfs_counts(user_id: int, depth: int) -> list:
+    from testapi.models import Referral
+    levels, frontier = [], [user_id]
+    for level in range(1, depth + 1):
+        frontier = list(Referral.objects.filter(referrer_id__in=frontier).values_list('referral_id', flat=True))
+        if not frontier:
+            break
+        levels.append({'depth': level, 'count': len(frontier)})
+    return levels
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_database_argument(parser)
+    parser.add_argument('--users', type=int, default=100000, help='Количество пользователей (ребер на одно меньше)')
+    parser.add_argument('--depth', type=int, default=5, help='Глубина выборки')
+    parser.add_argument('--samples', type=int, default=50, help='Количество проверяемых пользователей')
+    parser.add_argument('--chunk', type=int, default=10000, help='Размер пачки при заполнении')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reuse', action='store_true', help='Не заполнять базу, использовать существующий граф')
+    args = parser.parse_args()
+
+    setup_django(args.sqlite, migrate=True)
+    from django.contrib.auth import get_user_model
+    from testapi.models import ReferralClosure
+
+    rng = random.Random(args.seed)
+    timings = {}
+    if args.reuse:
+        ids = list(get_user_model().objects.filter(username__startswith='tree-bench-')
+                   .order_by('pk').values_list('pk', flat=True))
+    else:
+        with timer(timings, 'seed_s'):
+            ids = seed(args.users, args.chunk, rng)
+        with timer(timings, 'closure_rebuild_s'):
+            paths = ReferralClosure.rebuild()
+        timings['closure_paths'] = paths
+
+    # Ранние пользователи в случайном рекурсивном дереве имеют самые большие поддеревья.
+    samples = ids[:args.samples]
+    results = {}
+    for name, strategy in [('closure', closure_counts), ('cte', cte_counts), ('python_bfs', python_bfs_counts)]:
+        durations = []
+        for user_id in samples:
+            started = time.perf_counter()
+            strategy(user_id, args.depth)
+            durations.append(time.perf_counter() - started)
+        results[name] = summarize(durations)
+
+    mismatches = sum(closure_counts(user_id, args.depth) != cte_counts(user_id, args.depth)
+                     for user_id in samples[:10])
+    print_json({'users': len(ids), 'depth': args.depth, 'setup': timings,
+                'queries': results, 'closure_cte_mismatches': mismatches})
+
+
+if __name__ == '__main__':
+    main()
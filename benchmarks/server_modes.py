@@ -0,0 +1,128 @@
+"""
+Бенчмарк моделей воркеров gunicorn из gunicorn.conf.py на регистрации.
+
+Запускает заглушку hunter.io с задержкой --delay, затем по очереди gunicorn
+с конфигурацией gunicorn.conf.py для каждой модели из --modes:
+    sync    - синхронные воркеры;
+    gthread - воркеры с --threads потоками;
+    asgi    - воркеры uvicorn с ASYNC_VIEWS=True.
+Количество воркеров по умолчанию выбирается конфигурацией по числу процессоров
+(--workers задает его явно). Каждому серверу отправляется --requests регистраций
+с --concurrency одновременными соединениями; все адреса уникальны, поэтому
+каждая регистрация ждет ответа hunter.io. Печатает пропускную способность,
+задержки, коды ответов и память процессов сервера после нагрузки (сумма PSS
+мастера и воркеров, только Linux), в которой видна экономия от предзагрузки
+(--no-preload отключает ее для сравнения).
+
+Одновременных запросов к hunter.io в процессе не больше EH_POOL_SIZE (по умолчанию 10),
+поэтому воркер asgi при задержке --delay выполняет не больше EH_POOL_SIZE / --delay
+регистраций в секунду; --hunter-pool-size меняет этот предел для сравнения моделей.
+
+Пример:
+    python -m benchmarks.server_modes --sqlite /tmp/bench.sqlite3 --requests 500 --concurrency 100
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from benchmarks.asgi_registration import load
+from benchmarks.common import add_database_argument, free_port, print_json, setup_django, wait_ready
+
+
+def process_tree(pid: int) -> list:
+    pids = [pid]
+    try:
+        children = Path(f'/proc/{pid}/task/{pid}/children').read_text().split()
+    except OSError:
+        return pids
+    for child in children:
+        pids.extend(process_tree(int(child)))
+    return pids
+
+
+def memory_mb(pid: int) -> dict | None:
+    """
+    Возвращает суммарные RSS и PSS процесса pid и его потомков в мегабайтах или None,
+    если /proc/<pid>/smaps_rollup недоступен.
+    """
+    totals = {'rss_mb': 0.0, 'pss_mb': 0.0}
+    for process in process_tree(pid):
+        try:
+            lines = Path(f'/proc/{process}/smaps_rollup').read_text().splitlines()
+        except OSError:
+            return None
+        for line in lines:
+            name, _, value = line.partition(':')
+            if name in ('Rss', 'Pss'):
+                totals[f'{name.lower()}_mb'] += int(value.split()[0]) / 1024
+    return totals
+
+
+def run_server(mode: str, args, env: dict) -> dict:
+    from config import get_app_settings
+    from testapi.server import cpu_count, worker_count
+
+    port = free_port()
+    workers = args.workers or worker_count(mode, cpu_count())
+    server_env = dict(env, GUNICORN_WORKER_CLASS=mode, GUNICORN_WORKERS=str(workers),
+                      GUNICORN_THREADS=str(args.threads), GUNICORN_BIND=f'127.0.0.1:{port}',
+                      GUNICORN_PRELOAD=str(not args.no_preload),
+                      ASYNC_VIEWS='True' if mode == 'asgi' else 'False')
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'], env=server_env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base_url = f'http://127.0.0.1:{port}'
+        wait_ready(f'{base_url}/login/', process)
+        result = asyncio.run(load(f'{base_url}/register/', args.requests, args.concurrency))
+        memory = memory_mb(process.pid)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return {'mode': mode, 'workers': workers, 'threads': args.threads if mode == 'gthread' else 1,
+            'preload': not args.no_preload, 'max_requests': get_app_settings().gunicorn_max_requests,
+            **result, 'memory': memory}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_database_argument(parser)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--delay', type=float, default=0.5, help='Задержка ответа заглушки hunter.io, в секундах')
+    parser.add_argument('--modes', nargs='+', choices=['sync', 'gthread', 'asgi'], default=['sync', 'gthread', 'asgi'])
+    parser.add_argument('--workers', type=int, default=0, help='Количество воркеров (по умолчанию по числу CPU)')
+    parser.add_argument('--threads', type=int, default=4, help='Потоков на воркер gthread')
+    parser.add_argument('--no-preload', action='store_true', help='Запускать без предзагрузки приложения')
+    parser.add_argument('--hunter-pool-size', type=int, default=None,
+                        help='EH_POOL_SIZE сервера: предел одновременных запросов к hunter.io на процесс')
+    parser.add_argument('--slow-hasher', action='store_true',
+                        help='Хешировать пароли PBKDF2 из настроек вместо быстрого MD5')
+    args = parser.parse_args()
+
+    setup_django(args.sqlite, migrate=bool(args.sqlite))
+    from config import get_app_settings
+    from testapi.stubs import HunterStubServer
+
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='benchmarks.server_settings', EH_CACHE_SIZE='0')
+    if args.sqlite:
+        env['BENCHMARK_SQLITE'] = os.path.abspath(args.sqlite)
+    if not args.slow_hasher:
+        env['BENCHMARK_FAST_HASHER'] = '1'
+    if args.hunter_pool_size:
+        env['EH_POOL_SIZE'] = str(args.hunter_pool_size)
+    results = []
+    with HunterStubServer(delay=args.delay) as stub:
+        env['EH_API_URL'] = stub.url
+        for mode in args.modes:
+            results.append(run_server(mode, args, env))
+        hunter_requests = len(stub.requests)
+    print_json({'requests': args.requests, 'concurrency': args.concurrency, 'hunter_delay': args.delay,
+                'hunter_pool_size': int(env.get('EH_POOL_SIZE', get_app_settings().eh_pool_size)),
+                'hunter_requests': hunter_requests, 'results': results})
+
+
+if __name__ == '__main__':
+    main()
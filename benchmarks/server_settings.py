@@ -0,0 +1,22 @@
+"""
+Настройки Django для серверов, которые бенчмарки запускают отдельными процессами.
+
+BENCHMARK_SQLITE=PATH переключает сервер на файл SQLite (как --sqlite в скриптах),
+BENCHMARK_FAST_HASHER=1 включает быстрый MD5-хешер, чтобы в измерениях
+доминировало ожидание hunter.io, а не PBKDF2.
+"""
+import os
+
+from testapi.settings import *  # noqa: F401,F403
+
+if os.environ.get('BENCHMARK_SQLITE'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ['BENCHMARK_SQLITE'],
+            'OPTIONS': {'timeout': 30},
+        }
+    }
+
+if os.environ.get('BENCHMARK_FAST_HASHER'):
+    PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
@@ -0,0 +1,135 @@
+"""
+Бенчмарк времени запуска воркера и бюджет импортов.
+
+Запускает --repeat отдельных процессов python -X importtime, каждый из которых
+проходит две фазы:
+    boot          - import testapi.wsgi, как воркер gunicorn при запуске;
+    first_request - загрузка ROOT_URLCONF (представления, DRF), как при первом запросе.
+Печатает медианное время фаз, время импорта по пакетам верхнего уровня (сумма
+собственного времени модулей) и самые долгие модули, импортированные проектом.
+
+С --budget сравнивает результат с бюджетом из JSON-файла и завершается с кодом 1,
+если он превышен:
+    boot_ms, first_request_ms - предельное время фаз;
+    packages                  - предельное время импорта пакетов в фазе boot;
+    forbidden_at_boot         - модули, которые не должны загружаться при запуске.
+
+Первый прогон компилирует байт-код и не учитывается.
+
+Пример:
+    python -m benchmarks.startup --repeat 7 --budget benchmarks/startup_budget.json
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from benchmarks.common import print_json
+
+MARK = 'benchmarks.startup:first_request'
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+CHILD = f'''
+import json, sys, time
+started = time.perf_counter()
+import testapi.wsgi
+boot = time.perf_counter() - started
+boot_modules = sorted(sys.modules)
+sys.stderr.write({MARK!r} + '\\n')
+from django.urls import get_resolver
+get_resolver().url_patterns
+first_request = time.perf_counter() - started - boot
+json.dump({{'boot': boot, 'first_request': first_request, 'boot_modules': boot_modules}}, sys.stdout)
+'''
+
+
+def run_once(env: dict) -> dict:
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD], env=env,
+                            capture_output=True, text=True, check=True)
+    phases = {'boot': [], 'first_request': []}
+    phase = 'boot'
+    for line in result.stderr.splitlines():
+        if line == MARK:
+            phase = 'first_request'
+            continue
+        match = IMPORT_LINE.match(line)
+        if match:
+            phases[phase].append((match[4], int(match[1]), int(match[2]), len(match[3])))
+    timings = json.loads(result.stdout)
+    return {'timings': timings, 'imports': phases}
+
+
+def package_times(imports: list) -> dict:
+    packages = defaultdict(int)
+    for module, self_us, _, _ in imports:
+        packages[module.split('.')[0]] += self_us
+    return packages
+
+
+def summarize_runs(runs: list, top: int) -> dict:
+    report = {}
+    for phase in ('boot', 'first_request'):
+        packages = defaultdict(list)
+        for run in runs:
+            for package, micros in package_times(run['imports'][phase]).items():
+                packages[package].append(micros / 1000)
+        slowest = sorted(((module, cumulative / 1000) for module, _, cumulative, _ in runs[-1]['imports'][phase]
+                          if module.split('.')[0] in ('testapi', 'config', 'swagger_docs')),
+                         key=lambda item: -item[1])[:top]
+        report[phase] = {
+            'ms': statistics.median(run['timings'][phase] for run in runs) * 1000,
+            'packages_ms': dict(sorted(((package, statistics.median(values)) for package, values in packages.items()),
+                                       key=lambda item: -item[1])[:top]),
+            'project_modules_ms': dict(slowest),
+        }
+    return report
+
+
+def check_budget(report: dict, boot_modules: list, budget: dict) -> list:
+    violations = []
+    for phase in ('boot', 'first_request'):
+        limit = budget.get(f'{phase}_ms')
+        if limit is not None and report[phase]['ms'] > limit:
+            violations.append(f"{phase}: {report[phase]['ms']:.0f} ms > {limit} ms")
+    for package, limit in budget.get('packages', {}).items():
+        spent = report['boot']['packages_ms'].get(package, 0.0)
+        if spent > limit:
+            violations.append(f'boot import of {package}: {spent:.0f} ms > {limit} ms')
+    loaded = set(boot_modules)
+    for module in budget.get('forbidden_at_boot', []):
+        if module in loaded:
+            violations.append(f'{module} is imported at boot')
+    return violations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='Количество измеряемых запусков')
+    parser.add_argument('--top', type=int, default=15, help='Сколько пакетов и модулей показывать')
+    parser.add_argument('--budget', metavar='PATH', help='Файл JSON с бюджетом запуска')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'testapi.settings')
+    # Байт-код должен записываться, иначе в каждом запуске измеряется компиляция
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    run_once(env)
+    runs = [run_once(env) for _ in range(args.repeat)]
+    report = {'repeat': args.repeat, **summarize_runs(runs, args.top)}
+    violations = []
+    if args.budget:
+        with open(args.budget) as file:
+            budget = json.load(file)
+        violations = check_budget(report, runs[-1]['timings']['boot_modules'], budget)
+        report['budget'] = {'file': args.budget, 'violations': violations}
+    print_json(report)
+    if violations:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,7 @@
 from functools import lru_cache
+from typing import Literal
 
+from pydantic import Field, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -20,8 +22,143 @@ class AppSettings(BaseSettings):
     email_use_ssl: bool
     email_host_user: str
     email_host_password: str
-    eh_api_key: str    
+    eh_api_key: str
+    eh_cache_size: int = 10000
+    eh_cache_valid_ttl: int = 86400
+    eh_cache_invalid_ttl: int = 3600
+    eh_api_url: str = "https://api.hunter.io/v2/email-verifier"
+    eh_connect_timeout: float = 3.05
+    eh_read_timeout: float = 10.0
+    eh_pool_size: int = 10
+    eh_breaker_failure_threshold: int = 5
+    eh_breaker_reset_timeout: float = 30.0
+    eh_unavailable_policy: Literal['reject', 'allow'] = 'reject'
+    eh_quota_requests: int = 0
+    eh_quota_period: float = 2592000.0
+    eh_quota_wait: float = 0.0
+    registration_async: bool = False
+    registration_workers: int = 4
+    registration_max_attempts: int = 5
+    registration_retry_base_delay: float = 2.0
+    registration_retry_max_delay: float = 300.0
+    registration_lease_timeout: int = 300
+    outbox_batch_size: int = 100
+    outbox_max_attempts: int = 5
+    outbox_retry_base_delay: float = 30.0
+    outbox_retry_max_delay: float = 3600.0
+    outbox_lease_timeout: int = 300
+    referral_page_size: int = 100
+    referral_page_size_max: int = 1000
+    referral_count_ttl: int = 60
+    referral_tree_max_depth: int = 10
+    referral_tree_max_nodes: int = 5000
+    leaderboard_max_limit: int = 100
+    referral_code_cache_size: int = 50000
+    referral_code_cache_ttl: int = 60
+    referral_code_generator: Literal['feistel', 'random'] = 'random'
+    referral_code_length: int = Field(default=20, ge=4, le=20)
+    referral_code_key: str = ''
+    password_hash_workers: int = 0
+    password_hash_offload: bool = False
+    async_views: bool = False
+    bulk_registration_max_size: int = 5000
+    bulk_registration_chunk_size: int = 500
+    db_conn_max_age: int | None = 0
+    db_conn_health_checks: bool = False
+    db_pool: bool = False
+    db_pool_min_size: int = 2
+    db_pool_max_size: int = 10
+    db_pool_max_lifetime: float = 3600.0
+    db_pool_max_idle: float = 600.0
+    db_pool_timeout: float = 30.0
+    db_replica_hosts: str = ''
+    db_replica_max_lag: float = 5.0
+    db_replica_check_interval: float = 1.0
+    db_replica_sticky_seconds: float = 10.0
+    openapi_cache_max_age: int = 86400
+    openapi_base_url: str = ''
+    cache_backend: str = 'django.core.cache.backends.locmem.LocMemCache'
+    cache_location: str = ''
+    response_cache_ttl: int = 300
+    metrics_enabled: bool = True
+    server_timing: bool = True
+    metrics_token: str = ''
+    profiling_enabled: bool = True
+    profiling_sample_rate: float = 0.0
+    profiling_dir: str = ''
+    profiling_max_files: int = 500
+    profiling_token_max_age: int = 3600
+    profiling_list_limit: int = 10
+    gunicorn_bind: str = '0.0.0.0:8000'
+    gunicorn_worker_class: Literal['sync', 'gthread', 'asgi'] = 'sync'
+    gunicorn_workers: int = 0
+    gunicorn_threads: int = 4
+    gunicorn_preload: bool = True
+    gunicorn_max_requests: int = 1000
+    gunicorn_max_requests_jitter: int = 100
+    gunicorn_timeout: int = 30
     model_config = SettingsConfigDict(env_file=".env")
+
+    @model_validator(mode='after')
+    def require_referral_code_key(self) -> 'AppSettings':
+        """
+        The feistel generator needs its own key: codes are unique only while the key
+        stays the same, so it must not depend on SECRET_KEY, which gets rotated.
+        """
+        if self.referral_code_generator == 'feistel' and not self.referral_code_key:
+            raise ValueError('REFERRAL_CODE_KEY is required when REFERRAL_CODE_GENERATOR=feistel '
+                             '(installations that used the SECRET_KEY fallback must set it to that SECRET_KEY)')
+        return self
+
+    def database_settings(self) -> dict:
+        """
+        Returns Django DATABASES['default'] for PostgreSQL.
+
+        With db_pool connections come from a psycopg 3 pool (Django 5.1+, psycopg[pool]),
+        which is incompatible with persistent connections, so CONN_MAX_AGE is 0.
+        Otherwise db_conn_max_age keeps connections open between requests
+        (None - without limit). db_conn_health_checks checks a reused connection
+        before use in both modes.
+        """
+        database = {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': self.postgres_db,
+            'USER': self.postgres_user,
+            'PASSWORD': self.postgres_password,
+            'HOST': self.postgres_host,
+            'PORT': self.postgres_port,
+            'CONN_MAX_AGE': 0 if self.db_pool else self.db_conn_max_age,
+            'CONN_HEALTH_CHECKS': self.db_conn_health_checks,
+        }
+        if self.db_pool:
+            database['OPTIONS'] = {
+                'pool': {
+                    'min_size': self.db_pool_min_size,
+                    'max_size': self.db_pool_max_size,
+                    'max_lifetime': self.db_pool_max_lifetime,
+                    'max_idle': self.db_pool_max_idle,
+                    'timeout': self.db_pool_timeout,
+                },
+            }
+        return database
+
+    def replica_database_settings(self) -> dict:
+        """
+        Returns Django DATABASES entries for read replicas.
+
+        db_replica_hosts is a comma-separated list of host or host:port; replicas use
+        the primary's database name, credentials and connection settings and are
+        named replica_0, replica_1, ...
+        """
+        replicas = {}
+        hosts = [host.strip() for host in self.db_replica_hosts.split(',') if host.strip()]
+        for index, host in enumerate(hosts):
+            database = self.database_settings()
+            database['HOST'], _, port = host.partition(':')
+            database['PORT'] = int(port) if port else self.postgres_port
+            database['TEST'] = {'MIRROR': 'default'}
+            replicas[f'replica_{index}'] = database
+        return replicas
     
 @lru_cache
 def get_app_settings() -> AppSettings:
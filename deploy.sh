@@ -2,4 +2,5 @@
 
 poetry install
 poetry run python manage.py collectstatic --no-input
+poetry run python manage.py generate_openapi_schema
 poetry run python manage.py migrate
\ No newline at end of file
@@ -0,0 +1,21 @@
+"""
+Конфигурация gunicorn (make start-production, make start-asgi, docker-compose).
+
+Модель воркеров, их количество, предзагрузка приложения и перезапуск воркеров
+задаются переменными GUNICORN_* в .env, см. testapi.server.gunicorn_options.
+Параметры командной строки gunicorn имеют приоритет над этим файлом.
+"""
+from config import get_app_settings
+from testapi.server import child_exit, gunicorn_options, pre_fork  # noqa: F401
+
+_options = gunicorn_options(get_app_settings())
+
+wsgi_app = _options['wsgi_app']
+bind = _options['bind']
+worker_class = _options['worker_class']
+workers = _options['workers']
+threads = _options['threads']
+preload_app = _options['preload_app']
+max_requests = _options['max_requests']
+max_requests_jitter = _options['max_requests_jitter']
+timeout = _options['timeout']
@@ -4,12 +4,14 @@ from drf_yasg.views import get_schema_view
 from rest_framework import permissions
 
 
+api_info = openapi.Info(
+   title="API",
+   default_version='v1',
+   description="АПИ для тестового задания",
+)
+
 schema_view = get_schema_view(
-   openapi.Info(
-      title="API",
-      default_version='v1',
-      description="АПИ для тестового задания",
-   ),
+   api_info,
    public=True,
    permission_classes=(permissions.AllowAny, ),
 )
@@ -68,6 +70,18 @@ user_registration_schema = swagger_auto_schema(
                                           ),
             },
         )),
+        202: openapi.Response('Accepted (REGISTRATION_ASYNC=True)', openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'message': openapi.Schema(type=openapi.TYPE_STRING,
+                                          description='Success message',
+                                          example='Registration accepted'),
+                'id': openapi.Schema(type=openapi.TYPE_STRING,
+                                     description='Registration ID'),
+                'status_url': openapi.Schema(type=openapi.TYPE_STRING,
+                                             description='Registration status URL'),
+            },
+        )),
         400: openapi.Response('Bad Request', openapi.Schema(
             type=openapi.TYPE_OBJECT,
             properties={
@@ -87,6 +101,42 @@ user_registration_schema = swagger_auto_schema(
                                                  'Invalid email address']),
             },
         )),
+        503: openapi.Response('Service Unavailable', openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'error': openapi.Schema(type=openapi.TYPE_STRING,
+                                        description=desc_error_msg,
+                                        example='Email verification is temporarily unavailable'),
+            },
+        )),
+    }
+)
+
+registration_status_schema = swagger_auto_schema(
+    operation_description="Статус отложенной регистрации (при REGISTRATION_ASYNC=True регистрация возвращает 202 и ссылку на этот статус)",
+    responses={
+        200: openapi.Response('OK', openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'id': openapi.Schema(type=openapi.TYPE_STRING,
+                                     description='Registration ID',
+                                     example='0b5e7a3c-3f0e-4d43-9a55-2a1b8a0c6f11'),
+                'status': openapi.Schema(type=openapi.TYPE_STRING,
+                                         description='Registration status',
+                                         example=['pending', 'processing', 'active', 'rejected', 'failed']),
+                'error': openapi.Schema(type=openapi.TYPE_STRING,
+                                        description=desc_error_msg,
+                                        example=['', 'Invalid email address', 'Invalid referral code']),
+            },
+        )),
+        404: openapi.Response('Not Found', openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'error': openapi.Schema(type=openapi.TYPE_STRING,
+                                        description=desc_error_msg,
+                                        example='Registration not found'),
+            },
+        )),
     }
 )
 
@@ -184,7 +234,9 @@ referral_code_post_schema = swagger_auto_schema(
             properties={
                 'error': openapi.Schema(type=openapi.TYPE_STRING,
                                         description=desc_error_msg,
-                                        example='Expiry date is required or Expiry date must be in the future'),
+                                        example=['Expiry date is required',
+                                                 'Invalid expiry date',
+                                                 'Expiry date must be in the future']),
             },
         )),
         401: UNAUTH_ERROR
@@ -217,12 +269,126 @@ referral_code_delete_schema = swagger_auto_schema(
 )
 
 referral_code_info_schema = swagger_auto_schema(
-    operation_description="Получнение данных о рефералах для реферера",
+    operation_description="Получнение данных о рефералах для реферера. Список отдается страницами, следующая страница запрашивается по next_cursor",
+    manual_parameters=[
+        openapi.Parameter('cursor', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                          description='Курсор из next_cursor предыдущей страницы'),
+        openapi.Parameter('page_size', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                          description='Размер страницы'),
+        openapi.Parameter('count', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN,
+                          description='Вернуть общее количество рефералов (значение кэшируется)'),
+    ],
+    responses={
+        200: openapi.Response('OK', openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'referrals': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_STRING),
+                                            description='Usernames of the referrals on this page', example=['katana1', 'katana2']),
+                'next_cursor': openapi.Schema(type=openapi.TYPE_STRING, description='Cursor of the next page', example='42'),
+                'count': openapi.Schema(type=openapi.TYPE_INTEGER, description='Total referrals (count=true)', example=2),
+            },
+        )),
+        400: openapi.Response('Bad Request', openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'error': openapi.Schema(type=openapi.TYPE_STRING, description=desc_error_msg, example='Invalid cursor or page size'),
+            },
+        )),
+        401: UNAUTH_ERROR
+    },
+)
+
+referral_tree_schema = swagger_auto_schema(
+    operation_description="Дерево рефералов на несколько уровней вглубь: количество рефералов на каждом уровне (view=counts) или вложенное дерево (view=tree)",
+    manual_parameters=[
+        openapi.Parameter('depth', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                          description='Глубина дерева (по умолчанию 3)'),
+        openapi.Parameter('view', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=['counts', 'tree'],
+                          description='Формат ответа (по умолчанию counts)'),
+    ],
+    responses={
+        200: openapi.Response('OK', openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'levels': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT),
+                                         description='Referrals per level (view=counts)',
+                                         example=[{'depth': 1, 'count': 2}, {'depth': 2, 'count': 5}]),
+                'total': openapi.Schema(type=openapi.TYPE_INTEGER, description='Total referrals (view=counts)', example=7),
+                'tree': openapi.Schema(type=openapi.TYPE_OBJECT, description='Referral tree (view=tree)',
+                                       example={'username': 'katana', 'children': [{'username': 'katana1', 'children': []}]}),
+                'truncated': openapi.Schema(type=openapi.TYPE_BOOLEAN, description='Tree was cut at the node limit (view=tree)', example=False),
+            },
+        )),
+        400: openapi.Response('Bad Request', openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'error': openapi.Schema(type=openapi.TYPE_STRING, description=desc_error_msg,
+                                        example='depth must be between 1 and 10, view must be counts or tree'),
+            },
+        )),
+        401: UNAUTH_ERROR
+    },
+)
+
+leaderboard_schema = swagger_auto_schema(
+    operation_description="Рейтинг пользователей по количеству прямых рефералов",
+    manual_parameters=[
+        openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                          description='Количество мест в рейтинге (по умолчанию 10)'),
+    ],
+    responses={
+        200: openapi.Response('OK', openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'leaderboard': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT),
+                                              description='Top referrers',
+                                              example=[{'username': 'katana', 'direct_referrals': 12,
+                                                        'signups': 14, 'codes_issued': 3}]),
+            },
+        )),
+        400: openapi.Response('Bad Request', openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'error': openapi.Schema(type=openapi.TYPE_STRING, description=desc_error_msg,
+                                        example='limit must be between 1 and 100'),
+            },
+        )),
+        401: UNAUTH_ERROR
+    },
+)
+
+
+bulk_registration_schema = swagger_auto_schema(
+    operation_description="Пакетная регистрация пользователей (только для администраторов)",
+    request_body=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        properties={
+            'users': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT),
+                                    description='Users (username, password, email, referral_code)',
+                                    example=[{'username': 'KatanaNevermore', 'password': 'NevermorePassword',
+                                              'email': 'example@gmail.com',
+                                              'referral_code': 'WETWG9RHJLZAIOAJOUN4'}]),
+        },
+    ),
     responses={
         200: openapi.Response('OK', openapi.Schema(
             type=openapi.TYPE_OBJECT,
             properties={
-                'referrals': openapi.Schema(type=openapi.TYPE_OBJECT, description='Deleted referral code', example=['katana1', 'katana2'])
+                'created': openapi.Schema(type=openapi.TYPE_INTEGER, description='Created users'),
+                'failed': openapi.Schema(type=openapi.TYPE_INTEGER, description='Rejected rows'),
+                'results': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT),
+                                          description='Per-row results',
+                                          example=[{'index': 0, 'username': 'KatanaNevermore',
+                                                    'status': 'created', 'id': 42},
+                                                   {'index': 1, 'username': 'katana', 'status': 'failed',
+                                                    'errors': {'email': ['Invalid email address']}}]),
+            },
+        )),
+        400: openapi.Response('Bad Request', openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'error': openapi.Schema(type=openapi.TYPE_STRING, description=desc_error_msg,
+                                        example=['users must be a list', 'Too many users: maximum is 5000']),
             },
         )),
         401: UNAUTH_ERROR
@@ -2,6 +2,8 @@
 ASGI config for testapi project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Run it with ``make start-asgi`` (gunicorn with uvicorn workers) together with ASYNC_VIEWS=True so that
+registration, login, ref-code and ref-info are served by testapi.async_views.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
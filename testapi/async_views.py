@@ -0,0 +1,365 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import aauthenticate, get_user_model
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.http import HttpRequest, JsonResponse
+from django.urls import reverse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from config import get_app_settings
+from testapi.hashing import ahash_password
+from testapi.models import PendingRegistration, Referral, ReferralCode
+from testapi.outbox import aenqueue_mail
+from testapi.referral_cache import aresolve_referrer_id, invalidate_referral_codes
+from testapi.serializers import ReferralCodeSerializer, UserSerializer
+from testapi.verification import averify_email, verify_email
+from testapi.verifier_client import VerifierUnavailable
+from testapi.versioning import (aget_version, bump_versions, etag_matches, is_recent, make_etag, not_modified,
+                                response_key, set_validators)
+from testapi.views import parse_expiry_date
+
+
+SETTINGS = get_app_settings()
+USER_MODEL = get_user_model()
+
+
+class ParseError(ValueError):
+    pass
+
+
+def _request_data(request: HttpRequest) -> dict:
+    """
+    Возвращает тело запроса JSON или формы, как request.data в DRF.
+    """
+    if request.content_type == 'application/json':
+        if not request.body:
+            return {}
+        try:
+            data = json.loads(request.body)
+        except ValueError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+        if not isinstance(data, dict):
+            raise ParseError('JSON body must be an object')
+        return data
+    return request.POST.dict()
+
+
+async def _authenticate(request: HttpRequest):
+    """
+    Аутентифицирует запрос по JWT, как IsAuthenticated с JWTAuthentication в DRF.
+
+    Возвращает:
+        Пользователя или JsonResponse со статусом 401.
+    """
+    authenticator = JWTAuthentication()
+    try:
+        result = await sync_to_async(authenticator.authenticate)(request)
+        if result is None:
+            raise NotAuthenticated()
+    except APIException as exc:
+        detail = exc.detail if isinstance(exc.detail, dict) else {"detail": exc.detail}
+        return JsonResponse(detail, status=status.HTTP_401_UNAUTHORIZED,
+                            headers={'WWW-Authenticate': authenticator.authenticate_header(request)})
+    return result[0]
+
+
+def _verify_email_in_thread(email: str) -> bool:
+    try:
+        return verify_email(email)
+    finally:
+        # Поток может не дожить до следующего запроса, поэтому соединение квоты с БД закрывается сразу
+        connections.close_all()
+
+
+async def _verify_email(request: HttpRequest, email: str) -> bool:
+    """
+    Проверяет адрес асинхронным клиентом hunter.io под ASGI с ASYNC_VIEWS=True, иначе - verify_email в потоке.
+
+    Асинхронный клиент и объединение одновременных проверок хранятся отдельно для каждого цикла
+    событий. Под WSGI (PASSWORD_HASH_OFFLOAD=True) Django выполняет представление в новом цикле
+    на каждый запрос, поэтому там используется синхронный verify_email с общими для процесса
+    пулом соединений и объединением проверок.
+    """
+    if SETTINGS.async_views and isinstance(request, ASGIRequest):
+        return await averify_email(email)
+    return await sync_to_async(_verify_email_in_thread, thread_sensitive=False)(email)
+
+
+@transaction.atomic
+def _create_user(data: dict, password: str, referrer: int | None = None, **extra):
+    """
+    Создает пользователя с уже вычисленным хешем пароля (аналог create_user без хеширования).
+    """
+    user = USER_MODEL(username=USER_MODEL.normalize_username(data['username']),
+                      email=USER_MODEL.objects.normalize_email(data['email']),
+                      password=password,
+                      **extra)
+    user.save()
+    if referrer:
+        Referral.objects.create(referrer_id=referrer, referral=user)
+    return user
+
+
+@transaction.atomic
+def _create_pending(data: dict, password: str, referral_code: str) -> PendingRegistration:
+    user = _create_user(data, password, is_active=False)
+    return PendingRegistration.objects.create(user=user, email=user.email, referral_code=referral_code)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncUserRegistrationView(View):
+    """
+    Асинхронное представление регистрации пользователя (ASYNC_VIEWS=True или PASSWORD_HASH_OFFLOAD=True).
+
+    Повторяет контракт UserRegistrationView, но пароль хеширует вне цикла событий (testapi.hashing),
+    а под ASGI с ASYNC_VIEWS=True проверяет адрес асинхронным клиентом hunter.io (averify_email),
+    поэтому один процесс обслуживает много регистраций, ожидающих ответа hunter.io.
+    """
+
+    async def post(self, request: HttpRequest) -> JsonResponse:
+        """
+        Обрабатывает POST-запросы для регистрации пользователя.
+
+        Аргументы:
+            request: Объект запроса.
+
+        Возвращает:
+            Объект JsonResponse с теми же статусами и сообщениями, что и UserRegistrationView.post.
+        """
+
+        try:
+            data = _request_data(request)
+        except ParseError as exc:
+            return JsonResponse({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = UserSerializer(data=data)
+        if not await sync_to_async(serializer.is_valid)():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        validated_data = serializer.validated_data
+        if SETTINGS.registration_async:
+            return await self.accept_pending(request, validated_data, data.get("referral_code") or '')
+
+        try:
+            is_valid = await _verify_email(request, validated_data["email"])
+        except VerifierUnavailable:
+            if SETTINGS.eh_unavailable_policy != 'allow':
+                return JsonResponse({"error": "Email verification is temporarily unavailable"},
+                                    status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            is_valid = True
+        if not is_valid:
+            return JsonResponse({"error": "Invalid email address"},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+        referral_code = data.get("referral_code")
+        referrer = None
+        if referral_code:
+            referrer = await aresolve_referrer_id(referral_code)
+            if referrer is None:
+                return JsonResponse({"error": "Invalid referral code"},
+                                    status=status.HTTP_400_BAD_REQUEST)
+
+        password = await ahash_password(validated_data["password"])
+        await sync_to_async(_create_user)(validated_data, password, referrer)
+        if referrer:
+            return JsonResponse({'message': 'Successfully created a new user with referral code'},
+                                status=status.HTTP_201_CREATED)
+        return JsonResponse({'message': 'Successfully created a new user without referral code'},
+                            status=status.HTTP_201_CREATED)
+
+    async def accept_pending(self, request: HttpRequest, validated_data: dict, referral_code: str) -> JsonResponse:
+        """
+        Принимает регистрацию без ожидания проверки адреса (см. UserRegistrationView.accept_pending).
+        """
+
+        password = await ahash_password(validated_data["password"])
+        registration = await sync_to_async(_create_pending)(validated_data, password, referral_code)
+        status_url = request.build_absolute_uri(reverse('registration-status', args=[registration.id]))
+        response = JsonResponse({'message': 'Registration accepted',
+                                 'id': str(registration.id),
+                                 'status_url': status_url},
+                                status=status.HTTP_202_ACCEPTED)
+        response['Location'] = status_url
+        return response
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncUserLoginView(View):
+    """
+    Асинхронное представление входа пользователя (ASYNC_VIEWS=True или PASSWORD_HASH_OFFLOAD=True).
+
+    Пользователь проверяется aauthenticate по AUTHENTICATION_BACKENDS, как authenticate
+    в UserLoginView; OffloadedHashingBackend проверяет пароль вне цикла событий
+    (testapi.hashing), поэтому вычисление PBKDF2 не блокирует обработку других запросов.
+    """
+
+    async def post(self, request: HttpRequest) -> JsonResponse:
+        """
+        Обрабатывает POST-запросы для входа пользователя.
+
+        Аргументы:
+            request: Объект запроса.
+
+        Возвращает:
+            Объект JsonResponse. Если аутентификация прошла успешно, возвращает статус 200 и токены обновления и доступа.
+            Если аутентификация не прошла успешно, возвращает статус 400 и сообщение об ошибке.
+        """
+
+        try:
+            data = _request_data(request)
+        except ParseError as exc:
+            return JsonResponse({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        user = await aauthenticate(request, username=data.get("username", ""), password=data.get("password", ""))
+        if user:
+            refresh = RefreshToken.for_user(user)
+            return JsonResponse({
+                'refresh': str(refresh),
+                'access': str(refresh.access_token),
+            }, status=status.HTTP_200_OK)
+        return JsonResponse({'error': 'Invalid Username/Password'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncReferralCodeView(View):
+    """
+    Асинхронное представление для работы с реферальными кодами (ASYNC_VIEWS=True).
+
+    Повторяет контракт ReferralCodeView. Смена кода выполняется в потоке, так как
+    ReferralCode.rotate блокирует строку пользователя в транзакции.
+    """
+
+    async def get(self, request: HttpRequest) -> JsonResponse:
+        """
+        Ставит письмо с активным и не истекшим кодом пользователя в исходящую очередь.
+
+        Возвращает:
+            Объект JsonResponse со статусом 200 или 404, как ReferralCodeView.get.
+        """
+
+        user = await _authenticate(request)
+        if isinstance(user, JsonResponse):
+            return user
+        referral_code = await ReferralCode.objects.active().filter(user=user).afirst()
+        if referral_code is None:
+            return JsonResponse({"message": "No active code found for this user"},
+                                status=status.HTTP_404_NOT_FOUND)
+        await aenqueue_mail(
+            'Your referral code',
+            f'Your referral code is {referral_code.code}',
+            SETTINGS.email_host_user,
+            [user.email],
+        )
+        return JsonResponse({"message": "Referral code has been sent to the email"},
+                            status=status.HTTP_200_OK)
+
+    async def post(self, request: HttpRequest) -> JsonResponse:
+        """
+        Заменяет активный код пользователя новым (ReferralCode.rotate).
+
+        Возвращает:
+            Объект JsonResponse со статусом 201 и данными кода или 400, как ReferralCodeView.post.
+        """
+
+        user = await _authenticate(request)
+        if isinstance(user, JsonResponse):
+            return user
+        try:
+            expiry_date = parse_expiry_date(_request_data(request).get("expiry_date"))
+        except ValueError as exc:
+            return JsonResponse({"error": str(exc)},
+                                status=status.HTTP_400_BAD_REQUEST)
+        referral_code, previous_codes = await sync_to_async(ReferralCode.rotate)(user, expiry_date)
+        invalidate_referral_codes(*previous_codes)
+        return JsonResponse(ReferralCodeSerializer(referral_code).data,
+                            status=status.HTTP_201_CREATED)
+
+    async def delete(self, request: HttpRequest) -> JsonResponse:
+        """
+        Делает активный код пользователя неактивным.
+
+        Возвращает:
+            Объект JsonResponse со статусом 204 или 404, как ReferralCodeView.delete.
+        """
+
+        user = await _authenticate(request)
+        if isinstance(user, JsonResponse):
+            return user
+        referral_code = await ReferralCode.objects.filter(user=user, is_active=True).afirst()
+        if referral_code is None:
+            return JsonResponse({"message": "No active code found"},
+                                status=status.HTTP_404_NOT_FOUND)
+        await ReferralCode.objects.filter(user=user, is_active=True).aupdate(is_active=False)
+        invalidate_referral_codes(referral_code.code)
+        await sync_to_async(bump_versions)(user.id)
+        return JsonResponse({"message": "Code successfully delete",
+                             "code": ReferralCodeSerializer(referral_code).data},
+                            status=status.HTTP_204_NO_CONTENT)
+
+
+class AsyncReferralInfoView(View):
+    """
+    Асинхронное представление списка рефералов пользователя (ASYNC_VIEWS=True).
+
+    Повторяет контракт ReferralInfoView: keyset-пагинация по cursor и page_size,
+    количество рефералов при count=true кэшируется на referral_count_ttl секунд,
+    ETag и кэш страниц строятся по версии реферальных данных пользователя.
+    """
+
+    async def get(self, request: HttpRequest) -> JsonResponse:
+        """
+        Возвращает страницу имен пользователей рефералов.
+
+        Возвращает:
+            Объект JsonResponse со статусом 200 или 400, как ReferralInfoView.get.
+        """
+
+        user = await _authenticate(request)
+        if isinstance(user, JsonResponse):
+            return user
+        try:
+            cursor = int(request.GET.get("cursor", 0))
+            page_size = int(request.GET.get("page_size", SETTINGS.referral_page_size))
+        except ValueError:
+            return JsonResponse({"error": "Invalid cursor or page size"},
+                                status=status.HTTP_400_BAD_REQUEST)
+        if cursor < 0 or page_size < 1:
+            return JsonResponse({"error": "Invalid cursor or page size"},
+                                status=status.HTTP_400_BAD_REQUEST)
+        page_size = min(page_size, SETTINGS.referral_page_size_max)
+        with_count = request.GET.get("count") in ("1", "true")
+
+        version = await aget_version(user.id)
+        etag = make_etag(user.id, version, cursor, page_size, with_count)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        key = response_key('ref-info', user.id, version, cursor, page_size, with_count)
+        data = await cache.aget(key)
+        if data is None:
+            referrals = Referral.objects.db_manager(DEFAULT_DB_ALIAS if is_recent(version) else None)
+            rows = [row async for row in
+                    referrals
+                    .filter(referrer=user, id__gt=cursor)
+                    .order_by('id')
+                    .values_list('id', 'referral__username')[:page_size + 1]]
+            page = rows[:page_size]
+            data = {
+                "referrals": [username for _, username in page],
+                "next_cursor": str(page[-1][0]) if len(rows) > page_size else None,
+            }
+            if with_count:
+                count_key = f"referral_count:{user.id}"
+                count = await cache.aget(count_key)
+                if count is None:
+                    count = await referrals.filter(referrer=user).acount()
+                    await cache.aset(count_key, count, SETTINGS.referral_count_ttl)
+                data["count"] = count
+            await cache.aset(key, data, SETTINGS.response_cache_ttl)
+        return set_validators(JsonResponse(data, status=status.HTTP_200_OK), etag)
@@ -0,0 +1,37 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+from testapi.hashing import acheck_password, ahash_password
+
+
+USER_MODEL = get_user_model()
+
+
+class OffloadedHashingBackend(ModelBackend):
+    """
+    ModelBackend, асинхронная аутентификация которого хеширует и проверяет пароль
+    вне цикла событий (testapi.hashing).
+
+    Синхронный authenticate не меняется. aauthenticate повторяет ModelBackend.authenticate:
+    для несуществующего пользователя хеширует пароль впустую, чтобы время ответа не выдавало
+    наличие учетной записи, проверяет user_can_authenticate и перехеширует пароль, если
+    параметры хешера изменились.
+    """
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(USER_MODEL.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = await USER_MODEL._default_manager.aget_by_natural_key(username)
+        except USER_MODEL.DoesNotExist:
+            await ahash_password(password)
+            return None
+        is_valid, must_update = await acheck_password(password, user.password)
+        if not is_valid:
+            return None
+        if must_update:
+            user.password = await ahash_password(password)
+            await user.asave(update_fields=['password'])
+        return user if self.user_can_authenticate(user) else None
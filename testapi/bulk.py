@@ -0,0 +1,210 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection, connections, transaction
+
+from config import get_app_settings
+from testapi.hashing import hash_passwords
+from testapi.models import Referral, ReferralClosure, ReferralStats
+from testapi.versioning import bump_versions
+from testapi.referral_cache import resolve_referrer_id
+from testapi.serializers import BulkUserSerializer
+from testapi.verification import verify_email
+from testapi.verifier_client import VerifierUnavailable
+
+
+SETTINGS = get_app_settings()
+USER_MODEL = get_user_model()
+
+CREATED = 'created'
+FAILED = 'failed'
+
+
+def _chunks(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _check_email(email: str):
+    try:
+        return verify_email(email)
+    except VerifierUnavailable:
+        return True if SETTINGS.eh_unavailable_policy == 'allow' else None
+
+
+def _check_emails(emails: list) -> list:
+    try:
+        return [_check_email(email) for email in emails]
+    finally:
+        # Потоки пула завершаются вместе с ним, поэтому их соединения с БД (квота hunter.io) закрываются здесь
+        connections.close_all()
+
+
+def verify_emails(emails: list) -> dict:
+    """
+    Проверяет адреса параллельно, не больше eh_pool_size одновременных запросов.
+
+    Каждый поток пула проверяет свою часть адресов, а затем закрывает свои соединения с БД.
+
+    Возвращает:
+        Словарь {адрес: True, False или None, если hunter.io недоступен и EH_UNAVAILABLE_POLICY=reject}.
+    """
+    unique = list(dict.fromkeys(emails))
+    if not unique:
+        return {}
+    workers = min(SETTINGS.eh_pool_size, len(unique))
+    parts = [unique[index::workers] for index in range(workers)]
+    statuses = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bulk-verifier') as pool:
+        for part, results in zip(parts, pool.map(_check_emails, parts)):
+            statuses.update(zip(part, results))
+    return statuses
+
+
+def _existing_usernames(usernames: list, chunk_size: int) -> set:
+    existing = set()
+    for chunk in _chunks(usernames, chunk_size):
+        existing.update(USER_MODEL.objects.filter(username__in=chunk).values_list('username', flat=True))
+    return existing
+
+
+def _create_chunk(rows: list) -> list:
+    """
+    Создает пользователей и рефералы одной пачки в одной транзакции.
+
+    Аргументы:
+        rows: Список словарей с ключами username, email, password (хеш) и referrer.
+
+    Возвращает:
+        Список созданных пользователей в порядке rows.
+    """
+    with transaction.atomic():
+        users = USER_MODEL.objects.bulk_create(
+            [USER_MODEL(username=row['username'], email=row['email'], password=row['password']) for row in rows])
+        if not connection.features.can_return_rows_from_bulk_insert:
+            ids = dict(USER_MODEL.objects.filter(username__in=[user.username for user in users])
+                       .values_list('username', 'id'))
+            for user in users:
+                user.pk = ids[user.username]
+        edges = [(row['referrer'], user.pk) for row, user in zip(rows, users) if row['referrer']]
+        if edges:
+            Referral.objects.bulk_create([Referral(referrer_id=referrer, referral_id=referral)
+                                          for referrer, referral in edges])
+            ReferralClosure.add_leaf_edges(edges)
+            referrers = Counter(referrer for referrer, _ in edges)
+            for referrer, count in referrers.items():
+                ReferralStats.increment(referrer, direct_referrals=count, signups=count)
+            # bulk_create не отправляет post_save, поэтому версии рефереров меняются явно
+            bump_versions(*referrers)
+    return users
+
+
+def _create_rows(chunk: list, chunk_size: int) -> list:
+    """
+    Создает строки пачки и возвращает пары (результат, пользователь) для созданных.
+
+    Если пачка не вставилась из-за конфликта (username заняли после проверки), строки
+    с занятыми username отклоняются и пачка вставляется повторно; если не удается и это,
+    строки вставляются по одной, и каждая неудача отмечается в результате своей строки.
+    Предыдущие пачки к этому времени уже зафиксированы, поэтому исключение наружу не выходит.
+    """
+    try:
+        return list(zip(chunk, _create_chunk([row for _, row in chunk])))
+    except IntegrityError:
+        pass
+    taken = _existing_usernames([row['username'] for _, row in chunk], chunk_size)
+    for result, row in chunk:
+        if row['username'] in taken:
+            result['errors'] = {'username': ['A user with that username already exists.']}
+    chunk = [(result, row) for result, row in chunk if row['username'] not in taken]
+    try:
+        return list(zip(chunk, _create_chunk([row for _, row in chunk]))) if chunk else []
+    except IntegrityError:
+        pass
+    created = []
+    for result, row in chunk:
+        try:
+            user, = _create_chunk([row])
+        except IntegrityError:
+            result['errors'] = {'non_field_errors': ['User could not be created']}
+        else:
+            created.append(((result, row), user))
+    return created
+
+
+def bulk_register(rows: list, chunk_size: int | None = None) -> list:
+    """
+    Регистрирует пачку пользователей.
+
+    Строки проверяются сериализатором, username и email нормализуются, как в create_user,
+    занятые username ищутся одним запросом на пачку,
+    реферальные коды разрешаются через кэш, адреса проверяются в hunter.io параллельно,
+    пароли хешируются в пуле процессов (testapi.hashing), а пользователи и рефералы
+    вставляются bulk_create пачками по chunk_size строк, каждая в своей транзакции.
+    Таблица замыкания и счетчики ReferralStats обновляются для всей пачки сразу.
+
+    Аргументы:
+        rows: Список словарей с полями username, password, email и необязательным referral_code.
+        chunk_size: Количество строк в одной вставке; по умолчанию bulk_registration_chunk_size.
+
+    Возвращает:
+        Список результатов в порядке rows: {'index', 'username', 'status'} и 'errors' для
+        отклоненных строк или 'id' для созданных.
+    """
+    chunk_size = chunk_size or SETTINGS.bulk_registration_chunk_size
+    results = []
+    accepted = []
+    usernames = set()
+    for index, row in enumerate(rows):
+        result = {'index': index, 'username': row.get('username') if isinstance(row, dict) else None,
+                  'status': FAILED}
+        results.append(result)
+        serializer = BulkUserSerializer(data=row)
+        if not serializer.is_valid():
+            result['errors'] = serializer.errors
+            continue
+        # Как create_user: иначе username, совпадающие после NFKC, прошли бы проверку дубликатов
+        data = {**serializer.validated_data,
+                'username': USER_MODEL.normalize_username(serializer.validated_data['username']),
+                'email': USER_MODEL.objects.normalize_email(serializer.validated_data['email'])}
+        if data['username'] in usernames:
+            result['errors'] = {'username': ['Duplicate username in batch']}
+            continue
+        usernames.add(data['username'])
+        accepted.append((result, data))
+
+    existing = _existing_usernames(list(usernames), chunk_size)
+    referrers = {code: resolve_referrer_id(code)
+                 for code in {data.get('referral_code') for _, data in accepted} if code}
+    candidates = []
+    for result, data in accepted:
+        if data['username'] in existing:
+            result['errors'] = {'username': ['A user with that username already exists.']}
+        elif data.get('referral_code') and referrers[data['referral_code']] is None:
+            result['errors'] = {'referral_code': ['Invalid referral code']}
+        else:
+            candidates.append((result, data))
+
+    statuses = verify_emails([data['email'] for _, data in candidates])
+    verified = []
+    for result, data in candidates:
+        is_valid = statuses[data['email']]
+        if is_valid is None:
+            result['errors'] = {'email': ['Email verification is temporarily unavailable']}
+        elif not is_valid:
+            result['errors'] = {'email': ['Invalid email address']}
+        else:
+            verified.append((result, data))
+
+    hashes = hash_passwords([data['password'] for _, data in verified])
+    pending = [(result, {'username': data['username'],
+                         'email': data['email'],
+                         'password': password,
+                         'referrer': referrers.get(data.get('referral_code'))})
+               for (result, data), password in zip(verified, hashes)]
+    for chunk in _chunks(pending, chunk_size):
+        for (result, _), user in _create_rows(chunk, chunk_size):
+            result['status'] = CREATED
+            result['id'] = user.pk
+    return results
@@ -0,0 +1,60 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные вызовы с одинаковым ключом в один.
+
+    Первый вызов для ключа выполняет функцию, остальные, пришедшие до его
+    завершения, ждут и получают тот же результат или то же исключение.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class AsyncSingleFlight:
+    """
+    Асинхронный вариант SingleFlight.
+
+    Одновременные корутины с одинаковым ключом в одном цикле событий ждут одну
+    задачу. Отмена ожидающей корутины не отменяет задачу для остальных.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        call_key = (loop, key)
+        task = self._calls.get(call_key)
+        if task is None:
+            task = self._calls[call_key] = loop.create_task(fn())
+            task.add_done_callback(lambda _: self._calls.pop(call_key, None))
+        return await asyncio.shield(task)
+
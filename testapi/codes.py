@@ -0,0 +1,202 @@
+import hashlib
+import random
+import string
+import threading
+from functools import lru_cache
+
+from django.db import connection, transaction
+
+from config import get_app_settings
+
+
+SETTINGS = get_app_settings()
+
+# Crockford Base32: без I, L, O, U, чтобы код было проще читать и диктовать.
+HUMAN_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+
+class CodeSpaceExhausted(Exception):
+    """
+    Номер из последовательности вышел за пределы 32 ** length: все коды этой длины выданы.
+    """
+
+
+class RandomCodeGenerator:
+    """
+    Случайные коды, уникальность которых обеспечивает только ограничение unique в БД.
+    """
+
+    def __init__(self, length: int = 20, alphabet: str = string.ascii_uppercase + string.digits) -> None:
+        self.length = length
+        self.alphabet = alphabet
+
+    def generate(self) -> str:
+        return ''.join(random.choices(self.alphabet, k=self.length))
+
+
+class FeistelPermutation:
+    """
+    Ключевая перестановка чисел из диапазона [0, 2 ** bits).
+
+    Сбалансированная сеть Фейстеля над 2 * half битами с раундовой функцией
+    BLAKE2b(key) является биекцией; при нечетном bits лишний бит отсекается
+    обходом цикла (cycle walking), что тоже сохраняет биективность.
+    """
+
+    def __init__(self, key: bytes, bits: int, rounds: int = 4) -> None:
+        self.bits = bits
+        self.half = (bits + 1) // 2
+        self.mask = (1 << self.half) - 1
+        self.limit = 1 << bits
+        self.rounds = rounds
+        self._hashes = [hashlib.blake2b(key=key, digest_size=8, person=b'round%d' % index)
+                        for index in range(rounds)]
+
+    def _round(self, index: int, value: int) -> int:
+        digest = self._hashes[index].copy()
+        digest.update(value.to_bytes(8, 'little'))
+        return int.from_bytes(digest.digest(), 'little') & self.mask
+
+    def _encrypt(self, value: int) -> int:
+        left, right = value >> self.half, value & self.mask
+        for index in range(self.rounds):
+            left, right = right, left ^ self._round(index, right)
+        return (left << self.half) | right
+
+    def _decrypt(self, value: int) -> int:
+        left, right = value >> self.half, value & self.mask
+        for index in reversed(range(self.rounds)):
+            left, right = right ^ self._round(index, left), left
+        return (left << self.half) | right
+
+    def permute(self, value: int) -> int:
+        # Обход цикла завершается только для значений из [0, limit)
+        if not 0 <= value < self.limit:
+            raise ValueError(f'{value} is outside [0, 2 ** {self.bits})')
+        value = self._encrypt(value)
+        while value >= self.limit:
+            value = self._encrypt(value)
+        return value
+
+    def invert(self, value: int) -> int:
+        value = self._decrypt(value)
+        while value >= self.limit:
+            value = self._decrypt(value)
+        return value
+
+
+class SequenceAllocator:
+    """
+    Потокобезопасная выдача номеров для генератора кодов.
+
+    Номера выдаются блоками по block_size (не больше BLOCK_SIZE): номер блока берется из
+    последовательности PostgreSQL (nextval не откатывается вместе с
+    транзакцией, поэтому блок никогда не выдается дважды), так что обращение
+    к БД нужно один раз на block_size кодов. На других СУБД номер блока
+    хранится в таблице CodeSequence; там блок, выданный в откаченной
+    транзакции, может быть выдан повторно, и от дубликатов защищает только
+    ограничение unique.
+
+    Неиспользованный остаток блока теряется при завершении процесса (в том числе
+    при перезапуске воркера после max_requests), поэтому для небольшого
+    пространства кодов блок уменьшается, см. block_size_for.
+    """
+
+    BLOCK_SIZE = 1000
+    # Пространство кодов вмещает не меньше стольких блоков
+    MIN_BLOCKS = 1 << 20
+    PG_SEQUENCE = 'testapi_referral_code_block_seq'
+
+    def __init__(self, name: str, block_size: int | None = None) -> None:
+        self.name = name
+        self.block_size = block_size or self.BLOCK_SIZE
+        self._next = self._end = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def block_size_for(cls, limit: int) -> int:
+        """
+        Возвращает размер блока для пространства из limit номеров: BLOCK_SIZE, но так,
+        чтобы в пространстве помещалось не меньше MIN_BLOCKS блоков.
+
+        Размер зависит только от длины кода, поэтому номера блоков, выданных
+        раньше, соответствуют тем же номерам кодов.
+        """
+        return max(1, min(cls.BLOCK_SIZE, limit // cls.MIN_BLOCKS))
+
+    def _next_block(self) -> int:
+        from testapi.models import CodeSequence
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT nextval(%s)', [self.PG_SEQUENCE])
+                return cursor.fetchone()[0]
+        with transaction.atomic():
+            sequence, _ = CodeSequence.objects.select_for_update().get_or_create(name=self.name)
+            block = sequence.next_value
+            sequence.next_value = block + 1
+            sequence.save(update_fields=['next_value'])
+        return block
+
+    def next(self) -> int:
+        with self._lock:
+            if self._next >= self._end:
+                self._next = self._next_block() * self.block_size
+                self._end = self._next + self.block_size
+            value = self._next
+            self._next += 1
+            return value
+
+
+class FeistelCodeGenerator:
+    """
+    Коды, уникальные по построению: номер из последовательности переставляется
+    ключевой перестановкой и записывается в алфавите длиной 32 символа.
+
+    Перестановка - биекция на [0, 32 ** length), поэтому разные номера всегда
+    дают разные коды, а соседние номера дают непохожие коды. Номер за пределами
+    этого диапазона вызывает CodeSpaceExhausted.
+    """
+
+    def __init__(self, key: bytes, length: int, sequence: SequenceAllocator | None = None,
+                 alphabet: str = HUMAN_ALPHABET) -> None:
+        if len(alphabet) != 32:
+            raise ValueError('Alphabet must contain exactly 32 characters')
+        self.length = length
+        self.alphabet = alphabet
+        self.permutation = FeistelPermutation(key, bits=5 * length)
+        self.sequence = sequence
+
+    def encode(self, number: int) -> str:
+        if number >= self.permutation.limit:
+            raise CodeSpaceExhausted(f'All {self.permutation.limit} referral codes of length {self.length} '
+                                     f'are issued; increase REFERRAL_CODE_LENGTH')
+        value = self.permutation.permute(number)
+        chars = []
+        for _ in range(self.length):
+            value, index = divmod(value, 32)
+            chars.append(self.alphabet[index])
+        return ''.join(reversed(chars))
+
+    def decode(self, code: str) -> int:
+        value = 0
+        for char in code:
+            value = value * 32 + self.alphabet.index(char)
+        return self.permutation.invert(value)
+
+    def generate(self) -> str:
+        return self.encode(self.sequence.next())
+
+
+@lru_cache
+def get_code_generator():
+    """
+    Возвращает генератор реферальных кодов, выбранный настройкой referral_code_generator.
+    """
+    if SETTINGS.referral_code_generator == 'random':
+        return RandomCodeGenerator()
+    block_size = SequenceAllocator.block_size_for(32 ** SETTINGS.referral_code_length)
+    return FeistelCodeGenerator(
+        key=hashlib.blake2b(SETTINGS.referral_code_key.encode(), digest_size=32).digest(),
+        length=SETTINGS.referral_code_length,
+        sequence=SequenceAllocator('referral_code', block_size),
+    )
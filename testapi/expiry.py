@@ -0,0 +1,54 @@
+import time
+
+from django.db import transaction
+from django.utils import timezone
+
+from testapi.models import ReferralCode
+from testapi.referral_cache import invalidate_referral_codes
+
+
+def deactivate_expired_batch(batch_size: int) -> int:
+    """
+    Деактивирует не больше batch_size истекших кодов одной короткой транзакцией.
+
+    Коды выбираются по частичному индексу referral_code_active_expiry, поэтому
+    блокируются только обновляемые строки.
+
+    Возвращает:
+        Количество деактивированных кодов.
+    """
+    with transaction.atomic():
+        rows = list(ReferralCode.objects.expired().order_by('expiry_date')
+                    .values_list('id', 'code')[:batch_size])
+        if not rows:
+            return 0
+        updated = ReferralCode.objects.filter(id__in=[row[0] for row in rows], is_active=True).update(is_active=False)
+    invalidate_referral_codes(*(row[1] for row in rows))
+    return updated
+
+
+def sweep_expired_codes(batch_size: int = 1000, pause: float = 0.0, max_batches: int | None = None):
+    """
+    Деактивирует истекшие коды пачками до опустошения очереди.
+
+    Аргументы:
+        batch_size: Размер пачки.
+        pause: Пауза между пачками в секундах, чтобы не нагружать БД.
+        max_batches: Ограничение количества пачек за один проход.
+
+    Возвращает:
+        Генератор словарей со статистикой по каждой пачке: rows, total, elapsed, rows_per_second.
+    """
+    started = time.perf_counter()
+    total = batches = 0
+    while max_batches is None or batches < max_batches:
+        rows = deactivate_expired_batch(batch_size)
+        if not rows:
+            return
+        total += rows
+        batches += 1
+        elapsed = time.perf_counter() - started
+        yield {'rows': rows, 'total': total, 'elapsed': elapsed,
+               'rows_per_second': total / elapsed if elapsed else 0.0}
+        if pause:
+            time.sleep(pause)
@@ -0,0 +1,94 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import django
+from django.contrib.auth.hashers import check_password, identify_hasher, make_password
+
+from config import get_app_settings
+
+
+SETTINGS = get_app_settings()
+
+
+def _init_worker(settings_module: str) -> None:
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+
+
+def hash_workers() -> int:
+    """
+    Размер пула процессов для хеширования паролей: password_hash_workers или число ядер.
+    """
+    return SETTINGS.password_hash_workers or os.cpu_count() or 1
+
+
+@lru_cache
+def get_hashing_pool() -> ProcessPoolExecutor:
+    """
+    Возвращает общий пул процессов для хеширования паролей.
+
+    Пул создается при первом обращении; процессы настраивают Django в initializer,
+    поэтому используют те же PASSWORD_HASHERS, что и основной процесс.
+    """
+    return ProcessPoolExecutor(max_workers=hash_workers(),
+                               initializer=_init_worker,
+                               initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'testapi.settings'),))
+
+
+def hash_passwords(passwords: list) -> list:
+    """
+    Хеширует пароли параллельно на всех ядрах.
+
+    PBKDF2 намеренно нагружает процессор, а GIL не дает ускориться потокам,
+    поэтому пачка распределяется по пулу процессов. При одном воркере или
+    одном пароле хеширование выполняется в текущем процессе.
+
+    Возвращает:
+        Список хешей в порядке паролей.
+    """
+    workers = hash_workers()
+    if workers == 1 or len(passwords) < 2:
+        return [make_password(password) for password in passwords]
+    chunksize = max(1, len(passwords) // (workers * 4))
+    return list(get_hashing_pool().map(make_password, passwords, chunksize=chunksize))
+
+
+def _check_password(password: str, encoded: str) -> tuple:
+    """
+    Проверяет пароль и сообщает, нужно ли перехешировать его с текущими параметрами хешера.
+    """
+    if not check_password(password, encoded):
+        return False, False
+    try:
+        must_update = identify_hasher(encoded).must_update(encoded)
+    except ValueError:
+        must_update = False
+    return True, must_update
+
+
+def _executor() -> ProcessPoolExecutor | None:
+    return get_hashing_pool() if SETTINGS.password_hash_offload else None
+
+
+async def ahash_password(password: str | None) -> str:
+    """
+    Хеширует пароль, не блокируя цикл событий.
+
+    При password_hash_offload=True хеширование выполняется в пуле процессов, размер
+    которого ограничен password_hash_workers, поэтому под нагрузкой лишние запросы
+    ждут в очереди пула, а не конкурируют за ядра с обработчиками. Иначе
+    используется стандартный пул потоков цикла событий.
+    """
+    return await asyncio.get_running_loop().run_in_executor(_executor(), make_password, password)
+
+
+async def acheck_password(password: str, encoded: str) -> tuple:
+    """
+    Проверяет пароль вне цикла событий (см. ahash_password).
+
+    Возвращает:
+        Кортеж (пароль верен, хеш нужно обновить под текущие параметры хешера).
+    """
+    return await asyncio.get_running_loop().run_in_executor(_executor(), _check_password, password, encoded)
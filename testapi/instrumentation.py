@@ -0,0 +1,191 @@
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpRequest, HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import sync_and_async_middleware
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+from config import get_app_settings
+
+
+SETTINGS = get_app_settings()
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+REQUESTS = Counter('testapi_requests_total', 'Обработанные запросы',
+                   ['view', 'method', 'status'])
+REQUEST_DURATION = Histogram('testapi_request_duration_seconds', 'Полное время обработки запроса',
+                             ['view', 'method'], buckets=LATENCY_BUCKETS)
+DB_QUERIES = Histogram('testapi_db_queries', 'Количество запросов к БД на один запрос',
+                       ['view'], buckets=QUERY_BUCKETS)
+DB_DURATION = Histogram('testapi_db_duration_seconds', 'Время запросов к БД на один запрос',
+                        ['view'], buckets=LATENCY_BUCKETS)
+EXTERNAL_DURATION = Histogram('testapi_external_duration_seconds',
+                              'Время внешних вызовов (http - hunter.io, smtp) на один запрос',
+                              ['view', 'component'], buckets=LATENCY_BUCKETS)
+EXTERNAL_CALLS = Histogram('testapi_external_call_duration_seconds',
+                           'Время одного внешнего вызова, в том числе вне запросов (send_outbox)',
+                           ['component'], buckets=LATENCY_BUCKETS)
+
+EXTERNAL_COMPONENTS = ('http', 'smtp')
+
+
+@dataclass
+class RequestTimings:
+    db_queries: int = 0
+    db: float = 0.0
+    http: float = 0.0
+    smtp: float = 0.0
+
+
+request_timings: contextvars.ContextVar[RequestTimings | None] = contextvars.ContextVar(
+    'request_timings', default=None)
+
+
+def record(component: str, seconds: float) -> None:
+    """
+    Учитывает внешний вызов (http или smtp) в гистограмме и во времени текущего запроса.
+    """
+    EXTERNAL_CALLS.labels(component).observe(seconds)
+    timings = request_timings.get()
+    if timings is not None:
+        setattr(timings, component, getattr(timings, component) + seconds)
+
+
+@contextmanager
+def timed(component: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(component, time.perf_counter() - started)
+
+
+def _database_timer(execute, sql, params, many, context):
+    timings = request_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db += time.perf_counter() - started
+        timings.db_queries += 1
+
+
+def install_database_timer(connection) -> None:
+    if _database_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_database_timer)
+
+
+@receiver(connection_created)
+def _install_on_connect(sender, connection, **kwargs):
+    # Соединения создаются и в потоках sync_to_async, поэтому таймер ставится на каждое новое соединение
+    install_database_timer(connection)
+
+
+def view_name(request: HttpRequest) -> str:
+    match = getattr(request, 'resolver_match', None)
+    return (match.view_name or match._func_path) if match else 'unresolved'
+
+
+def _finish(request: HttpRequest, response: HttpResponse, timings: RequestTimings, started: float) -> HttpResponse:
+    total = time.perf_counter() - started
+    view = view_name(request)
+    REQUESTS.labels(view, request.method, response.status_code).inc()
+    REQUEST_DURATION.labels(view, request.method).observe(total)
+    DB_QUERIES.labels(view).observe(timings.db_queries)
+    DB_DURATION.labels(view).observe(timings.db)
+    for component in EXTERNAL_COMPONENTS:
+        seconds = getattr(timings, component)
+        if seconds:
+            EXTERNAL_DURATION.labels(view, component).observe(seconds)
+    if SETTINGS.server_timing:
+        response['Server-Timing'] = server_timing(timings, total)
+    return response
+
+
+def server_timing(timings: RequestTimings, total: float) -> str:
+    entries = [f'db;dur={timings.db * 1000:.1f};desc="{timings.db_queries} queries"']
+    entries += [f'{component};dur={getattr(timings, component) * 1000:.1f}'
+                for component in EXTERNAL_COMPONENTS if getattr(timings, component)]
+    entries.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(entries)
+
+
+@sync_and_async_middleware
+def performance_middleware(get_response):
+    """
+    Измеряет запрос: количество и время запросов к БД, время обращений к hunter.io и SMTP
+    и полное время обработки.
+
+    Результат добавляется в заголовок Server-Timing и в гистограммы Prometheus по имени
+    представления (эндпоинт /metrics). Запросы к БД считаются обработчиком execute_wrapper,
+    который ставится на каждое соединение и вне запросов сразу передает управление дальше.
+    """
+
+    if not SETTINGS.metrics_enabled:
+        raise MiddlewareNotUsed()
+    for connection in connections.all(initialized_only=True):
+        install_database_timer(connection)
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            timings = RequestTimings()
+            token = request_timings.set(timings)
+            started = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                request_timings.reset(token)
+            return _finish(request, response, timings, started)
+
+        markcoroutinefunction(middleware)
+    else:
+        def middleware(request):
+            timings = RequestTimings()
+            token = request_timings.set(timings)
+            started = time.perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                request_timings.reset(token)
+            return _finish(request, response, timings, started)
+
+    return middleware
+
+
+def registry() -> CollectorRegistry:
+    """
+    Возвращает реестр метрик процесса или, если задан PROMETHEUS_MULTIPROC_DIR,
+    реестр, собирающий метрики всех воркеров gunicorn из этого каталога.
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    collector_registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collector_registry)
+    return collector_registry
+
+
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    """
+    Отдает метрики в текстовом формате Prometheus.
+
+    Если задан METRICS_TOKEN, требуется заголовок Authorization: Bearer <token>.
+    """
+    if SETTINGS.metrics_token:
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() != 'bearer' or not constant_time_compare(token, SETTINGS.metrics_token):
+            return HttpResponseForbidden()
+    return HttpResponse(generate_latest(registry()), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,53 @@
+import csv
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from config import get_app_settings
+from testapi.bulk import CREATED, bulk_register
+
+
+SETTINGS = get_app_settings()
+
+
+class Command(BaseCommand):
+    help = 'Регистрирует пользователей из файла JSON (список объектов) или CSV (с заголовком)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл с полями username, password, email и referral_code')
+        parser.add_argument('--batch-size', type=int, default=SETTINGS.bulk_registration_max_size,
+                            help='Количество строк, обрабатываемых за один вызов bulk_register')
+        parser.add_argument('--chunk-size', type=int, default=SETTINGS.bulk_registration_chunk_size,
+                            help='Количество строк в одной вставке bulk_create')
+        parser.add_argument('--report', help='Файл для результатов по каждой строке (JSON)')
+
+    def read_rows(self, path: str) -> list:
+        try:
+            with open(path, encoding='utf-8', newline='') as file:
+                if path.endswith('.csv'):
+                    return list(csv.DictReader(file))
+                rows = json.load(file)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Cannot read {path}: {exc}')
+        if not isinstance(rows, list):
+            raise CommandError('JSON file must contain a list of users')
+        return rows
+
+    def handle(self, *args, **options):
+        rows = self.read_rows(options['path'])
+        started = time.perf_counter()
+        results = []
+        for start in range(0, len(rows), options['batch_size']):
+            batch = bulk_register(rows[start:start + options['batch_size']], options['chunk_size'])
+            for result in batch:
+                result['index'] += start
+            results.extend(batch)
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{len(results)} rows processed')
+        elapsed = time.perf_counter() - started
+        created = sum(1 for result in results if result['status'] == CREATED)
+        if options['report']:
+            with open(options['report'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+        self.stdout.write(f'Created {created} users, rejected {len(results) - created} rows in {elapsed:.1f}s')
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from testapi.expiry import sweep_expired_codes
+
+
+class Command(BaseCommand):
+    help = 'Деактивирует истекшие реферальные коды пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Количество кодов в пачке')
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Пауза между пачками, в секундах')
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Повторять проход каждые N секунд (по умолчанию один проход)')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                self.sweep(options)
+                if options['interval'] is None:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+    def sweep(self, options):
+        stats = {'total': 0, 'elapsed': 0.0, 'rows_per_second': 0.0}
+        for stats in sweep_expired_codes(options['batch_size'], options['pause']):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{stats['total']} codes deactivated, {stats['rows_per_second']:.0f} rows/s")
+        self.stdout.write(f"Deactivated {stats['total']} expired codes in {stats['elapsed']:.2f}s "
+                          f"({stats['rows_per_second']:.0f} rows/s)")
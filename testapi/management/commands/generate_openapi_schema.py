@@ -0,0 +1,20 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from testapi.openapi import brotli, write_schema_files
+
+
+class Command(BaseCommand):
+    help = 'Строит схему OpenAPI (JSON и YAML) и сохраняет ее вместе со сжатыми копиями gzip и brotli'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.OPENAPI_SCHEMA_DIR,
+                            help='Папка для файлов схемы')
+
+    def handle(self, *args, **options):
+        if brotli is None:
+            self.stderr.write('brotli is not installed, .br files are skipped')
+        for path in write_schema_files(Path(options['output'])):
+            self.stdout.write(f'{path} ({path.stat().st_size} bytes)')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from testapi.profiling import HEADER, get_sample_rate, make_token, set_sample_rate
+
+
+class Command(BaseCommand):
+    help = 'Печатает заголовок для профилирования одного запроса и управляет долей профилируемых запросов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sample-rate', type=float, default=None,
+                            help='Профилировать эту долю запросов (0 - выключить)')
+
+    def handle(self, *args, **options):
+        if options['sample_rate'] is not None:
+            set_sample_rate(options['sample_rate'])
+        self.stdout.write(f'Sample rate: {get_sample_rate()}')
+        self.stdout.write(f'{HEADER}: {make_token()}')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from testapi.models import ReferralClosure
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает таблицу замыкания дерева рефералов по таблице Referral'
+
+    def handle(self, *args, **options):
+        total = ReferralClosure.rebuild()
+        self.stdout.write(f'Rebuilt referral closure: {total} paths')
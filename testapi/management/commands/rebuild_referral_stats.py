@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from testapi.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики рефералов (ReferralStats) с нуля пачками пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Количество пользователей в пачке')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        users = rows = 0
+        for batch_users, batch_rows in rebuild_stats(options['batch_size']):
+            users += batch_users
+            rows += batch_rows
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{users} users processed')
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'Rebuilt referral stats: {users} users, {rows} rows in {elapsed:.1f}s')
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from testapi.workers import RegistrationWorkerPool
+
+
+class Command(BaseCommand):
+    help = 'Запускает пул воркеров, завершающих отложенные регистрации'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help='Количество одновременно обрабатываемых регистраций')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Пауза между опросами пустой очереди, в секундах')
+        parser.add_argument('--once', action='store_true',
+                            help='Обработать текущую очередь один раз и завершиться')
+
+    def handle(self, *args, **options):
+        pool = RegistrationWorkerPool(concurrency=options['concurrency'],
+                                      poll_interval=options['poll_interval'])
+        try:
+            if options['once']:
+                processed = pool.run_once()
+                self.stdout.write(f'Processed {processed} registrations')
+            else:
+                pool.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            pool.shutdown()
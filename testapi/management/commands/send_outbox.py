@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from testapi.outbox import OutboxSender
+
+
+class Command(BaseCommand):
+    help = 'Отправляет письма из исходящей очереди пачками через одно SMTP-соединение'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Количество писем в пачке')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Пауза между опросами пустой очереди, в секундах')
+        parser.add_argument('--once', action='store_true',
+                            help='Отправить текущую очередь один раз и завершиться')
+
+    def handle(self, *args, **options):
+        sender = OutboxSender(batch_size=options['batch_size'],
+                              poll_interval=options['poll_interval'])
+        try:
+            if options['once']:
+                sent, failed = sender.drain()
+                self.stdout.write(f'Sent {sent} messages, {failed} failed')
+            else:
+                sender.run_forever()
+        except KeyboardInterrupt:
+            pass
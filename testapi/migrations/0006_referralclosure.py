@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_closure(apps, schema_editor):
+    connection = schema_editor.connection
+    closure = connection.ops.quote_name(apps.get_model('testapi', 'ReferralClosure')._meta.db_table)
+    referral = connection.ops.quote_name(apps.get_model('testapi', 'Referral')._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {closure} (ancestor_id, descendant_id, depth) '
+                       f'SELECT DISTINCT referrer_id, referral_id, 1 FROM {referral}')
+        depth = 1
+        while cursor.rowcount:
+            cursor.execute(f'INSERT INTO {closure} (ancestor_id, descendant_id, depth) '
+                           f'SELECT DISTINCT c.ancestor_id, r.referral_id, c.depth + 1 '
+                           f'FROM {closure} c JOIN {referral} r ON r.referrer_id = c.descendant_id '
+                           f'WHERE c.depth = %s AND NOT EXISTS ('
+                           f'SELECT 1 FROM {closure} e WHERE e.ancestor_id = c.ancestor_id '
+                           f'AND e.descendant_id = r.referral_id)', [depth])
+            depth += 1
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('testapi', '0005_referral_keyset_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferralClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveSmallIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ancestor', 'depth'], name='testapi_ref_ancesto_250a0d_idx'), models.Index(fields=['descendant', 'depth'], name='testapi_ref_descend_6273c8_idx')],
+                'constraints': [models.UniqueConstraint(fields=('ancestor', 'descendant'), name='referral_closure_unique_path')],
+            },
+        ),
+        migrations.RunPython(backfill_closure, migrations.RunPython.noop),
+    ]
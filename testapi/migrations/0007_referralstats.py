@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_stats(apps, schema_editor):
+    Referral = apps.get_model('testapi', 'Referral')
+    ReferralCode = apps.get_model('testapi', 'ReferralCode')
+    ReferralStats = apps.get_model('testapi', 'ReferralStats')
+    stats = {}
+    for user_id, total in Referral.objects.values('referrer_id').annotate(
+            total=models.Count('id')).values_list('referrer_id', 'total'):
+        stats[user_id] = ReferralStats(user_id=user_id, direct_referrals=total, signups=total)
+    for user_id, total in ReferralCode.objects.values('user_id').annotate(
+            total=models.Count('id')).values_list('user_id', 'total'):
+        stats.setdefault(user_id, ReferralStats(user_id=user_id)).codes_issued = total
+    ReferralStats.objects.bulk_create(stats.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('testapi', '0006_referralclosure'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferralStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='referral_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('direct_referrals', models.PositiveIntegerField(default=0)),
+                ('signups', models.PositiveIntegerField(default=0)),
+                ('codes_issued', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-direct_referrals', 'user'], name='referral_stats_leaderboard')],
+            },
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
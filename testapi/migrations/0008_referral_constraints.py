@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def remove_duplicates(apps, schema_editor):
+    ReferralCode = apps.get_model('testapi', 'ReferralCode')
+    Referral = apps.get_model('testapi', 'Referral')
+    ReferralStats = apps.get_model('testapi', 'ReferralStats')
+    # Оставляем активным только последний созданный код пользователя.
+    duplicated_users = (ReferralCode.objects.filter(is_active=True).values('user_id')
+                        .annotate(total=models.Count('id')).filter(total__gt=1).values_list('user_id', flat=True))
+    for user_id in duplicated_users:
+        latest = ReferralCode.objects.filter(user_id=user_id, is_active=True).latest('id')
+        ReferralCode.objects.filter(user_id=user_id, is_active=True).exclude(id=latest.id).update(is_active=False)
+    # Оставляем первую запись для каждой пары реферер-реферал.
+    duplicated_pairs = (Referral.objects.values('referrer_id', 'referral_id')
+                        .annotate(first_id=models.Min('id'), total=models.Count('id')).filter(total__gt=1))
+    referrers = set()
+    for pair in duplicated_pairs:
+        Referral.objects.filter(referrer_id=pair['referrer_id'], referral_id=pair['referral_id']).exclude(
+            id=pair['first_id']).delete()
+        referrers.add(pair['referrer_id'])
+    # 0007 заполнила ReferralStats с учетом дубликатов, поэтому счетчики затронутых рефереров пересчитываются.
+    for referrer_id in referrers:
+        total = Referral.objects.filter(referrer_id=referrer_id).count()
+        ReferralStats.objects.filter(user_id=referrer_id).update(direct_referrals=total, signups=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('testapi', '0007_referralstats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='referralcode',
+            index=models.Index(fields=['user', 'is_active'], name='testapi_ref_user_id_cd9613_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='referral',
+            constraint=models.UniqueConstraint(fields=('referrer', 'referral'), name='referral_unique_pair'),
+        ),
+        migrations.AddConstraint(
+            model_name='referralcode',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('user',), name='referral_code_one_active_per_user'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:30
+
+from django.db import migrations, models
+
+
+def create_pg_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE SEQUENCE IF NOT EXISTS testapi_referral_code_block_seq MINVALUE 0 START 0')
+
+
+def drop_pg_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP SEQUENCE IF EXISTS testapi_referral_code_block_seq')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('testapi', '0008_referral_constraints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodeSequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('next_value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_pg_sequence, drop_pg_sequence),
+    ]
@@ -1,32 +1,352 @@
-from django.db import models
+import uuid
+from django.db import connection, models, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from datetime import datetime
-from dateutil import parser
+from testapi.codes import get_code_generator
 
 USER_MODEL = get_user_model()
 
 
+class ReferralCodeQuerySet(models.QuerySet):
+    def active(self, now: datetime | None = None):
+        return self.filter(is_active=True, expiry_date__gt=now or timezone.now())
+
+    def expired(self, now: datetime | None = None):
+        return self.filter(is_active=True, expiry_date__lte=now or timezone.now())
+
+
 class ReferralCode(models.Model):
     user = models.ForeignKey(USER_MODEL, on_delete=models.CASCADE)
     code = models.CharField(max_length=20, unique=True)
     expiry_date = models.DateTimeField()
     is_active = models.BooleanField(default=True)
 
+    objects = ReferralCodeQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user'], condition=models.Q(is_active=True),
+                                    name='referral_code_one_active_per_user'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'is_active']),
+            models.Index(fields=['expiry_date'], condition=models.Q(is_active=True),
+                         name='referral_code_active_expiry'),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.code:
             self.code = self.generate_referral_code()
-        super().save(*args, **kwargs)
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                ReferralStats.increment(self.user_id, codes_issued=1)
+
+    @classmethod
+    def rotate(cls, user, expiry_date: datetime) -> tuple['ReferralCode', list]:
+        """
+        Атомарно заменяет активный код пользователя новым.
+
+        Строка пользователя блокируется (SELECT ... FOR UPDATE), поэтому параллельные
+        смены кода одного пользователя выполняются последовательно; ограничение
+        referral_code_one_active_per_user дополнительно гарантирует один активный код.
+
+        Возвращает:
+            Кортеж (новый код, список деактивированных кодов).
+        """
+        with transaction.atomic():
+            list(USER_MODEL.objects.select_for_update().filter(pk=user.pk).values_list('pk', flat=True))
+            active = cls.objects.filter(user=user, is_active=True)
+            previous_codes = list(active.values_list('code', flat=True))
+            active.update(is_active=False)
+            referral_code = cls.objects.create(user=user, expiry_date=expiry_date)
+        return referral_code, previous_codes
 
     def generate_referral_code(self):
-        import string
-        import random
-        code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=20))
-        return code
+        return get_code_generator().generate()
 
     def is_expired(self):
-        date_object = parser.parse(self.expiry_date)
-        return datetime.now() > date_object
+        expiry_date = self.expiry_date
+        if isinstance(expiry_date, str):
+            from dateutil import parser
+            expiry_date = parser.parse(expiry_date)
+        if timezone.is_naive(expiry_date):
+            expiry_date = timezone.make_aware(expiry_date)
+        return timezone.now() >= expiry_date
+
+class CodeSequence(models.Model):
+    name = models.CharField(max_length=50, primary_key=True)
+    next_value = models.BigIntegerField(default=0)
+
 
 class Referral(models.Model):
     referrer = models.ForeignKey(USER_MODEL, related_name='referrals', on_delete=models.CASCADE)
-    referral = models.ForeignKey(USER_MODEL, related_name='referred_by', on_delete=models.CASCADE)
\ No newline at end of file
+    referral = models.ForeignKey(USER_MODEL, related_name='referred_by', on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['referrer', 'referral'], name='referral_unique_pair'),
+        ]
+        indexes = [
+            models.Index(fields=['referrer', 'id']),
+        ]
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                ReferralClosure.add_edge(self.referrer_id, self.referral_id)
+                ReferralStats.increment(self.referrer_id, direct_referrals=1, signups=1)
+
+
+class ReferralClosure(models.Model):
+    ancestor = models.ForeignKey(USER_MODEL, related_name='+', on_delete=models.CASCADE)
+    descendant = models.ForeignKey(USER_MODEL, related_name='+', on_delete=models.CASCADE)
+    depth = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='referral_closure_unique_path'),
+        ]
+        indexes = [
+            models.Index(fields=['ancestor', 'depth']),
+            models.Index(fields=['descendant', 'depth']),
+        ]
+
+    @classmethod
+    def add_edge(cls, referrer_id: int, referral_id: int) -> None:
+        """
+        Добавляет в таблицу замыкания пути, появившиеся с ребром referrer -> referral:
+        от referrer и всех его предков к referral и всем его потомкам.
+        """
+        ancestors = [(referrer_id, 0)] + list(
+            cls.objects.filter(descendant_id=referrer_id).values_list('ancestor_id', 'depth'))
+        descendants = [(referral_id, 0)] + list(
+            cls.objects.filter(ancestor_id=referral_id).values_list('descendant_id', 'depth'))
+        cls.objects.bulk_create(
+            [cls(ancestor_id=ancestor, descendant_id=descendant, depth=up + down + 1)
+             for ancestor, up in ancestors
+             for descendant, down in descendants],
+            ignore_conflicts=True,
+        )
+
+    @classmethod
+    def edge_paths(cls, referrer_id: int, referral_id: int) -> tuple[list, list]:
+        """
+        Возвращает концы путей, проходящих через ребро referrer -> referral:
+        (referrer и его предки, referral и его потомки).
+        """
+        ancestors = [referrer_id] + list(
+            cls.objects.filter(descendant_id=referrer_id).values_list('ancestor_id', flat=True))
+        descendants = [referral_id] + list(
+            cls.objects.filter(ancestor_id=referral_id).values_list('descendant_id', flat=True))
+        return ancestors, descendants
+
+    @classmethod
+    def remove_edge(cls, ancestors: list, descendants: list) -> None:
+        """
+        Удаляет пути удаленного ребра (концы из edge_paths) и восстанавливает те из них,
+        которые проходят через другие ребра, ведущие в поддерево извне.
+
+        Вызывается после удаления Referral, поэтому оставшиеся ребра уже не включают удаленное.
+        """
+        cls.objects.filter(ancestor_id__in=ancestors, descendant_id__in=descendants).delete()
+        for referrer_id, referral_id in (Referral.objects.filter(referral_id__in=descendants)
+                                         .exclude(referrer_id__in=descendants)
+                                         .values_list('referrer_id', 'referral_id')):
+            cls.add_edge(referrer_id, referral_id)
+
+    @classmethod
+    def add_leaf_edges(cls, edges: list) -> None:
+        """
+        Добавляет пути для пачки новых пользователей без потомков.
+
+        Для каждого ребра referrer -> referral записываются пути от referrer и всех
+        его предков; предки всех рефереров пачки читаются одним запросом.
+
+        Аргументы:
+            edges: Список пар (referrer_id, referral_id).
+        """
+        ancestors = {}
+        for descendant, ancestor, depth in cls.objects.filter(
+                descendant_id__in={referrer for referrer, _ in edges}).values_list('descendant_id', 'ancestor_id',
+                                                                                    'depth'):
+            ancestors.setdefault(descendant, []).append((ancestor, depth))
+        cls.objects.bulk_create(
+            [cls(ancestor_id=ancestor, descendant_id=referral, depth=up + 1)
+             for referrer, referral in edges
+             for ancestor, up in [(referrer, 0)] + ancestors.get(referrer, [])],
+            ignore_conflicts=True,
+        )
+
+    @classmethod
+    def rebuild(cls) -> int:
+        """
+        Полностью перестраивает таблицу замыкания по таблице Referral, уровень за уровнем.
+
+        Возвращает:
+            Количество записанных путей.
+        """
+        closure = connection.ops.quote_name(cls._meta.db_table)
+        referral = connection.ops.quote_name(Referral._meta.db_table)
+        total = 0
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {closure}')
+            cursor.execute(f'INSERT INTO {closure} (ancestor_id, descendant_id, depth) '
+                           f'SELECT DISTINCT referrer_id, referral_id, 1 FROM {referral}')
+            depth = 1
+            while cursor.rowcount:
+                total += cursor.rowcount
+                cursor.execute(f'INSERT INTO {closure} (ancestor_id, descendant_id, depth) '
+                               f'SELECT DISTINCT c.ancestor_id, r.referral_id, c.depth + 1 '
+                               f'FROM {closure} c JOIN {referral} r ON r.referrer_id = c.descendant_id '
+                               f'WHERE c.depth = %s AND NOT EXISTS ('
+                               f'SELECT 1 FROM {closure} e WHERE e.ancestor_id = c.ancestor_id '
+                               f'AND e.descendant_id = r.referral_id)', [depth])
+                depth += 1
+        return total
+
+
+class PendingRegistration(models.Model):
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    ACTIVE = 'active'
+    REJECTED = 'rejected'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (PROCESSING, 'Processing'),
+        (ACTIVE, 'Active'),
+        (REJECTED, 'Rejected'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.OneToOneField(USER_MODEL, null=True, related_name='pending_registration', on_delete=models.SET_NULL)
+    email = models.EmailField()
+    referral_code = models.CharField(max_length=20, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+
+class EmailOutbox(models.Model):
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    DEAD = 'dead'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (DEAD, 'Dead'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    recipients = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+
+class ReferralStats(models.Model):
+    """
+    Денормализованные счетчики рефералов пользователя.
+
+    direct_referrals - текущее количество прямых рефералов, signups - количество
+    регистраций по кодам пользователя за все время (не уменьшается при удалении
+    реферала), codes_issued - количество выпущенных реферальных кодов.
+    Счетчики обновляются в той же транзакции, что и Referral/ReferralCode;
+    расхождения исправляет команда rebuild_referral_stats.
+    """
+
+    user = models.OneToOneField(USER_MODEL, primary_key=True, related_name='referral_stats', on_delete=models.CASCADE)
+    direct_referrals = models.PositiveIntegerField(default=0)
+    signups = models.PositiveIntegerField(default=0)
+    codes_issued = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-direct_referrals', 'user'], name='referral_stats_leaderboard'),
+        ]
+
+    @classmethod
+    def increment(cls, user_id: int, **deltas) -> None:
+        cls.objects.get_or_create(user_id=user_id)
+        cls.objects.filter(user_id=user_id).update(**{field: F(field) + delta for field, delta in deltas.items()})
+
+
+class ApiQuotaUsage(models.Model):
+    """
+    Количество запросов к внешнему API (name) в окне window - номере периода квоты
+    от эпохи Unix. Одна строка на окно общая для всех процессов, см. testapi.quota.SharedQuota.
+    """
+
+    name = models.CharField(max_length=50)
+    window = models.BigIntegerField()
+    used = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'window'], name='api_quota_usage_unique_window'),
+        ]
+
+    @classmethod
+    def try_consume(cls, name: str, window: int, capacity: int) -> bool:
+        """
+        Атомарно учитывает один запрос, если в окне использовано меньше capacity.
+
+        Возвращает:
+            True, если запрос учтен.
+        """
+        consumed = cls.objects.filter(name=name, window=window, used__lt=capacity).update(used=F('used') + 1)
+        if not consumed:
+            _, created = cls.objects.get_or_create(name=name, window=window)
+            if created:
+                cls.objects.filter(name=name, window__lt=window).delete()
+            consumed = cls.objects.filter(name=name, window=window, used__lt=capacity).update(used=F('used') + 1)
+        return bool(consumed)
+
+
+@receiver(pre_delete, sender=Referral)
+def collect_referral_paths(sender, instance, **kwargs):
+    # При удалении пользователя его пути в ReferralClosure удаляются каскадом до post_delete,
+    # поэтому концы путей через ребро собираются заранее
+    instance._closure_paths = ReferralClosure.edge_paths(instance.referrer_id, instance.referral_id)
+
+
+@receiver(post_delete, sender=Referral)
+def decrement_direct_referrals(sender, instance, **kwargs):
+    ReferralStats.objects.filter(user_id=instance.referrer_id, direct_referrals__gt=0).update(
+        direct_referrals=F('direct_referrals') - 1)
+
+
+@receiver(post_delete, sender=Referral)
+def remove_referral_paths(sender, instance, **kwargs):
+    ReferralClosure.remove_edge(*instance._closure_paths)
+
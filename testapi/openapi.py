@@ -0,0 +1,187 @@
+import gzip
+import hashlib
+import logging
+from functools import lru_cache
+from pathlib import Path
+from typing import NamedTuple
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import require_safe
+
+from config import get_app_settings
+
+try:
+    import brotli
+except ImportError:  # brotli ставится вместе с whitenoise[brotli]
+    brotli = None
+
+
+SETTINGS = get_app_settings()
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    'json': 'application/json',
+    'yaml': 'application/yaml',
+}
+ENCODINGS = {
+    'br': '.br',
+    'gzip': '.gz',
+}
+
+
+class SchemaFile(NamedTuple):
+    content_type: str
+    etag: str
+    variants: dict
+
+
+def swagger_schema(name: str):
+    """
+    Отложенный swagger_auto_schema: метод представления помечается именем схемы из swagger_docs,
+    а сама схема применяется в load_swagger_docs при первом построении документации.
+
+    Так drf_yasg и описания схем не импортируются при загрузке представлений.
+    """
+    def decorator(view_method):
+        view_method._swagger_schema_name = name
+        return view_method
+    return decorator
+
+
+@lru_cache(maxsize=1)
+def load_swagger_docs():
+    """
+    Импортирует swagger_docs и применяет схемы к методам, помеченным swagger_schema.
+
+    Возвращает:
+        Модуль swagger_docs.
+    """
+    import swagger_docs
+    from testapi import views
+
+    for view in vars(views).values():
+        if isinstance(view, type):
+            for method in vars(view).values():
+                name = getattr(method, '_swagger_schema_name', None)
+                if name:
+                    getattr(swagger_docs, name)(method)
+    return swagger_docs
+
+
+def render_schema(fmt: str) -> bytes:
+    """
+    Строит схему OpenAPI по всем представлениям и сериализаторам (дорогая операция).
+
+    Маршруты берутся из testapi.urls.schema_patterns, поэтому схема не зависит от
+    ASYNC_VIEWS и PASSWORD_HASH_OFFLOAD.
+    """
+    from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+    from drf_yasg.generators import OpenAPISchemaGenerator
+    from testapi.urls import schema_patterns
+
+    api_info = load_swagger_docs().api_info
+    generator = OpenAPISchemaGenerator(info=api_info, url=SETTINGS.openapi_base_url or None,
+                                       patterns=schema_patterns)
+    schema = generator.get_schema(public=True)
+    codec = OpenAPICodecJson(validators=[]) if fmt == 'json' else OpenAPICodecYaml(validators=[])
+    return codec.encode(schema)
+
+
+def compress(content: bytes) -> dict:
+    variants = {'identity': content, 'gzip': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(content, quality=11)
+    return variants
+
+
+def write_schema_files(directory: Path) -> list:
+    """
+    Сохраняет схему во всех форматах вместе с заранее сжатыми копиями (.gz, .br).
+
+    Возвращает:
+        Список записанных файлов.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    written = []
+    for fmt in FORMATS:
+        variants = compress(render_schema(fmt))
+        path = directory / f'openapi.{fmt}'
+        for encoding, content in variants.items():
+            target = path.with_name(path.name + ENCODINGS.get(encoding, ''))
+            target.write_bytes(content)
+            written.append(target)
+    return written
+
+
+@lru_cache
+def load_schema(fmt: str) -> SchemaFile:
+    """
+    Загружает заранее построенную схему (команда generate_openapi_schema) в память процесса.
+
+    Если файлов нет, схема строится один раз при первом обращении и хранится в памяти.
+    """
+    path = Path(settings.OPENAPI_SCHEMA_DIR) / f'openapi.{fmt}'
+    if path.exists():
+        variants = {'identity': path.read_bytes()}
+        for encoding, suffix in ENCODINGS.items():
+            compressed = path.with_name(path.name + suffix)
+            if compressed.exists():
+                variants[encoding] = compressed.read_bytes()
+    else:
+        logger.warning('%s not found, building OpenAPI schema in memory; run generate_openapi_schema', path)
+        variants = compress(render_schema(fmt))
+    etag = hashlib.sha256(variants['identity']).hexdigest()[:32]
+    return SchemaFile(FORMATS[fmt], etag, variants)
+
+
+def choose_encoding(request: HttpRequest, variants: dict) -> str:
+    accepted = {part.split(';')[0].strip() for part in request.headers.get('Accept-Encoding', '').split(',')}
+    for encoding in ENCODINGS:
+        if encoding in accepted and encoding in variants:
+            return encoding
+    return 'identity'
+
+
+@require_safe
+def openapi_schema(request: HttpRequest, fmt: str) -> HttpResponse:
+    """
+    Отдает заранее построенную схему OpenAPI.
+
+    Сжатая копия выбирается по Accept-Encoding (brotli, затем gzip). Ответ содержит
+    ETag и Cache-Control на openapi_cache_max_age секунд; запрос с совпадающим
+    If-None-Match получает 304 без тела.
+
+    Аргументы:
+        request: Объект запроса.
+        fmt: Формат схемы: json или yaml.
+
+    Возвращает:
+        Объект HttpResponse со схемой или HttpResponseNotModified.
+    """
+    schema = load_schema(fmt)
+    encoding = choose_encoding(request, schema.variants)
+    etag = f'"{schema.etag}"' if encoding == 'identity' else f'"{schema.etag}-{encoding}"'
+    if etag in {tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')}:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(schema.variants[encoding], content_type=schema.content_type)
+        if encoding != 'identity':
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Cache-Control'] = f'public, max-age={SETTINGS.openapi_cache_max_age}'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+@lru_cache(maxsize=1)
+def _swagger_ui_view():
+    return load_swagger_docs().schema_view.with_ui('swagger', cache_timeout=0)
+
+
+def swagger_ui(request: HttpRequest, *args, **kwargs) -> HttpResponse:
+    """
+    Swagger UI; drf_yasg загружается при первом обращении к этому адресу.
+    """
+    return _swagger_ui_view()(request, *args, **kwargs)
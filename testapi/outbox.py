@@ -0,0 +1,150 @@
+import logging
+import threading
+from datetime import timedelta
+
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from config import get_app_settings
+from testapi.instrumentation import timed
+from testapi.models import EmailOutbox
+
+
+SETTINGS = get_app_settings()
+logger = logging.getLogger(__name__)
+
+
+def enqueue_mail(subject: str, body: str, from_email: str, recipients: list) -> EmailOutbox:
+    """
+    Добавляет письмо в исходящую очередь.
+
+    Письмо записывается в текущей транзакции и будет отправлено командой
+    send_outbox, поэтому вызывающий код не ждет ответа почтового сервера.
+    """
+    return EmailOutbox.objects.create(subject=subject, body=body,
+                                      from_email=from_email, recipients=list(recipients))
+
+
+async def aenqueue_mail(subject: str, body: str, from_email: str, recipients: list) -> EmailOutbox:
+    """
+    Асинхронный вариант enqueue_mail для асинхронных представлений.
+    """
+    return await EmailOutbox.objects.acreate(subject=subject, body=body,
+                                             from_email=from_email, recipients=list(recipients))
+
+
+def retry_delay(attempts: int) -> float:
+    delay = SETTINGS.outbox_retry_base_delay * (2 ** max(attempts - 1, 0))
+    return min(delay, SETTINGS.outbox_retry_max_delay)
+
+
+def claim_batch(limit: int) -> list:
+    """
+    Захватывает до limit писем, готовых к отправке.
+
+    Строки блокируются с SKIP LOCKED, поэтому несколько отправителей не
+    получат одно и то же письмо. Письма, застрявшие в статусе sending дольше
+    outbox_lease_timeout, захватываются повторно.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=SETTINGS.outbox_lease_timeout)
+    with transaction.atomic():
+        messages = list(
+            EmailOutbox.objects
+            .select_for_update(skip_locked=True)
+            .filter(Q(status=EmailOutbox.PENDING, next_attempt_at__lte=now)
+                    | Q(status=EmailOutbox.SENDING, updated_at__lt=stale))
+            .order_by('next_attempt_at')[:limit]
+        )
+        EmailOutbox.objects.filter(id__in=[message.id for message in messages]).update(
+            status=EmailOutbox.SENDING, updated_at=now)
+    return messages
+
+
+def _mark_failed(message: EmailOutbox, error: str) -> None:
+    message.attempts += 1
+    message.last_error = error[:255]
+    if message.attempts >= SETTINGS.outbox_max_attempts:
+        message.status = EmailOutbox.DEAD
+    else:
+        message.status = EmailOutbox.PENDING
+        message.next_attempt_at = timezone.now() + timedelta(seconds=retry_delay(message.attempts))
+    message.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at', 'updated_at'])
+
+
+def send_batch(connection, batch_size: int | None = None) -> tuple[int, int]:
+    """
+    Отправляет одну пачку писем через уже открытое соединение.
+
+    Каждое письмо отправляется отдельно, чтобы ошибка одного не влияла на
+    остальные. Неудачные письма переносятся с экспоненциальной задержкой,
+    а после outbox_max_attempts попыток получают статус dead. После ошибки
+    соединение закрывается и переоткрывается при следующей отправке.
+
+    Возвращает:
+        Кортеж (отправлено, с ошибкой).
+    """
+    sent = failed = 0
+    for message in claim_batch(batch_size or SETTINGS.outbox_batch_size):
+        email = EmailMessage(message.subject, message.body, message.from_email,
+                             message.recipients, connection=connection)
+        try:
+            with timed('smtp'):
+                connection.send_messages([email])
+        except Exception as exc:
+            logger.warning('Sending outbox message %s failed: %s', message.id, exc)
+            connection.close()
+            _mark_failed(message, str(exc) or exc.__class__.__name__)
+            failed += 1
+            continue
+        message.status = EmailOutbox.SENT
+        message.sent_at = timezone.now()
+        message.save(update_fields=['status', 'sent_at', 'updated_at'])
+        sent += 1
+    return sent, failed
+
+
+class OutboxSender:
+    """
+    Отправитель исходящей очереди писем.
+
+    Пока в очереди есть письма, пачки отправляются через одно SMTP-соединение;
+    когда очередь пуста, соединение закрывается до появления новых писем.
+
+    Атрибуты:
+        batch_size: Размер пачки.
+        poll_interval: Пауза в секундах между опросами пустой очереди.
+    """
+
+    def __init__(self, batch_size: int | None = None, poll_interval: float = 1.0) -> None:
+        self.batch_size = batch_size or SETTINGS.outbox_batch_size
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+
+    def drain(self) -> tuple[int, int]:
+        """
+        Отправляет все готовые письма и возвращает (отправлено, с ошибкой).
+        """
+        total_sent = total_failed = 0
+        connection = get_connection(fail_silently=False)
+        try:
+            while True:
+                sent, failed = send_batch(connection, self.batch_size)
+                total_sent += sent
+                total_failed += failed
+                if sent + failed < self.batch_size:
+                    return total_sent, total_failed
+        finally:
+            connection.close()
+
+    def run_forever(self) -> None:
+        while not self._stop.is_set():
+            close_old_connections()
+            sent, failed = self.drain()
+            if not sent and not failed:
+                self._stop.wait(self.poll_interval)
+
+    def stop(self) -> None:
+        self._stop.set()
@@ -0,0 +1,266 @@
+import io
+import os
+import random
+import re
+import secrets
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import NamedTuple
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, Http404, HttpRequest, HttpResponse, HttpResponseRedirect
+from django.shortcuts import render
+from django.urls import reverse
+from django.utils.decorators import sync_and_async_middleware
+
+from config import get_app_settings
+from testapi.cache import TTLCache
+from testapi.instrumentation import view_name
+
+
+SETTINGS = get_app_settings()
+
+HEADER = 'X-Profile'
+SIGNING_SALT = 'testapi.profiling'
+SAMPLE_RATE_KEY = 'profiling:sample_rate'
+SAMPLE_RATE_FILE = 'sample_rate'
+# Между методом и представлением - pid процесса и случайный суффикс: профили двух воркеров,
+# начатые в одну миллисекунду и с той же длительностью, не перезаписывают друг друга
+FILE_PATTERN = re.compile(r'^(?P<started>\d+)_(?P<duration>\d+)_(?P<method>[A-Z]+)_(?P<id>\d+-[0-9a-f]+)'
+                          r'_(?P<view>[\w.:-]+)\.prof$')
+
+# Один профилировщик на процесс: в Python 3.12+ cProfile не запускается, пока активен другой
+_profiler_lock = threading.Lock()
+
+# Доля запросов читается из файла не чаще раза в несколько секунд, чтобы не обращаться к нему на каждый запрос
+_sample_rates = TTLCache(max_size=1, default_ttl=5.0)
+
+
+class Profile(NamedTuple):
+    name: str
+    started: float
+    duration_ms: int
+    method: str
+    view: str
+
+
+def make_token() -> str:
+    """
+    Возвращает подписанное значение заголовка X-Profile.
+
+    Значение подписано SECRET_KEY и действительно profiling_token_max_age секунд после создания.
+    """
+    return signing.TimestampSigner(salt=SIGNING_SALT).sign('profile')
+
+
+def token_is_valid(value: str) -> bool:
+    try:
+        return signing.TimestampSigner(salt=SIGNING_SALT).unsign(
+            value, max_age=SETTINGS.profiling_token_max_age) == 'profile'
+    except signing.BadSignature:
+        return False
+
+
+def sample_rate_path() -> Path:
+    return Path(settings.PROFILES_DIR) / SAMPLE_RATE_FILE
+
+
+def get_sample_rate() -> float:
+    """
+    Возвращает долю профилируемых запросов: значение, заданное администратором (set_sample_rate),
+    или profiling_sample_rate из настроек.
+
+    Значение хранится в файле в PROFILES_DIR, общем для всех воркеров, а не в кэше Django,
+    который может быть отдельным у каждого процесса. Воркер перечитывает файл не чаще
+    раза в 5 секунд.
+    """
+    rate = _sample_rates.get(SAMPLE_RATE_KEY)
+    if rate is None:
+        try:
+            rate = float(sample_rate_path().read_text())
+        except (OSError, ValueError):
+            rate = SETTINGS.profiling_sample_rate
+        _sample_rates.set(SAMPLE_RATE_KEY, rate)
+    return rate
+
+
+def set_sample_rate(rate: float) -> None:
+    path = sample_rate_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Запись через временный файл и os.replace: воркер не прочитает наполовину записанное значение
+    temporary = path.with_name(f'.{SAMPLE_RATE_FILE}.{os.getpid()}')
+    temporary.write_text(repr(min(max(rate, 0.0), 1.0)))
+    os.replace(temporary, path)
+    _sample_rates.clear()
+
+
+def should_profile(request: HttpRequest) -> bool:
+    token = request.headers.get(HEADER)
+    if token:
+        return token_is_valid(token)
+    rate = get_sample_rate()
+    return rate > 0 and random.random() < rate
+
+
+class ProfileStore:
+    """
+    Каталог с профилями запросов в формате pstats, в котором хранятся не больше max_files последних файлов.
+
+    Метаданные (время начала, длительность, метод и представление) записаны в имени файла,
+    поэтому список строится без чтения профилей.
+    """
+
+    def __init__(self, directory: Path, max_files: int) -> None:
+        self.directory = Path(directory)
+        self.max_files = max_files
+        self._lock = threading.Lock()
+
+    def save(self, profiler: 'cProfile.Profile', started: float, duration: float, method: str, view: str) -> Path:
+        view = re.sub(r'[^\w.:-]', '-', view)
+        suffix = f'{os.getpid()}-{secrets.token_hex(4)}'
+        path = self.directory / f'{int(started * 1000)}_{int(duration * 1000)}_{method}_{suffix}_{view}.prof'
+        self.directory.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(path)
+        self.rotate()
+        return path
+
+    def rotate(self) -> None:
+        with self._lock:
+            profiles = sorted(self.profiles(), key=lambda profile: profile.started)
+            for profile in profiles[:max(0, len(profiles) - self.max_files)]:
+                (self.directory / profile.name).unlink(missing_ok=True)
+
+    def profiles(self) -> list:
+        if not self.directory.is_dir():
+            return []
+        profiles = []
+        for path in self.directory.iterdir():
+            match = FILE_PATTERN.match(path.name)
+            if match:
+                profiles.append(Profile(path.name, int(match['started']) / 1000, int(match['duration']),
+                                        match['method'], match['view']))
+        return profiles
+
+    def slowest_by_view(self, limit: int) -> dict:
+        """
+        Возвращает словарь {представление: самые долгие профили, не больше limit}.
+        """
+        views = {}
+        for profile in sorted(self.profiles(), key=lambda profile: -profile.duration_ms):
+            slowest = views.setdefault(profile.view, [])
+            if len(slowest) < limit:
+                slowest.append(profile)
+        return dict(sorted(views.items()))
+
+    def path(self, name: str) -> Path:
+        if not FILE_PATTERN.match(name) or not (self.directory / name).is_file():
+            raise FileNotFoundError(name)
+        return self.directory / name
+
+    def report(self, name: str, lines: int = 40) -> str:
+        import pstats
+
+        output = io.StringIO()
+        pstats.Stats(str(self.path(name)), stream=output).sort_stats('cumulative').print_stats(lines)
+        return output.getvalue()
+
+
+@lru_cache(maxsize=1)
+def get_store() -> ProfileStore:
+    return ProfileStore(settings.PROFILES_DIR, SETTINGS.profiling_max_files)
+
+
+@sync_and_async_middleware
+def profiling_middleware(get_response):
+    """
+    Профилирует выбранные запросы cProfile и сохраняет профили в ProfileStore.
+
+    Профилируется доля запросов get_sample_rate() и запросы с действительным подписанным
+    заголовком X-Profile (make_token). Профилируются только запросы WSGI: cProfile видит
+    только текущий поток, а в цикле событий ASGI он смешал бы несколько запросов.
+
+    В процессе одновременно работает один профилировщик (в Python 3.12+ второй не
+    запускается), поэтому запрос, пришедший во время профилирования другого, выполняется
+    без профиля. Имя сохраненного профиля возвращается в заголовке X-Profile только на
+    запросы с подписанным заголовком и на запросы персонала.
+    """
+
+    if not SETTINGS.profiling_enabled:
+        raise MiddlewareNotUsed()
+    if iscoroutinefunction(get_response):
+        return get_response
+
+    def middleware(request):
+        if not should_profile(request) or not _profiler_lock.acquire(blocking=False):
+            return get_response(request)
+        try:
+            return profile(request)
+        finally:
+            _profiler_lock.release()
+
+    def profile(request):
+        import cProfile
+
+        profiler = cProfile.Profile()
+        started = time.time()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Профилировщик уже запущен другим инструментом
+            return get_response(request)
+        try:
+            response = get_response(request)
+        finally:
+            profiler.disable()
+        path = get_store().save(profiler, started, time.time() - started, request.method, view_name(request))
+        user = getattr(request, 'user', None)
+        if request.headers.get(HEADER) or (user is not None and user.is_staff):
+            response[HEADER] = path.name
+        return response
+
+    return middleware
+
+
+@staff_member_required
+def profiles_view(request: HttpRequest) -> HttpResponse:
+    """
+    Страница администратора: самые долгие сохраненные профили по представлениям,
+    текущая доля профилируемых запросов (меняется формой) и значение заголовка X-Profile.
+    """
+    if request.method == 'POST':
+        try:
+            set_sample_rate(float(request.POST.get('sample_rate', '')))
+        except ValueError:
+            pass
+        return HttpResponseRedirect(reverse('admin-profiles'))
+    store = get_store()
+    selected = request.GET.get('profile')
+    try:
+        report = store.report(selected) if selected else None
+    except FileNotFoundError:
+        raise Http404('Profile not found')
+    return render(request, 'testapi/profiles.html', {
+        'title': 'Profiles',
+        'views': store.slowest_by_view(SETTINGS.profiling_list_limit),
+        'sample_rate': get_sample_rate(),
+        'header': HEADER,
+        'token': make_token(),
+        'token_max_age': SETTINGS.profiling_token_max_age,
+        'selected': selected,
+        'report': report,
+    })
+
+
+@staff_member_required
+def profile_download_view(request: HttpRequest, name: str) -> FileResponse:
+    try:
+        path = get_store().path(name)
+    except FileNotFoundError:
+        raise Http404('Profile not found')
+    return FileResponse(path.open('rb'), as_attachment=True, filename=name)
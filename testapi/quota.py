@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+
+from testapi.models import ApiQuotaUsage
+
+
+class SharedQuota:
+    """
+    Квота запросов к внешнему API, общая для всех процессов и воркеров.
+
+    Счетчик хранится в БД (ApiQuotaUsage) и увеличивается атомарным UPDATE, поэтому
+    ни количество воркеров gunicorn, ни их перезапуск не увеличивают квоту. Период
+    отсчитывается фиксированными окнами от эпохи Unix: в каждом окне длиной period
+    секунд выполняется не больше capacity запросов.
+    """
+
+    def __init__(self, name: str, capacity: int, period: float) -> None:
+        self.name = name
+        self.capacity = capacity
+        self.period = period
+
+    def window(self) -> int:
+        return int(time.time() // self.period)
+
+    def seconds_until_reset(self) -> float:
+        return (self.window() + 1) * self.period - time.time()
+
+    def try_acquire(self) -> bool:
+        return ApiQuotaUsage.try_consume(self.name, self.window(), self.capacity)
+
+    def acquire(self, timeout: float = 0.0) -> bool:
+        """
+        Учитывает запрос, ожидая начала следующего окна не дольше timeout секунд.
+
+        Возвращает:
+            True, если запрос учтен.
+        """
+        deadline = time.monotonic() + timeout
+        while not self.try_acquire():
+            wait = self.seconds_until_reset()
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+        return True
+
+    async def aacquire(self, timeout: float = 0.0) -> bool:
+        deadline = time.monotonic() + timeout
+        while not await sync_to_async(self.try_acquire)():
+            wait = self.seconds_until_reset()
+            if time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+        return True
@@ -0,0 +1,96 @@
+from datetime import datetime
+from typing import NamedTuple
+
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from config import get_app_settings
+from testapi.cache import TTLCache
+from testapi.models import ReferralCode
+
+
+SETTINGS = get_app_settings()
+
+
+class CachedCode(NamedTuple):
+    user_id: int
+    expiry_date: datetime
+    is_active: bool
+
+
+_NOT_FOUND = CachedCode(0, datetime.min, False)
+
+referral_code_cache = TTLCache(max_size=SETTINGS.referral_code_cache_size,
+                               default_ttl=SETTINGS.referral_code_cache_ttl)
+
+
+def lookup_referral_code(code: str) -> CachedCode | None:
+    """
+    Возвращает владельца, срок действия и активность реферального кода.
+
+    Результат (в том числе отсутствие кода) кэшируется в памяти процесса на
+    referral_code_cache_ttl секунд. Кэш сбрасывается явно через
+    invalidate_referral_codes при смене и удалении кода; другие процессы
+    видят изменение не позже чем через TTL. Если код не найден на реплике,
+    он перепроверяется в основной БД, чтобы отставание реплики не попало
+    в кэш как отсутствие кода.
+
+    Возвращает:
+        CachedCode или None, если кода не существует.
+    """
+    entry = referral_code_cache.get(code)
+    if entry is None:
+        rows = ReferralCode.objects.filter(code=code).values_list('user_id', 'expiry_date', 'is_active')
+        row = rows.first()
+        if row is None and rows.db != DEFAULT_DB_ALIAS:
+            row = rows.using(DEFAULT_DB_ALIAS).first()
+        entry = CachedCode(*row) if row else _NOT_FOUND
+        referral_code_cache.set(code, entry)
+    return None if entry is _NOT_FOUND else entry
+
+
+async def alookup_referral_code(code: str) -> CachedCode | None:
+    """
+    Асинхронный вариант lookup_referral_code (запрос к БД через async ORM).
+    """
+    entry = referral_code_cache.get(code)
+    if entry is None:
+        rows = ReferralCode.objects.filter(code=code).values_list('user_id', 'expiry_date', 'is_active')
+        row = await rows.afirst()
+        if row is None and rows.db != DEFAULT_DB_ALIAS:
+            row = await rows.using(DEFAULT_DB_ALIAS).afirst()
+        entry = CachedCode(*row) if row else _NOT_FOUND
+        referral_code_cache.set(code, entry)
+    return None if entry is _NOT_FOUND else entry
+
+
+def _referrer_id(entry: CachedCode | None) -> int | None:
+    if entry is None or not entry.is_active or entry.expiry_date <= timezone.now():
+        return None
+    return entry.user_id
+
+
+def resolve_referrer_id(code: str) -> int | None:
+    """
+    Возвращает идентификатор реферера по коду или None, если код не существует,
+    неактивен или истек. Срок действия проверяется при каждом обращении, поэтому
+    просроченный код из кэша отклоняется без запроса к БД, даже если команда
+    expire_referral_codes еще не деактивировала его.
+    """
+    return _referrer_id(lookup_referral_code(code))
+
+
+async def aresolve_referrer_id(code: str) -> int | None:
+    return _referrer_id(await alookup_referral_code(code))
+
+
+def invalidate_referral_codes(*codes: str) -> None:
+    for code in codes:
+        referral_code_cache.delete(code)
+
+
+@receiver(post_save, sender=ReferralCode)
+def invalidate_saved_code(sender, instance, **kwargs):
+    invalidate_referral_codes(instance.code)
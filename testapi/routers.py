@@ -0,0 +1,183 @@
+import contextvars
+import math
+import random
+from dataclasses import dataclass
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils.decorators import sync_and_async_middleware
+
+from config import get_app_settings
+from testapi.cache import TTLCache
+
+
+SETTINGS = get_app_settings()
+
+REPLICA_LAG_SQL = (
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END'
+)
+
+replica_lags = TTLCache(max_size=64, default_ttl=SETTINGS.db_replica_check_interval)
+
+
+@dataclass
+class PinState:
+    """
+    Состояние текущего запроса: пользователь, закреплен ли он за основной БД
+    и была ли в запросе запись.
+    """
+    user_id: str | None = None
+    pinned: bool = False
+    wrote: bool = False
+
+
+pin_state: contextvars.ContextVar = contextvars.ContextVar('replica_pin_state', default=None)
+
+
+def pin_key(user_id) -> str:
+    return f'replica_pin:{user_id}'
+
+
+def replica_lag(alias: str) -> float:
+    """
+    Возвращает отставание реплики в секундах.
+
+    Для PostgreSQL отставание считается по времени последней воспроизведенной
+    транзакции (0, если реплика воспроизвела все полученные WAL). Для других
+    СУБД репликация не отслеживается и отставание считается нулевым.
+    """
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    with connection.cursor() as cursor:
+        cursor.execute(REPLICA_LAG_SQL)
+        return float(cursor.fetchone()[0])
+
+
+def replica_available(alias: str) -> bool:
+    """
+    Проверяет, можно ли читать с реплики: она настроена, отвечает и отстает
+    не больше db_replica_max_lag секунд. Результат кэшируется в памяти процесса
+    на db_replica_check_interval секунд; ошибка соединения делает реплику
+    недоступной до следующей проверки.
+    """
+    if alias not in settings.DATABASES:
+        return False
+    lag = replica_lags.get(alias)
+    if lag is None:
+        try:
+            lag = replica_lag(alias)
+        except DatabaseError:
+            lag = math.inf
+        replica_lags.set(alias, lag)
+    return lag <= SETTINGS.db_replica_max_lag
+
+
+class ReplicaRouter:
+    """
+    Направляет чтение на реплики из settings.DATABASE_REPLICAS, запись - в основную БД.
+
+    Чтение остается на основной БД, если:
+        - в текущем запросе уже была запись или идет транзакция;
+        - пользователь недавно писал (закреплен на db_replica_sticky_seconds секунд,
+          см. replica_pin_middleware), чтобы он видел свои изменения;
+        - нет доступной реплики с допустимым отставанием.
+    Без настроенных реплик роутер не влияет на выбор БД.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas:
+            return None
+        state = pin_state.get()
+        if state is not None and (state.pinned or state.wrote):
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        available = [alias for alias in replicas if replica_available(alias)]
+        return random.choice(available) if available else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if not settings.DATABASE_REPLICAS:
+            return None
+        state = pin_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+def request_user_id(request) -> str | None:
+    """
+    Возвращает идентификатор пользователя из JWT или сессии без запроса к БД.
+    """
+    # simplejwt импортирует django.test и DRF; промежуточный слой загружается при запуске воркера,
+    # поэтому они подключаются только при первом запросе с включенными репликами
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.exceptions import InvalidToken
+    from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+    authenticator = JWTAuthentication()
+    header = authenticator.get_header(request)
+    raw_token = authenticator.get_raw_token(header) if header else None
+    if raw_token is not None:
+        try:
+            return str(authenticator.get_validated_token(raw_token)[jwt_settings.USER_ID_CLAIM])
+        except (InvalidToken, KeyError):
+            return None
+    session = getattr(request, 'session', None)
+    return session.get('_auth_user_id') if session is not None else None
+
+
+@sync_and_async_middleware
+def replica_pin_middleware(get_response):
+    """
+    Обеспечивает чтение своих записей при работе с репликами.
+
+    Если запрос пользователя что-то записал, пользователь закрепляется за основной БД
+    на db_replica_sticky_seconds секунд. Закрепление хранится в кэше Django, поэтому
+    для нескольких процессов нужен общий кэш.
+    """
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            if not settings.DATABASE_REPLICAS:
+                return await get_response(request)
+            user_id = await sync_to_async(request_user_id)(request)
+            pinned = bool(user_id and await cache.aget(pin_key(user_id)))
+            state = PinState(user_id=user_id, pinned=pinned)
+            token = pin_state.set(state)
+            try:
+                response = await get_response(request)
+            finally:
+                pin_state.reset(token)
+            if state.wrote and user_id:
+                await cache.aset(pin_key(user_id), True, SETTINGS.db_replica_sticky_seconds)
+            return response
+
+        markcoroutinefunction(middleware)
+    else:
+        def middleware(request):
+            if not settings.DATABASE_REPLICAS:
+                return get_response(request)
+            user_id = request_user_id(request)
+            pinned = bool(user_id and cache.get(pin_key(user_id)))
+            state = PinState(user_id=user_id, pinned=pinned)
+            token = pin_state.set(state)
+            try:
+                response = get_response(request)
+            finally:
+                pin_state.reset(token)
+            if state.wrote and user_id:
+                cache.set(pin_key(user_id), True, SETTINGS.db_replica_sticky_seconds)
+            return response
+
+    return middleware
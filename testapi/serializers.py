@@ -1,4 +1,5 @@
 from django.contrib.auth import get_user_model
+from django.contrib.auth.validators import UnicodeUsernameValidator
 from rest_framework import serializers
 from testapi.models import ReferralCode
 
@@ -13,6 +14,20 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ('username', 'password', 'email')
 
 
+class BulkUserSerializer(serializers.ModelSerializer):
+    """
+    Строка пакетной регистрации. Уникальность username проверяется
+    одним запросом на всю пачку (testapi.bulk), а не запросом на каждую строку.
+    """
+    email = serializers.EmailField(required=True)
+    referral_code = serializers.CharField(required=False, allow_blank=True, max_length=20)
+
+    class Meta:
+        model = USER_MODEL
+        fields = ('username', 'password', 'email', 'referral_code')
+        extra_kwargs = {'username': {'validators': [UnicodeUsernameValidator()]}}
+
+
 class ReferralCodeSerializer(serializers.ModelSerializer):
     class Meta:
         model = ReferralCode
@@ -0,0 +1,128 @@
+import gc
+import math
+import os
+from pathlib import Path
+
+from config import AppSettings
+
+
+WORKER_CLASSES = {
+    'sync': 'sync',
+    'gthread': 'gthread',
+    'asgi': 'uvicorn.workers.UvicornWorker',
+}
+
+CGROUP_ROOT = Path('/sys/fs/cgroup')
+
+
+def cgroup_cpu_limit(root: Path = CGROUP_ROOT) -> float | None:
+    """
+    Возвращает ограничение CPU контейнера из cgroup (v2 - cpu.max, v1 - cpu.cfs_quota_us).
+
+    Возвращает:
+        Количество процессоров (может быть дробным) или None, если ограничения нет.
+    """
+    try:
+        quota, _, period = (root / 'cpu.max').read_text().partition(' ')
+        if quota != 'max':
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        quota = int((root / 'cpu' / 'cpu.cfs_quota_us').read_text())
+        period = int((root / 'cpu' / 'cpu.cfs_period_us').read_text())
+    except (OSError, ValueError):
+        return None
+    return quota / period if quota > 0 and period > 0 else None
+
+
+def cpu_count() -> int:
+    """
+    Возвращает количество процессоров, доступных процессу: с учетом привязки к ядрам
+    (sched_getaffinity) и ограничения cgroup, с которым запускаются контейнеры.
+    """
+    available = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+    limit = cgroup_cpu_limit()
+    if limit is not None:
+        available = min(available, math.ceil(limit))
+    return max(available, 1)
+
+
+def worker_count(worker_class: str, cpus: int) -> int:
+    """
+    Возвращает количество воркеров gunicorn для модели worker_class.
+
+    sync    - 2 * cpus + 1: воркер обрабатывает один запрос и простаивает, пока ждет БД или hunter.io;
+    gthread - cpus + 1: ожидание перекрывают потоки воркера;
+    asgi    - cpus: цикл событий воркера сам обслуживает одновременные запросы.
+    """
+    if worker_class == 'sync':
+        return 2 * cpus + 1
+    if worker_class == 'gthread':
+        return cpus + 1
+    return cpus
+
+
+def gunicorn_options(settings: AppSettings, cpus: int | None = None) -> dict:
+    """
+    Собирает параметры gunicorn из настроек gunicorn_* (используется в gunicorn.conf.py).
+
+    Аргументы:
+        settings (AppSettings): Настройки приложения.
+        cpus (int | None): Количество процессоров; по умолчанию cpu_count().
+
+    Возвращает:
+        Словарь с параметрами конфигурации gunicorn.
+    """
+    workers = settings.gunicorn_workers or worker_count(settings.gunicorn_worker_class, cpus or cpu_count())
+    asgi = settings.gunicorn_worker_class == 'asgi'
+    return {
+        'wsgi_app': 'testapi.asgi:application' if asgi else 'testapi.wsgi:application',
+        'bind': settings.gunicorn_bind,
+        'worker_class': WORKER_CLASSES[settings.gunicorn_worker_class],
+        'workers': workers,
+        'threads': settings.gunicorn_threads if settings.gunicorn_worker_class == 'gthread' else 1,
+        'preload_app': settings.gunicorn_preload,
+        'max_requests': settings.gunicorn_max_requests,
+        'max_requests_jitter': settings.gunicorn_max_requests_jitter,
+        'timeout': settings.gunicorn_timeout,
+    }
+
+
+_warmed_up = False
+
+
+def warm_up() -> None:
+    """
+    Загружает в мастер-процессе то, что воркер иначе импортировал бы при первом запросе
+    (ROOT_URLCONF: представления, DRF, simplejwt), закрывает соединения с БД и замораживает
+    сборщик мусора.
+
+    После fork воркеры разделяют эти страницы памяти с мастером (copy-on-write), а gc.freeze()
+    не дает сборщику мусора в воркерах записывать в них и тем самым копировать их.
+    """
+    global _warmed_up
+    if _warmed_up:
+        return
+    from django.db import connections
+    from django.urls import get_resolver
+
+    get_resolver().url_patterns
+    connections.close_all()
+    gc.freeze()
+    _warmed_up = True
+
+
+def pre_fork(server, worker) -> None:
+    if server.cfg.preload_app:
+        warm_up()
+
+
+def child_exit(server, worker) -> None:
+    # Метрики завершившегося воркера (в том числе после max_requests) остаются в сумме,
+    # но его gauge-файлы больше не учитываются
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -9,7 +9,9 @@ https://docs.djangoproject.com/en/5.0/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
+import os
 import sys
+import tempfile
 from pathlib import Path
 from config import get_app_settings
 from datetime import timedelta
@@ -48,14 +50,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'testapi.instrumentation.performance_middleware',
+    'testapi.profiling.profiling_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'testapi.routers.replica_pin_middleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'testapi.static.static_files_middleware',
 ]
 
 ROOT_URLCONF = 'testapi.urls'
@@ -86,22 +91,44 @@ WSGI_APPLICATION = 'testapi.wsgi.application'
 
 
 
+# Постоянные соединения или пул psycopg настраиваются переменными DB_* (см. AppSettings.database_settings)
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': settings.postgres_db,
-        'USER': settings.postgres_user,
-        'PASSWORD': settings.postgres_password,
-        'HOST': settings.postgres_host,
-        'PORT': settings.postgres_port,
-    }
+    'default': settings.database_settings(),
+    **settings.replica_database_settings(),
 }
 if 'test' in sys.argv or 'test_coverage' in sys.argv:
-    DATABASES['default'] = {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': ':memory:',
+    # Тестовая БД - файл SQLite, а не :memory:, чтобы тесты с потоками работали с отдельными
+    # соединениями; BEGIN IMMEDIATE и timeout выстраивают пишущие транзакции в очередь
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': ':memory:',
+            'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 30},
+            'TEST': {'NAME': str(Path(tempfile.gettempdir()) / f'testapi_test_{os.getpid()}.sqlite3')},
+        },
+        # Отдельная БД для тестов маршрутизации чтения на реплики
+        'replica': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': ':memory:',
+        },
     }
 
+# Для нескольких процессов нужен общий кэш (например, django.core.cache.backends.redis.RedisCache):
+# в нем хранятся версии реферальных данных, кэш ответов и закрепление за основной БД
+CACHES = {
+    'default': {
+        'BACKEND': settings.cache_backend,
+        'LOCATION': settings.cache_location,
+    }
+}
+
+# Чтение направляется на реплики роутером testapi.routers.ReplicaRouter
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias.startswith('replica_')]
+DATABASE_ROUTERS = ['testapi.routers.ReplicaRouter']
+
+# Асинхронный вход (AsyncUserLoginView) проверяет пароль через aauthenticate этого бэкенда вне цикла событий
+AUTHENTICATION_BACKENDS = ['testapi.backends.OffloadedHashingBackend']
+
 
 
 # Password validation
@@ -171,6 +198,15 @@ SERVER_EMAIL = EMAIL_HOST_USER
 EMAIL_ADMIN = EMAIL_HOST_USER
 
 STATIC_URL = 'testapi/static/'
+
+# Заранее построенная схема OpenAPI (команда generate_openapi_schema), Swagger UI читает ее по SPEC_URL
+OPENAPI_SCHEMA_DIR = BASE_DIR / 'testapi' / 'openapi'
+# Каталог профилей запросов (testapi.profiling)
+PROFILES_DIR = Path(settings.profiling_dir) if settings.profiling_dir else BASE_DIR / 'profiles'
+
+SWAGGER_SETTINGS = {
+    'SPEC_URL': 'openapi-json',
+}
 if not DEBUG:
     STATIC_ROOT = 'testapi/staticfiles'
     STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
\ No newline at end of file
@@ -0,0 +1,31 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.utils.decorators import sync_and_async_middleware
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+@sync_and_async_middleware
+def static_files_middleware(get_response):
+    """
+    Отдает статические файлы через WhiteNoise, не делая синхронной остальную цепочку.
+
+    WhiteNoiseMiddleware поддерживает только синхронный режим, поэтому под ASGI Django
+    оборачивал бы в async_to_sync/sync_to_async каждый запрос, и асинхронное представление
+    занимало бы поток на все время запроса. В асинхронном режиме в поток передается
+    только отдача найденного статического файла, остальные запросы идут дальше без переходов.
+    """
+
+    whitenoise = WhiteNoiseMiddleware(get_response)
+    if not iscoroutinefunction(get_response):
+        return whitenoise
+
+    async def middleware(request):
+        if whitenoise.autorefresh:
+            static_file = await sync_to_async(whitenoise.find_file)(request.path_info)
+        else:
+            static_file = whitenoise.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(whitenoise.serve)(static_file, request)
+        return await get_response(request)
+
+    markcoroutinefunction(middleware)
+    return middleware
@@ -0,0 +1,54 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count
+
+from testapi.models import Referral, ReferralCode, ReferralStats
+
+
+USER_MODEL = get_user_model()
+
+
+def rebuild_stats_batch(user_ids: list) -> int:
+    """
+    Пересчитывает счетчики ReferralStats для пачки пользователей с нуля.
+
+    signups восстанавливается по текущим рефералам, так как удаленные
+    рефералы в базе не хранятся.
+
+    Возвращает:
+        Количество записанных строк.
+    """
+    referrals = dict(Referral.objects.filter(referrer_id__in=user_ids)
+                     .values('referrer_id').annotate(total=Count('id')).values_list('referrer_id', 'total'))
+    codes = dict(ReferralCode.objects.filter(user_id__in=user_ids)
+                 .values('user_id').annotate(total=Count('id')).values_list('user_id', 'total'))
+    rows = [ReferralStats(user_id=user_id,
+                          direct_referrals=referrals.get(user_id, 0),
+                          signups=referrals.get(user_id, 0),
+                          codes_issued=codes.get(user_id, 0))
+            for user_id in user_ids if user_id in referrals or user_id in codes]
+    with transaction.atomic():
+        ReferralStats.objects.filter(user_id__in=user_ids).exclude(
+            user_id__in=[row.user_id for row in rows]).delete()
+        ReferralStats.objects.bulk_create(rows, update_conflicts=True, unique_fields=['user'],
+                                          update_fields=['direct_referrals', 'signups', 'codes_issued'])
+    return len(rows)
+
+
+def rebuild_stats(batch_size: int = 1000):
+    """
+    Пересчитывает счетчики всех пользователей пачками по batch_size, по возрастанию первичного ключа.
+
+    Каждая пачка обрабатывается в отдельной короткой транзакции.
+
+    Возвращает:
+        Генератор кортежей (обработано пользователей, записано строк) по каждой пачке.
+    """
+    last_id = 0
+    while True:
+        user_ids = list(USER_MODEL.objects.filter(pk__gt=last_id).order_by('pk')
+                        .values_list('pk', flat=True)[:batch_size])
+        if not user_ids:
+            return
+        yield len(user_ids), rebuild_stats_batch(user_ids)
+        last_id = user_ids[-1]
@@ -0,0 +1,184 @@
+import json
+import socketserver
+import threading
+import time
+from email import message_from_bytes
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class HunterStubServer:
+    """
+    Локальная заглушка API hunter.io email-verifier для тестов и нагрузочных прогонов.
+
+    Сервер запускается в отдельном потоке на свободном порту 127.0.0.1 и отвечает
+    в формате hunter.io: {"data": {"email": ..., "status": ...}}.
+
+    Атрибуты:
+        statuses: Статусы для конкретных адресов; остальные получают default_status.
+        default_status: Статус по умолчанию.
+        delay: Задержка ответа в секундах.
+        fail_times: Сколько следующих запросов завершить ответом error_code.
+        error_code: HTTP-код ответа для искусственных ошибок.
+        requests: Список адресов из полученных запросов.
+    """
+
+    def __init__(self, statuses: dict | None = None, default_status: str = 'valid',
+                 delay: float = 0.0) -> None:
+        self.statuses = statuses or {}
+        self.default_status = default_status
+        self.delay = delay
+        self.fail_times = 0
+        self.error_code = 503
+        self.requests: list = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/v2/email-verifier'
+
+    def _next_failure(self) -> bool:
+        with self._lock:
+            if self.fail_times > 0:
+                self.fail_times -= 1
+                return True
+            return False
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                email = parse_qs(urlparse(self.path).query).get('email', [''])[0]
+                with stub._lock:
+                    stub.requests.append(email)
+                if stub.delay:
+                    time.sleep(stub.delay)
+                if stub._next_failure():
+                    self._send(stub.error_code, {'errors': [{'id': 'stub_error'}]})
+                    return
+                status = stub.statuses.get(email.lower(), stub.default_status)
+                self._send(200, {'data': {'email': email, 'status': status}})
+
+            def _send(self, code, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> 'HunterStubServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'HunterStubServer':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+class SmtpSinkServer:
+    """
+    Локальный SMTP-сервер, который принимает и складывает письма в память, ничего не отправляя.
+
+    Используется нагрузочными прогонами вместо почтового сервера: send_outbox отправляет
+    письма на 127.0.0.1:port без TLS. AUTH принимается с любыми учетными данными.
+
+    Атрибуты:
+        messages: Список полученных писем (email.message.Message) с полями from_addr и recipients.
+    """
+
+    def __init__(self) -> None:
+        self.messages: list = []
+        self._lock = threading.Lock()
+        self._server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def host(self) -> str:
+        return self._server.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def _make_handler(self):
+        sink = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line: str) -> None:
+                self.wfile.write(f'{line}\r\n'.encode())
+
+            def handle(self):
+                self.reply('220 smtp-sink ready')
+                from_addr, recipients = None, []
+                while line := self.rfile.readline():
+                    command = line.decode(errors='replace').strip()
+                    verb = command.split(' ', 1)[0].upper()
+                    if verb == 'EHLO':
+                        self.reply('250-smtp-sink')
+                        self.reply('250 AUTH PLAIN LOGIN')
+                    elif verb in ('HELO', 'NOOP'):
+                        self.reply('250 OK')
+                    elif verb == 'AUTH':
+                        self.reply('235 Authentication successful')
+                    elif verb == 'MAIL':
+                        from_addr, recipients = command.split(':', 1)[1].strip(' <>'), []
+                        self.reply('250 OK')
+                    elif verb == 'RCPT':
+                        recipients.append(command.split(':', 1)[1].strip(' <>'))
+                        self.reply('250 OK')
+                    elif verb == 'DATA':
+                        self.reply('354 End data with <CR><LF>.<CR><LF>')
+                        lines = []
+                        while (data := self.rfile.readline()) not in (b'.\r\n', b'.\n', b''):
+                            lines.append(data[1:] if data.startswith(b'..') else data)
+                        message = message_from_bytes(b''.join(lines))
+                        message.from_addr, message.recipients = from_addr, recipients
+                        with sink._lock:
+                            sink.messages.append(message)
+                        self.reply('250 OK')
+                    elif verb == 'RSET':
+                        from_addr, recipients = None, []
+                        self.reply('250 OK')
+                    elif verb == 'QUIT':
+                        self.reply('221 Bye')
+                        return
+                    else:
+                        self.reply('502 Command not implemented')
+
+        return Handler
+
+    def start(self) -> 'SmtpSinkServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'SmtpSinkServer':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
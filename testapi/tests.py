@@ -1,11 +1,67 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
 from rest_framework.test import APIClient
 from rest_framework import status
-from django.urls import reverse
-from testapi.models import ReferralCode, Referral
+from django.urls import clear_url_caches, resolve, reverse
+from testapi.models import (ReferralCode, Referral, PendingRegistration, EmailOutbox, ReferralClosure,
+                            ReferralStats, ApiQuotaUsage)
+from testapi.stats import rebuild_stats
+from testapi.expiry import sweep_expired_codes
+from testapi import bulk
+from testapi.bulk import bulk_register, verify_emails
+from testapi.hashing import hash_passwords, acheck_password, ahash_password
+from testapi.async_views import (AsyncReferralCodeView, AsyncReferralInfoView, AsyncUserLoginView,
+                                 AsyncUserRegistrationView)
+from testapi.verification import averify_email
+from testapi.verifier_client import AsyncEmailVerifierClient
+from testapi.routers import ReplicaRouter, replica_lags
+from testapi.openapi import load_schema, render_schema
+from testapi.instrumentation import REGISTRY
+from testapi.profiling import HEADER, _profiler_lock, _sample_rates, get_sample_rate, get_store, make_token, set_sample_rate
+from testapi.server import cgroup_cpu_limit, cpu_count, gunicorn_options, worker_count
+from testapi.versioning import get_version
+import gzip
+import importlib
+import brotli
+from pathlib import Path
+from testapi.coalescing import AsyncSingleFlight
+from rest_framework_simplejwt.tokens import AccessToken
+import asyncio
+from django.test import AsyncRequestFactory, RequestFactory
+from django.contrib.auth.signals import user_login_failed
+from django.core.handlers.asgi import ASGIHandler
+from testapi.codes import CodeSpaceExhausted, FeistelCodeGenerator, SequenceAllocator, HUMAN_ALPHABET, get_code_generator
+from testapi.referral_cache import referral_code_cache, resolve_referrer_id
+from testapi.outbox import OutboxSender
+from django.core import mail
+from django.core.cache import cache
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+import unittest
+import subprocess
+import sys
+import time
+import os
+import tempfile
+from django.core.management import call_command
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, check_password
+from asgiref.sync import async_to_sync, sync_to_async
 from django.contrib.auth import get_user_model
 import json
-from dateutil import parser
+from datetime import timedelta
+from django.utils import timezone
+from unittest import mock
+from testapi.cache import TTLCache
+from testapi.verification import verification_cache, verify_email
+from testapi.coalescing import SingleFlight
+from testapi.quota import SharedQuota
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from testapi.stubs import HunterStubServer, SmtpSinkServer
+from testapi.verifier_client import (CircuitBreaker, CircuitOpenError, EmailVerifierClient,
+                                     VerifierUnavailable, get_verifier_client)
+from testapi.workers import process_registration, claim_registrations, record_crash
+from config import AppSettings, get_app_settings
+from pydantic import ValidationError
 
 
 VALID_USERNAME = 'katana'
@@ -14,17 +70,26 @@ VALID_REF_CODE = 'testing'
 INVALID_EMAIL = 'aaassddda222h@gmail.com'
 PASSWORD ='nevermore'
 USER_MODEL = get_user_model()
+SETTINGS = get_app_settings()
 
 class UserRegistrationViewTestCase(TestCase):
     def setUp(self):
         self.client = APIClient()
+        verification_cache.clear()
+        get_verifier_client.cache_clear()
+        self.hunter = HunterStubServer(statuses={INVALID_EMAIL: 'invalid'}).start()
+        self.patch = mock.patch.object(SETTINGS, 'eh_api_url', self.hunter.url)
+        self.patch.start()
+        self.addCleanup(self.hunter.stop)
+        self.addCleanup(self.patch.stop)
+        self.addCleanup(get_verifier_client.cache_clear)
+        self.addCleanup(verification_cache.clear)
         self.user_test = USER_MODEL.objects.create_user(
             username=VALID_USERNAME + '1',
             password=PASSWORD + '1',
             email=VALID_EMAIL)
         
-        date_object = parser.parse('2024.12.22')
-        expiry_date = date_object.strftime("%Y-%m-%d")
+        expiry_date = timezone.now() + timedelta(days=30)
         
         ReferralCode.objects.create(
             user = self.user_test,
@@ -181,7 +246,8 @@ class ReferralCodeViewTestCase(TestCase):
         
         self.invalid_client.force_authenticate(user=self.invalid_user)
         self.client.force_authenticate(user=self.user)
-        self.referral_code = ReferralCode.objects.create(user=self.user, expiry_date='2024-12-31')
+        self.referral_code = ReferralCode.objects.create(user=self.user,
+                                                         expiry_date=timezone.now() + timedelta(days=30))
 
     def test_get_referral_code(self):
         response = self.client.get(reverse('ref-code'))
@@ -196,7 +262,7 @@ class ReferralCodeViewTestCase(TestCase):
 
     def test_post_referral_code(self):
         valid_payload = {
-            'expiry_date': '2024-12-31'
+            'expiry_date': (timezone.now() + timedelta(days=30)).strftime('%Y-%m-%d')
         }
         response = self.client.post(
             reverse('ref-code'),
@@ -259,4 +325,1383 @@ class ReferralInfoViewTestCase(TestCase):
     def test_get_referral_info(self):
         response = self.client.get(reverse('ref-info'))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data['referrals'], ['referraluser'])
\ No newline at end of file
+        self.assertEqual(response.data['referrals'], ['referraluser'])
+
+
+class EmailVerificationCacheTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        verification_cache.clear()
+
+    def tearDown(self):
+        verification_cache.clear()
+
+    def test_ttl_cache_expiry_and_eviction(self):
+        cache = TTLCache(max_size=2, default_ttl=60)
+        cache.set('a', True)
+        cache.set('b', False, ttl=-1)
+        self.assertIsNone(cache.get('b'))
+        cache.set('c', True)
+        self.assertTrue(cache.get('a'))
+        cache.set('d', True)
+        self.assertIsNone(cache.get('c'))
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    @mock.patch('testapi.verification.fetch_email_status', return_value='valid')
+    def test_verify_email_uses_normalized_cache(self, fetch):
+        self.assertTrue(verify_email(' Crymorebch@Gmail.com '))
+        self.assertTrue(verify_email('crymorebch@gmail.com'))
+        fetch.assert_called_once_with('crymorebch@gmail.com')
+        self.assertEqual(verification_cache.hits, 1)
+        self.assertEqual(verification_cache.misses, 1)
+
+    @mock.patch('testapi.verification.fetch_email_status', return_value='invalid')
+    def test_negative_result_is_cached(self, fetch):
+        self.assertFalse(verify_email(INVALID_EMAIL))
+        self.assertFalse(verify_email(INVALID_EMAIL))
+        fetch.assert_called_once()
+
+    @mock.patch('testapi.verification.fetch_email_status')
+    def test_registration_skips_hunter_on_cache_hit(self, fetch):
+        verification_cache.set(VALID_EMAIL, True)
+        response = self.client.post(
+            reverse('registration'),
+            data=json.dumps({'username': VALID_USERNAME, 'password': PASSWORD, 'email': VALID_EMAIL}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        fetch.assert_not_called()
+
+
+
+class AsyncRegistrationTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        verification_cache.clear()
+        self.hunter = HunterStubServer(statuses={INVALID_EMAIL: 'invalid'}).start()
+        self.patches = [
+            mock.patch.object(SETTINGS, 'registration_async', True),
+            mock.patch.object(SETTINGS, 'eh_api_url', self.hunter.url),
+        ]
+        for patch in self.patches:
+            patch.start()
+        get_verifier_client.cache_clear()
+        self.referrer = USER_MODEL.objects.create_user(username='referrer', password=PASSWORD)
+        ReferralCode.objects.create(user=self.referrer, code=VALID_REF_CODE, expiry_date='2099-12-31')
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        get_verifier_client.cache_clear()
+        self.hunter.stop()
+        verification_cache.clear()
+
+    def register(self, **extra):
+        payload = {'username': VALID_USERNAME, 'password': PASSWORD, 'email': VALID_EMAIL, **extra}
+        return self.client.post(reverse('registration'), data=json.dumps(payload),
+                                content_type='application/json')
+
+    def test_accepts_and_activates_in_background(self):
+        response = self.register(referral_code=VALID_REF_CODE)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(self.hunter.requests, [])
+        user = USER_MODEL.objects.get(username=VALID_USERNAME)
+        self.assertFalse(user.is_active)
+
+        self.assertEqual(claim_registrations(10), [PendingRegistration.objects.get().id])
+        process_registration(response.data['id'])
+
+        user.refresh_from_db()
+        self.assertTrue(user.is_active)
+        self.assertTrue(Referral.objects.filter(referrer=self.referrer, referral=user).exists())
+        status_response = self.client.get(response['Location'])
+        self.assertEqual(status_response.data['status'], PendingRegistration.ACTIVE)
+
+    def test_invalid_email_rejects_and_frees_username(self):
+        response = self.register(email=INVALID_EMAIL)
+        process_registration(response.data['id'])
+        registration = PendingRegistration.objects.get(id=response.data['id'])
+        self.assertEqual(registration.status, PendingRegistration.REJECTED)
+        self.assertEqual(registration.error, 'Invalid email address')
+        self.assertFalse(USER_MODEL.objects.filter(username=VALID_USERNAME).exists())
+
+    def test_upstream_error_is_retried_with_backoff(self):
+        self.hunter.fail_times = 1
+        response = self.register()
+        process_registration(response.data['id'])
+        registration = PendingRegistration.objects.get(id=response.data['id'])
+        self.assertEqual(registration.status, PendingRegistration.PENDING)
+        self.assertEqual(registration.attempts, 1)
+        self.assertGreater(registration.next_attempt_at, registration.updated_at)
+        self.assertEqual(claim_registrations(10), [])
+
+        process_registration(registration.id)
+        registration.refresh_from_db()
+        self.assertEqual(registration.status, PendingRegistration.ACTIVE)
+
+    def test_unknown_registration_status(self):
+        response = self.client.get(reverse('registration-status', args=['00000000-0000-0000-0000-000000000000']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_crash_counts_as_attempt(self):
+        response = self.register()
+        with mock.patch('testapi.workers.verify_email', side_effect=RuntimeError('boom')), \
+                mock.patch.object(SETTINGS, 'registration_max_attempts', 2):
+            for attempts, expected in [(1, PendingRegistration.PENDING), (2, PendingRegistration.FAILED)]:
+                PendingRegistration.objects.update(next_attempt_at=timezone.now())
+                [registration_id] = claim_registrations(10)
+                with self.assertRaises(RuntimeError) as raised:
+                    process_registration(registration_id)
+                record_crash(registration_id, raised.exception)
+                registration = PendingRegistration.objects.get()
+                self.assertEqual((registration.status, registration.attempts), (expected, attempts))
+        self.assertIn('boom', registration.error)
+        self.assertFalse(USER_MODEL.objects.filter(username=VALID_USERNAME).exists())
+
+    def test_expired_lease_counts_as_attempt(self):
+        response = self.register()
+        stale = timezone.now() - timedelta(seconds=SETTINGS.registration_lease_timeout + 1)
+        with mock.patch.object(SETTINGS, 'registration_max_attempts', 2):
+            self.assertEqual([str(id) for id in claim_registrations(10)], [response.data['id']])
+            PendingRegistration.objects.update(updated_at=stale)
+            self.assertEqual([str(id) for id in claim_registrations(10)], [response.data['id']])
+            registration = PendingRegistration.objects.get()
+            self.assertEqual((registration.status, registration.attempts), (PendingRegistration.PROCESSING, 1))
+            PendingRegistration.objects.update(updated_at=stale)
+            self.assertEqual(claim_registrations(10), [])
+        registration.refresh_from_db()
+        self.assertEqual((registration.status, registration.attempts), (PendingRegistration.FAILED, 2))
+        self.assertIsNone(registration.user)
+        self.assertFalse(USER_MODEL.objects.filter(username=VALID_USERNAME).exists())
+
+
+
+class EmailVerifierClientTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        verification_cache.clear()
+        self.hunter = HunterStubServer(statuses={INVALID_EMAIL: 'invalid'}).start()
+
+    def tearDown(self):
+        self.hunter.stop()
+        get_verifier_client.cache_clear()
+        verification_cache.clear()
+
+    def make_client(self, read_timeout=5.0, failure_threshold=2):
+        return EmailVerifierClient(url=self.hunter.url, api_key='key', connect_timeout=1.0,
+                                   read_timeout=read_timeout, pool_size=2,
+                                   breaker=CircuitBreaker(failure_threshold=failure_threshold,
+                                                          reset_timeout=60))
+
+    def test_statuses_and_metrics(self):
+        verifier = self.make_client()
+        self.assertEqual(verifier.get_status(VALID_EMAIL), 'valid')
+        self.assertEqual(verifier.get_status(INVALID_EMAIL), 'invalid')
+        metrics = verifier.metrics.snapshot()
+        self.assertEqual(metrics['requests'], 2)
+        self.assertEqual(metrics['errors'], 0)
+        self.assertGreater(metrics['latency_max'], 0)
+
+    def test_breaker_opens_and_fails_fast(self):
+        verifier = self.make_client()
+        self.hunter.fail_times = 2
+        for _ in range(2):
+            with self.assertRaises(VerifierUnavailable):
+                verifier.get_status(VALID_EMAIL)
+        with self.assertRaises(CircuitOpenError):
+            verifier.get_status(VALID_EMAIL)
+        self.assertEqual(len(self.hunter.requests), 2)
+        self.assertEqual(verifier.metrics.snapshot()['short_circuits'], 1)
+
+    def test_half_open_probe_closes_breaker(self):
+        verifier = self.make_client(failure_threshold=1)
+        self.hunter.fail_times = 1
+        with self.assertRaises(VerifierUnavailable):
+            verifier.get_status(VALID_EMAIL)
+        verifier.breaker.reset_timeout = 0
+        self.assertEqual(verifier.get_status(VALID_EMAIL), 'valid')
+        self.assertEqual(verifier.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_read_timeout(self):
+        self.hunter.delay = 0.5
+        with self.assertRaises(VerifierUnavailable):
+            self.make_client(read_timeout=0.1).get_status(VALID_EMAIL)
+
+    def register_while_unavailable(self, policy):
+        self.hunter.fail_times = 1
+        payload = {'username': VALID_USERNAME, 'password': PASSWORD, 'email': VALID_EMAIL}
+        with mock.patch.object(SETTINGS, 'eh_api_url', self.hunter.url), \
+                mock.patch.object(SETTINGS, 'eh_unavailable_policy', policy):
+            get_verifier_client.cache_clear()
+            return self.client.post(reverse('registration'), data=json.dumps(payload),
+                                    content_type='application/json')
+
+    def test_unavailable_policy_reject(self):
+        response = self.register_while_unavailable('reject')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertFalse(USER_MODEL.objects.filter(username=VALID_USERNAME).exists())
+
+    def test_unavailable_policy_allow(self):
+        response = self.register_while_unavailable('allow')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIsNone(verification_cache.get(VALID_EMAIL))
+
+
+
+class VerificationCoalescingTestCase(TestCase):
+    def setUp(self):
+        verification_cache.clear()
+        self.hunter = HunterStubServer(delay=0.2).start()
+        self.patch = mock.patch.object(SETTINGS, 'eh_api_url', self.hunter.url)
+        self.patch.start()
+        get_verifier_client.cache_clear()
+
+    def tearDown(self):
+        self.patch.stop()
+        get_verifier_client.cache_clear()
+        self.hunter.stop()
+        verification_cache.clear()
+
+    def test_single_flight_shares_result(self):
+        flight = SingleFlight()
+        barrier = threading.Barrier(5)
+        calls = []
+
+        def slow():
+            calls.append(1)
+            threading.Event().wait(0.2)
+            return 'valid'
+
+        def call():
+            barrier.wait()
+            return flight.do('key', slow)
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            results = list(executor.map(lambda _: call(), range(5)))
+        self.assertEqual(results, ['valid'] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_concurrent_lookups_make_one_request(self):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(verify_email, [VALID_EMAIL.upper(), VALID_EMAIL] * 4))
+        self.assertTrue(all(results))
+        self.assertEqual(self.hunter.requests, [VALID_EMAIL])
+
+    def test_shared_quota(self):
+        first, second = SharedQuota('test', capacity=2, period=3600), SharedQuota('test', capacity=2, period=3600)
+        self.assertTrue(first.try_acquire())
+        self.assertTrue(second.try_acquire())
+        self.assertFalse(first.acquire(timeout=0.01))
+        self.assertFalse(async_to_sync(second.aacquire)(timeout=0.01))
+        self.assertTrue(SharedQuota('other', capacity=2, period=3600).try_acquire())
+        with mock.patch('testapi.quota.time.time', return_value=time.time() + 3600):
+            self.assertTrue(first.try_acquire())
+        self.assertEqual(ApiQuotaUsage.objects.filter(name='test').count(), 1)
+
+    def test_quota_exhausted_is_unavailable(self):
+        with mock.patch('testapi.verification.quota', SharedQuota('hunter.io', capacity=1, period=3600)):
+            self.assertTrue(verify_email(VALID_EMAIL))
+            with self.assertRaises(VerifierUnavailable):
+                verify_email('other@gmail.com')
+
+
+
+class EmailOutboxTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = USER_MODEL.objects.create_user(username=VALID_USERNAME, password=PASSWORD, email=VALID_EMAIL)
+        self.client.force_authenticate(user=self.user)
+        self.referral_code = ReferralCode.objects.create(user=self.user, expiry_date='2099-12-31')
+
+    def test_get_enqueues_instead_of_sending(self):
+        response = self.client.get(reverse('ref-code'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(mail.outbox), 0)
+        message = EmailOutbox.objects.get()
+        self.assertEqual(message.recipients, [VALID_EMAIL])
+        self.assertIn(self.referral_code.code, message.body)
+
+    def test_sender_drains_over_one_connection(self):
+        for _ in range(3):
+            self.client.get(reverse('ref-code'))
+        with mock.patch('testapi.outbox.get_connection', wraps=mail.get_connection) as get_connection:
+            self.assertEqual(OutboxSender(batch_size=2).drain(), (3, 0))
+        get_connection.assert_called_once()
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(EmailOutbox.objects.exclude(status=EmailOutbox.SENT).exists())
+
+    def test_failed_message_is_retried_then_dead_lettered(self):
+        self.client.get(reverse('ref-code'))
+        with mock.patch.object(SETTINGS, 'outbox_max_attempts', 2), \
+                mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages',
+                           side_effect=ConnectionError('smtp down')):
+            self.assertEqual(OutboxSender().drain(), (0, 1))
+            message = EmailOutbox.objects.get()
+            self.assertEqual((message.status, message.attempts), (EmailOutbox.PENDING, 1))
+
+            EmailOutbox.objects.update(next_attempt_at=message.created_at)
+            OutboxSender().drain()
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.last_error), (EmailOutbox.DEAD, 'smtp down'))
+
+    def test_sender_delivers_to_smtp_sink(self):
+        self.client.get(reverse('ref-code'))
+        with SmtpSinkServer() as sink, override_settings(
+                EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend', EMAIL_HOST=sink.host,
+                EMAIL_PORT=sink.port, EMAIL_USE_SSL=False, EMAIL_USE_TLS=False, EMAIL_HOST_PASSWORD=''):
+            self.assertEqual(OutboxSender().drain(), (1, 0))
+        self.assertEqual(len(sink.messages), 1)
+        self.assertEqual(sink.messages[0].recipients, [VALID_EMAIL])
+        self.assertIn(self.referral_code.code, sink.messages[0].get_payload())
+
+
+
+class ReferralInfoPaginationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = USER_MODEL.objects.create_user(username=VALID_USERNAME, password=PASSWORD)
+        self.client.force_authenticate(user=self.user)
+        for index in range(5):
+            referral = USER_MODEL.objects.create_user(username=f'referral{index}')
+            Referral.objects.create(referrer=self.user, referral=referral)
+
+    def test_pages_follow_cursor_with_one_query(self):
+        usernames = []
+        cursor = ''
+        while cursor is not None:
+            with self.assertNumQueries(1):
+                response = self.client.get(reverse('ref-info'), {'page_size': 2, 'cursor': cursor or 0})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            usernames += response.data['referrals']
+            cursor = response.data['next_cursor']
+        self.assertEqual(usernames, [f'referral{index}' for index in range(5)])
+
+    def test_count_is_cached(self):
+        response = self.client.get(reverse('ref-info'), {'count': 'true'})
+        self.assertEqual(response.data['count'], 5)
+        Referral.objects.create(referrer=self.user, referral=USER_MODEL.objects.create_user(username='late'))
+        response = self.client.get(reverse('ref-info'), {'count': 'true'})
+        self.assertEqual(response.data['count'], 5)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('ref-info'), {'cursor': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+
+class ReferralTreeTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.users = {name: USER_MODEL.objects.create_user(username=name) for name in 'abcde'}
+        self.client.force_authenticate(user=self.users['a'])
+        for referrer, referral in ['ab', 'bc', 'ad', 'ce']:
+            Referral.objects.create(referrer=self.users[referrer], referral=self.users[referral])
+
+    def paths(self):
+        return set(ReferralClosure.objects.values_list('ancestor__username', 'descendant__username', 'depth'))
+
+    def test_closure_is_maintained_on_create(self):
+        self.assertIn(('a', 'e', 3), self.paths())
+        self.assertEqual(len(self.paths()), 7)
+
+    def test_rebuild_matches_incremental(self):
+        incremental = self.paths()
+        self.assertEqual(ReferralClosure.rebuild(), len(incremental))
+        self.assertEqual(self.paths(), incremental)
+
+    def test_closure_is_maintained_on_delete(self):
+        Referral.objects.get(referrer=self.users['b'], referral=self.users['c']).delete()
+        self.assertEqual(self.paths(), {('a', 'b', 1), ('a', 'd', 1), ('c', 'e', 1)})
+        Referral.objects.create(referrer=self.users['d'], referral=self.users['c'])
+        Referral.objects.create(referrer=self.users['b'], referral=self.users['c'])
+        Referral.objects.get(referrer=self.users['d'], referral=self.users['c']).delete()
+        self.assertIn(('a', 'e', 3), self.paths())
+        self.assertNotIn(('d', 'e', 2), self.paths())
+        self.users['b'].delete()
+        self.assertEqual(self.paths(), {('a', 'd', 1), ('c', 'e', 1)})
+        incremental = self.paths()
+        ReferralClosure.rebuild()
+        self.assertEqual(self.paths(), incremental)
+
+    def test_level_counts(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('ref-tree'), {'depth': 2})
+        self.assertEqual(response.data['levels'], [{'depth': 1, 'count': 2}, {'depth': 2, 'count': 1}])
+        self.assertEqual(response.data['total'], 3)
+
+    def test_tree(self):
+        response = self.client.get(reverse('ref-tree'), {'depth': 3, 'view': 'tree'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['tree'], {'username': 'a', 'children': [
+            {'username': 'b', 'children': [{'username': 'c', 'children': [{'username': 'e', 'children': []}]}]},
+            {'username': 'd', 'children': []},
+        ]})
+
+    def test_invalid_depth(self):
+        response = self.client.get(reverse('ref-tree'), {'depth': 100})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+
+class ReferralStatsTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.top = USER_MODEL.objects.create_user(username='top')
+        self.second = USER_MODEL.objects.create_user(username='second')
+        self.client.force_authenticate(user=self.top)
+        ReferralCode.objects.create(user=self.top, expiry_date='2099-12-31')
+        for index in range(3):
+            Referral.objects.create(referrer=self.top, referral=USER_MODEL.objects.create_user(username=f'r{index}'))
+        Referral.objects.create(referrer=self.second, referral=USER_MODEL.objects.create_user(username='r3'))
+
+    def test_counters_follow_referrals(self):
+        stats = ReferralStats.objects.get(user=self.top)
+        self.assertEqual((stats.direct_referrals, stats.signups, stats.codes_issued), (3, 3, 1))
+        Referral.objects.filter(referrer=self.top).first().delete()
+        stats.refresh_from_db()
+        self.assertEqual((stats.direct_referrals, stats.signups), (2, 3))
+
+    def test_leaderboard(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('leaderboard'), {'limit': 5})
+        self.assertEqual([row['username'] for row in response.data['leaderboard']], ['top', 'second'])
+        self.assertEqual(response.data['leaderboard'][0]['direct_referrals'], 3)
+
+    def test_rebuild_repairs_drift(self):
+        ReferralStats.objects.filter(user=self.top).update(direct_referrals=100, codes_issued=0)
+        ReferralStats.objects.create(user=USER_MODEL.objects.create_user(username='ghost'), direct_referrals=5)
+        batches = list(rebuild_stats(batch_size=2))
+        self.assertEqual(sum(users for users, _ in batches), USER_MODEL.objects.count())
+        stats = ReferralStats.objects.get(user=self.top)
+        self.assertEqual((stats.direct_referrals, stats.codes_issued), (3, 1))
+        self.assertFalse(ReferralStats.objects.filter(user__username='ghost').exists())
+
+
+
+class ReferralConstraintsTestCase(TestCase):
+    def setUp(self):
+        self.user = USER_MODEL.objects.create_user(username=VALID_USERNAME)
+        self.other = USER_MODEL.objects.create_user(username='other')
+
+    def test_one_active_code_per_user(self):
+        ReferralCode.objects.create(user=self.user, expiry_date='2099-12-31')
+        ReferralCode.objects.create(user=self.user, expiry_date='2099-12-31', is_active=False)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ReferralCode.objects.create(user=self.user, expiry_date='2099-12-31')
+
+    def test_unique_referral_pair(self):
+        Referral.objects.create(referrer=self.user, referral=self.other)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Referral.objects.create(referrer=self.user, referral=self.other)
+
+
+
+class ReferralConstraintsMigrationTestCase(TransactionTestCase):
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.migrate(target)
+        return executor.loader.project_state(target).apps
+
+    def test_removed_duplicates_are_not_counted_in_stats(self):
+        self.addCleanup(lambda: self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes()))
+        apps = self.migrate([('testapi', '0007_referralstats')])
+        user_model = apps.get_model(USER_MODEL._meta.app_label, USER_MODEL._meta.model_name)
+        Referral = apps.get_model('testapi', 'Referral')
+        ReferralStats = apps.get_model('testapi', 'ReferralStats')
+        referrer, first, second = (user_model.objects.create(username=name) for name in ('referrer', 'first', 'second'))
+        Referral.objects.bulk_create([Referral(referrer=referrer, referral=first),
+                                      Referral(referrer=referrer, referral=first),
+                                      Referral(referrer=referrer, referral=second)])
+        # Так счетчики заполнила 0007: вместе с дубликатом
+        ReferralStats.objects.create(user_id=referrer.id, direct_referrals=3, signups=3)
+        apps = self.migrate([('testapi', '0008_referral_constraints')])
+        stats = apps.get_model('testapi', 'ReferralStats').objects.get(user_id=referrer.id)
+        self.assertEqual((stats.direct_referrals, stats.signups), (2, 2))
+
+
+class ReferralCodeCacheTestCase(TestCase):
+    def setUp(self):
+        referral_code_cache.clear()
+        self.client = APIClient()
+        self.user = USER_MODEL.objects.create_user(username=VALID_USERNAME, password=PASSWORD)
+        self.client.force_authenticate(user=self.user)
+        self.code = ReferralCode.objects.create(user=self.user, expiry_date=timezone.now() + timedelta(days=1))
+
+    def tearDown(self):
+        referral_code_cache.clear()
+
+    def test_hit_skips_database(self):
+        self.assertEqual(resolve_referrer_id(self.code.code), self.user.id)
+        self.assertIsNone(resolve_referrer_id('missing'))
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_referrer_id(self.code.code), self.user.id)
+            self.assertIsNone(resolve_referrer_id('missing'))
+        self.assertEqual(referral_code_cache.stats()['hit_rate'], 0.5)
+
+    def test_cached_expiry_is_honoured(self):
+        resolve_referrer_id(self.code.code)
+        with mock.patch('testapi.referral_cache.timezone.now', return_value=timezone.now() + timedelta(days=2)), \
+                self.assertNumQueries(0):
+            self.assertIsNone(resolve_referrer_id(self.code.code))
+
+    def test_rotation_and_delete_invalidate(self):
+        resolve_referrer_id(self.code.code)
+        response = self.client.post(reverse('ref-code'), data=json.dumps({'expiry_date': '2099-12-31'}),
+                                    content_type='application/json')
+        self.assertIsNone(resolve_referrer_id(self.code.code))
+        new_code = response.data['code']
+        self.assertEqual(resolve_referrer_id(new_code), self.user.id)
+        self.client.delete(reverse('ref-code'))
+        self.assertIsNone(resolve_referrer_id(new_code))
+
+
+
+class ReferralCodeGeneratorTestCase(TestCase):
+    def test_encode_is_a_bijection(self):
+        for length in (5, 8, 20):
+            generator = FeistelCodeGenerator(key=b'test-key', length=length)
+            codes = [generator.encode(number) for number in range(5000)]
+            self.assertEqual(len(set(codes)), len(codes))
+            self.assertTrue(all(len(code) == length and set(code) <= set(HUMAN_ALPHABET) for code in codes))
+            self.assertEqual([generator.decode(code) for code in codes], list(range(5000)))
+
+    def test_exhausted_code_space_raises(self):
+        generator = FeistelCodeGenerator(key=b'k' * 32, length=4)
+        self.assertEqual(generator.decode(generator.encode(2 ** 20 - 1)), 2 ** 20 - 1)
+        with self.assertRaises(CodeSpaceExhausted):
+            generator.encode(2 ** 20)
+
+    def test_feistel_requires_key(self):
+        with self.assertRaisesMessage(ValidationError, 'REFERRAL_CODE_KEY is required'):
+            AppSettings(referral_code_generator='feistel', referral_code_key='')
+        self.assertEqual(AppSettings(referral_code_generator='random', referral_code_key='').referral_code_key, '')
+
+    def test_sequence_allocates_disjoint_blocks(self):
+        first = SequenceAllocator('test', block_size=3)
+        second = SequenceAllocator('test', block_size=3)
+        numbers = [first.next(), second.next(), first.next(), first.next(), first.next(), second.next()]
+        self.assertEqual(sorted(numbers), [0, 1, 2, 3, 4, 6])
+
+    def test_block_size_scales_with_code_space(self):
+        self.assertEqual(SequenceAllocator.block_size_for(32 ** 4), 1)
+        self.assertEqual(SequenceAllocator.block_size_for(32 ** 5), 32)
+        self.assertEqual(SequenceAllocator.block_size_for(32 ** 20), SequenceAllocator.BLOCK_SIZE)
+        allocator = SequenceAllocator('short', block_size=1)
+        self.assertEqual([allocator.next(), allocator.next()], [0, 1])
+
+    def test_model_uses_configured_generator(self):
+        user = USER_MODEL.objects.create_user(username=VALID_USERNAME)
+        with mock.patch.object(SETTINGS, 'referral_code_generator', 'feistel'), \
+                mock.patch.object(SETTINGS, 'referral_code_length', 8):
+            get_code_generator.cache_clear()
+            try:
+                codes = {ReferralCode.objects.create(user=user, expiry_date='2099-12-31', is_active=False).code
+                         for _ in range(20)}
+            finally:
+                get_code_generator.cache_clear()
+        self.assertEqual(len(codes), 20)
+        self.assertTrue(all(len(code) == 8 for code in codes))
+
+
+
+class ReferralCodeRotationTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = USER_MODEL.objects.create_user(username=VALID_USERNAME, password=PASSWORD)
+        self.client.force_authenticate(user=self.user)
+        self.code = ReferralCode.objects.create(user=self.user, expiry_date=timezone.now() + timedelta(days=1))
+
+    def rotate(self, expiry_date):
+        return self.client.post(reverse('ref-code'), data=json.dumps({'expiry_date': expiry_date}),
+                                content_type='application/json')
+
+    def test_past_date_keeps_current_code(self):
+        response = self.rotate('2020-01-01')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(list(ReferralCode.objects.filter(is_active=True)), [self.code])
+        self.assertEqual(ReferralCode.objects.count(), 1)
+
+    def test_invalid_date(self):
+        response = self.rotate('not a date')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'Invalid expiry date')
+
+    def test_rotation_leaves_one_active_code(self):
+        response = self.rotate('2099-12-31')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(list(ReferralCode.objects.filter(user=self.user, is_active=True)
+                              .values_list('code', flat=True)), [response.data['code']])
+
+
+class ReferralCodeRotationStressTestCase(TransactionTestCase):
+    THREADS = 16
+    ROUNDS = 5
+
+    def test_parallel_rotations_keep_one_active_code(self):
+        user = USER_MODEL.objects.create_user(username=VALID_USERNAME, password=PASSWORD)
+        barrier = threading.Barrier(self.THREADS)
+        expiry = timezone.now() + timedelta(days=30)
+
+        def hammer():
+            try:
+                barrier.wait()
+                for _ in range(self.ROUNDS):
+                    ReferralCode.rotate(user, expiry)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.THREADS) as executor:
+            for future in [executor.submit(hammer) for _ in range(self.THREADS)]:
+                future.result()
+
+        self.assertEqual(ReferralCode.objects.filter(user=user).count(), self.THREADS * self.ROUNDS)
+        self.assertEqual(ReferralCode.objects.filter(user=user, is_active=True).count(), 1)
+
+
+
+class ReferralCodeExpiryTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.now = timezone.now()
+        self.users = [USER_MODEL.objects.create_user(username=f'user{index}', email=f'user{index}@gmail.com')
+                      for index in range(5)]
+        for index, user in enumerate(self.users):
+            ReferralCode.objects.create(user=user, expiry_date=self.now + timedelta(days=index - 2))
+
+    def test_get_ignores_expired_code(self):
+        self.client.force_authenticate(user=self.users[0])
+        response = self.client.get(reverse('ref-code'))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.client.force_authenticate(user=self.users[4])
+        response = self.client.get(reverse('ref-code'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_is_expired(self):
+        self.assertTrue(ReferralCode.objects.get(user=self.users[0]).is_expired())
+        self.assertFalse(ReferralCode.objects.get(user=self.users[4]).is_expired())
+        self.assertTrue(ReferralCode(expiry_date='2020-01-01').is_expired())
+
+    def test_sweeper_deactivates_in_batches(self):
+        batches = list(sweep_expired_codes(batch_size=2))
+        self.assertEqual([batch['rows'] for batch in batches], [2, 1])
+        self.assertEqual(ReferralCode.objects.filter(is_active=True).count(), 2)
+        self.assertEqual(ReferralCode.objects.expired().count(), 0)
+        self.assertGreater(batches[-1]['rows_per_second'], 0)
+
+
+
+def fake_verify_email(email):
+    return not email.startswith('invalid')
+
+
+@mock.patch('testapi.bulk.verify_email', side_effect=fake_verify_email)
+class BulkRegistrationTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = USER_MODEL.objects.create_superuser(username='admin', email='admin@gmail.com', password=PASSWORD)
+        self.referrer = USER_MODEL.objects.create_user(username='referrer', email='referrer@gmail.com')
+        self.parent = USER_MODEL.objects.create_user(username='parent', email='parent@gmail.com')
+        Referral.objects.create(referrer=self.parent, referral=self.referrer)
+        self.code = ReferralCode.objects.create(user=self.referrer, expiry_date=timezone.now() + timedelta(days=1))
+
+    def rows(self):
+        return [
+            {'username': 'bulk1', 'password': PASSWORD, 'email': 'bulk1@gmail.com', 'referral_code': self.code.code},
+            {'username': 'bulk2', 'password': PASSWORD, 'email': 'bulk2@gmail.com'},
+            {'username': 'bulk3', 'password': PASSWORD, 'email': 'invalid@gmail.com'},
+            {'username': 'bulk4', 'password': PASSWORD, 'email': 'bulk4@gmail.com', 'referral_code': 'NOPE'},
+            {'username': 'bulk1', 'password': PASSWORD, 'email': 'bulk5@gmail.com'},
+            {'username': 'referrer', 'password': PASSWORD, 'email': 'bulk6@gmail.com'},
+            {'username': 'bulk7', 'password': PASSWORD, 'email': 'not-an-email'},
+            {'username': 'bulk8', 'password': PASSWORD, 'email': 'bulk8@gmail.com', 'referral_code': self.code.code},
+        ]
+
+    def test_per_row_results(self, verify):
+        results = bulk_register(self.rows(), chunk_size=2)
+        self.assertEqual([result['status'] for result in results],
+                         ['created', 'created', 'failed', 'failed', 'failed', 'failed', 'failed', 'created'])
+        self.assertEqual(results[2]['errors'], {'email': ['Invalid email address']})
+        self.assertEqual(results[3]['errors'], {'referral_code': ['Invalid referral code']})
+        self.assertIn('username', results[4]['errors'])
+        self.assertIn('username', results[5]['errors'])
+        self.assertIn('email', results[6]['errors'])
+        user = USER_MODEL.objects.get(username='bulk1')
+        self.assertEqual(results[0]['id'], user.id)
+        self.assertTrue(user.check_password(PASSWORD))
+        self.assertEqual(verify.call_count, 4)
+
+    def test_usernames_are_normalized_like_create_user(self, verify):
+        USER_MODEL.objects.create_user(username='ﬁle')
+        rows = [{'username': 'ﬁle', 'password': PASSWORD, 'email': 'file@GMAIL.COM'},
+                {'username': 'Ⅸ', 'password': PASSWORD, 'email': 'nine@gmail.com'},
+                {'username': 'IX', 'password': PASSWORD, 'email': 'Nine2@GMAIL.COM'}]
+        results = bulk_register(rows)
+        self.assertEqual([result['status'] for result in results], ['failed', 'created', 'failed'])
+        self.assertEqual(results[2]['errors'], {'username': ['Duplicate username in batch']})
+        self.assertEqual(USER_MODEL.objects.get(pk=results[1]['id']).username, 'IX')
+        results = bulk_register([{'username': 'mixed', 'password': PASSWORD, 'email': 'Mixed@GMAIL.COM'}])
+        self.assertEqual(USER_MODEL.objects.get(pk=results[0]['id']).email, 'Mixed@gmail.com')
+
+    def test_failed_retry_is_reported_per_row(self, verify):
+        create_chunk = bulk._create_chunk
+
+        def flaky_create_chunk(rows):
+            if len(rows) > 1 or rows[0]['username'] == 'bulk2':
+                raise IntegrityError('conflict')
+            return create_chunk(rows)
+
+        with mock.patch('testapi.bulk._create_chunk', side_effect=flaky_create_chunk):
+            results = bulk_register(self.rows(), chunk_size=2)
+        self.assertEqual([result['status'] for result in results],
+                         ['created', 'failed', 'failed', 'failed', 'failed', 'failed', 'failed', 'created'])
+        self.assertEqual(results[1]['errors'], {'non_field_errors': ['User could not be created']})
+        self.assertFalse(USER_MODEL.objects.filter(username='bulk2').exists())
+
+    def test_verify_emails_closes_thread_connections(self, verify):
+        with mock.patch.object(SETTINGS, 'eh_pool_size', 2), mock.patch('testapi.bulk.connections') as connections:
+            statuses = verify_emails(['a@gmail.com', 'invalid@gmail.com', 'c@gmail.com'])
+        self.assertEqual(statuses, {'a@gmail.com': True, 'invalid@gmail.com': False, 'c@gmail.com': True})
+        self.assertEqual(connections.close_all.call_count, 2)
+
+    def test_referrals_closure_and_stats(self, verify):
+        bulk_register(self.rows(), chunk_size=2)
+        self.assertEqual(Referral.objects.filter(referrer=self.referrer).count(), 2)
+        bulk1 = USER_MODEL.objects.get(username='bulk1')
+        self.assertEqual(set(ReferralClosure.objects.filter(descendant=bulk1).values_list('ancestor_id', 'depth')),
+                         {(self.referrer.id, 1), (self.parent.id, 2)})
+        stats = ReferralStats.objects.get(user=self.referrer)
+        self.assertEqual((stats.direct_referrals, stats.signups), (2, 2))
+
+    def test_endpoint_requires_admin(self, verify):
+        url = reverse('bulk-registration')
+        self.client.force_authenticate(user=self.referrer)
+        response = self.client.post(url, data={'users': self.rows()}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.post(url, data={'users': self.rows()}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['created'], response.data['failed']), (3, 5))
+        self.assertEqual(len(response.data['results']), 8)
+
+    def test_endpoint_rejects_bad_payload(self, verify):
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.post(reverse('bulk-registration'), data={'users': 'bulk1'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        with mock.patch.object(SETTINGS, 'bulk_registration_max_size', 2):
+            response = self.client.post(reverse('bulk-registration'), data={'users': self.rows()}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_command(self, verify):
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, 'users.json')
+            report = os.path.join(directory, 'report.json')
+            with open(source, 'w') as file:
+                json.dump(self.rows(), file)
+            call_command('bulk_register', source, '--batch-size', '3', '--report', report, stdout=mock.MagicMock())
+            with open(report) as file:
+                results = json.load(file)
+        self.assertEqual([result['index'] for result in results], list(range(8)))
+        self.assertEqual(sum(result['status'] == 'created' for result in results), 3)
+
+    def test_hash_passwords_in_process_pool(self, verify):
+        with mock.patch('testapi.hashing.hash_workers', return_value=2):
+            hashes = hash_passwords(['first', 'second', 'third'])
+        self.assertEqual(len(hashes), 3)
+        self.assertTrue(check_password('second', hashes[1]))
+
+
+
+class PasswordHashOffloadTestCase(TestCase):
+    def setUp(self):
+        self.factory = AsyncRequestFactory()
+        self.user = USER_MODEL.objects.create_user(username=VALID_USERNAME, password=PASSWORD, email=VALID_EMAIL)
+        verification_cache.clear()
+
+    def post(self, view, payload):
+        request = self.factory.post('/', data=json.dumps(payload), content_type='application/json')
+        return view.as_view()(request)
+
+    async def test_acheck_password(self):
+        encoded = await ahash_password(PASSWORD)
+        self.assertEqual(await acheck_password(PASSWORD, encoded), (True, False))
+        self.assertEqual((await acheck_password('wrong', encoded))[0], False)
+
+    async def test_login(self):
+        response = await self.post(AsyncUserLoginView, {'username': VALID_USERNAME, 'password': PASSWORD})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('access', json.loads(response.content))
+        for payload in ({'username': VALID_USERNAME, 'password': 'wrong'},
+                        {'username': 'invaliduser', 'password': PASSWORD}, {}):
+            response = await self.post(AsyncUserLoginView, payload)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(json.loads(response.content)['error'], 'Invalid Username/Password')
+
+    async def test_login_uses_authentication_backends(self):
+        self.user.is_active = False
+        await self.user.asave(update_fields=['is_active'])
+        failures = []
+
+        def on_failure(sender, credentials, request, **kwargs):
+            failures.append(credentials['username'])
+
+        user_login_failed.connect(on_failure)
+        self.addCleanup(user_login_failed.disconnect, on_failure)
+        response = await self.post(AsyncUserLoginView, {'username': VALID_USERNAME, 'password': PASSWORD})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(failures, [VALID_USERNAME])
+        with override_settings(AUTHENTICATION_BACKENDS=['django.contrib.auth.backends.AllowAllUsersModelBackend']):
+            response = await self.post(AsyncUserLoginView, {'username': VALID_USERNAME, 'password': PASSWORD})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    async def test_login_rehashes_outdated_password(self):
+        hasher = PBKDF2PasswordHasher()
+        self.user.password = hasher.encode(PASSWORD, hasher.salt(), iterations=1000)
+        await self.user.asave(update_fields=['password'])
+        response = await self.post(AsyncUserLoginView, {'username': VALID_USERNAME, 'password': PASSWORD})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        user = await USER_MODEL.objects.aget(pk=self.user.pk)
+        self.assertEqual(hasher.decode(user.password)['iterations'], hasher.iterations)
+
+    @mock.patch('testapi.async_views.verify_email', return_value=True)
+    async def test_registration(self, verify):
+        code = await ReferralCode.objects.acreate(user=self.user, expiry_date=timezone.now() + timedelta(days=1))
+        response = await self.post(AsyncUserRegistrationView, {'username': 'async1', 'password': PASSWORD,
+                                                               'email': 'async1@gmail.com',
+                                                               'referral_code': code.code})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        user = await USER_MODEL.objects.aget(username='async1')
+        self.assertTrue(await sync_to_async(user.check_password)(PASSWORD))
+        self.assertTrue(await Referral.objects.filter(referrer=self.user, referral=user).aexists())
+        response = await self.post(AsyncUserRegistrationView, {'username': 'async1', 'password': PASSWORD,
+                                                               'email': 'async1@gmail.com'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('username', json.loads(response.content))
+
+    @mock.patch('testapi.async_views.verify_email', return_value=False)
+    async def test_registration_invalid_email(self, verify):
+        response = await self.post(AsyncUserRegistrationView, {'username': 'async2', 'password': PASSWORD,
+                                                               'email': INVALID_EMAIL})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(json.loads(response.content)['error'], 'Invalid email address')
+
+    @mock.patch('testapi.async_views.averify_email', return_value=True)
+    @mock.patch('testapi.async_views.verify_email', return_value=True)
+    def test_async_client_only_under_asgi_with_async_views(self, verify, averify):
+        payload = json.dumps({'username': 'async3', 'password': PASSWORD, 'email': 'async3@gmail.com'})
+        with mock.patch.object(SETTINGS, 'async_views', True):
+            # Под WSGI Django выполняет асинхронное представление в новом цикле событий на каждый запрос
+            request = RequestFactory().post('/', data=payload, content_type='application/json')
+            response = async_to_sync(AsyncUserRegistrationView.as_view())(request)
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertEqual((verify.call_count, averify.call_count), (1, 0))
+            request = self.factory.post('/', data=payload.replace('async3', 'async4'),
+                                        content_type='application/json')
+            response = async_to_sync(AsyncUserRegistrationView.as_view())(request)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((verify.call_count, averify.call_count), (1, 1))
+
+
+
+class AsyncVerificationTestCase(TestCase):
+    def setUp(self):
+        verification_cache.clear()
+        get_verifier_client.cache_clear()
+        self.stub = HunterStubServer(statuses={INVALID_EMAIL: 'invalid'}, delay=0.05)
+        self.stub.start()
+        self.addCleanup(self.stub.stop)
+        self.addCleanup(get_verifier_client.cache_clear)
+        self.addCleanup(verification_cache.clear)
+
+    async def test_async_single_flight(self):
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 'valid'
+
+        results = await asyncio.gather(*(flight.do('key', fetch) for _ in range(5)))
+        self.assertEqual(results, ['valid'] * 5)
+        self.assertEqual(len(calls), 1)
+
+    async def test_async_client(self):
+        client = AsyncEmailVerifierClient(self.stub.url, 'k', 1.0, 1.0, 2, CircuitBreaker(2, 60))
+        try:
+            self.assertEqual(await client.get_status(VALID_EMAIL), 'valid')
+            self.assertEqual(await client.get_status(INVALID_EMAIL), 'invalid')
+            self.stub.fail_times = 2
+            for _ in range(2):
+                with self.assertRaises(VerifierUnavailable):
+                    await client.get_status(VALID_EMAIL)
+            with self.assertRaises(CircuitOpenError):
+                await client.get_status(VALID_EMAIL)
+        finally:
+            await client.aclose()
+
+    async def test_averify_email_concurrent_and_cached(self):
+        with mock.patch.object(SETTINGS, 'eh_api_url', self.stub.url):
+            emails = [f'user{index}@gmail.com' for index in range(10)] * 2
+            await averify_email('warmup@gmail.com')
+            started = time.perf_counter()
+            results = await asyncio.gather(*(averify_email(email) for email in emails))
+            elapsed = time.perf_counter() - started
+            self.assertTrue(all(results))
+            self.assertFalse(await averify_email(INVALID_EMAIL))
+            self.assertFalse(await averify_email(INVALID_EMAIL))
+        self.assertEqual(len(self.stub.requests), 12)
+        self.assertLess(elapsed, 0.05 * 10)
+
+
+class AsyncReferralViewsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = AsyncRequestFactory()
+        self.user = USER_MODEL.objects.create_user(username=VALID_USERNAME, password=PASSWORD, email=VALID_EMAIL)
+        self.auth = {'headers': {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}}
+        for index in range(3):
+            Referral.objects.create(referrer=self.user, referral=USER_MODEL.objects.create_user(
+                username=f'referral{index}', email=f'referral{index}@gmail.com'))
+
+    async def test_requires_token(self):
+        response = await AsyncReferralInfoView.as_view()(self.factory.get('/'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = await AsyncReferralCodeView.as_view()(self.factory.get('/', headers={'Authorization': 'Bearer bad'}))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(json.loads(response.content)['code'], 'token_not_valid')
+
+    async def test_referral_info(self):
+        view = AsyncReferralInfoView.as_view()
+        response = await view(self.factory.get('/', {'page_size': 2, 'count': 'true'}, **self.auth))
+        data = json.loads(response.content)
+        self.assertEqual(data['referrals'], ['referral0', 'referral1'])
+        self.assertEqual(data['count'], 3)
+        response = await view(self.factory.get('/', {'cursor': data['next_cursor']}, **self.auth))
+        self.assertEqual(json.loads(response.content), {'referrals': ['referral2'], 'next_cursor': None})
+        response = await view(self.factory.get('/', {'cursor': 'x'}, **self.auth))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_referral_code_lifecycle(self):
+        view = AsyncReferralCodeView.as_view()
+        response = await view(self.factory.get('/', **self.auth))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        expiry_date = (timezone.now() + timedelta(days=2)).date().isoformat()
+        response = await view(self.factory.post('/', data=json.dumps({'expiry_date': expiry_date}),
+                                                content_type='application/json', **self.auth))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        code = json.loads(response.content)['code']
+        response = await view(self.factory.post('/', data=json.dumps({'expiry_date': '2000-01-01'}),
+                                                content_type='application/json', **self.auth))
+        self.assertEqual(json.loads(response.content)['error'], 'Expiry date must be in the future')
+        response = await view(self.factory.get('/', **self.auth))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(await EmailOutbox.objects.filter(body__contains=code).aexists())
+        response = await view(self.factory.delete('/', **self.auth))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(await ReferralCode.objects.filter(code=code, is_active=True).aexists())
+
+    @override_settings(DEBUG=True)
+    def test_middleware_stack_is_async(self):
+        # При DEBUG Django пишет в лог django.request о каждом адаптированном промежуточном слое
+        with self.assertNoLogs('django.request', level='DEBUG'):
+            ASGIHandler()
+
+
+
+class DatabaseSettingsTestCase(TestCase):
+    def test_persistent_connections(self):
+        database = SETTINGS.model_copy(update={'db_conn_max_age': 60, 'db_conn_health_checks': True}).database_settings()
+        self.assertEqual(database['CONN_MAX_AGE'], 60)
+        self.assertTrue(database['CONN_HEALTH_CHECKS'])
+        self.assertNotIn('OPTIONS', database)
+
+    def test_pool(self):
+        database = SETTINGS.model_copy(update={'db_pool': True, 'db_conn_max_age': 60,
+                                               'db_pool_max_size': 20}).database_settings()
+        self.assertEqual(database['CONN_MAX_AGE'], 0)
+        self.assertEqual(database['OPTIONS']['pool']['max_size'], 20)
+        self.assertEqual(database['ENGINE'], 'django.db.backends.postgresql')
+
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTestCase(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        replica_lags.clear()
+        referral_code_cache.clear()
+        self.client = APIClient()
+        self.user = USER_MODEL.objects.create_user(username=VALID_USERNAME, password=PASSWORD, email=VALID_EMAIL)
+        self.user.save(using='replica')
+        Referral.objects.create(referrer=self.user, referral=USER_MODEL.objects.create_user(
+            username='referral', email='referral@gmail.com'))
+        # Версии, выставленные созданием данных, сбрасываются: реферал считается давним, но не реплицированным
+        cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_reads_go_to_replica_and_writes_to_primary(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(USER_MODEL), 'replica')
+        self.assertEqual(router.db_for_write(USER_MODEL), 'default')
+        self.assertFalse(USER_MODEL.objects.filter(username='referral').exists())
+        with transaction.atomic():
+            self.assertTrue(USER_MODEL.objects.filter(username='referral').exists())
+
+    def test_read_your_writes_after_user_write(self):
+        response = self.client.get(reverse('ref-info'))
+        self.assertEqual(response.data['referrals'], [])
+        expiry_date = (timezone.now() + timedelta(days=2)).date().isoformat()
+        response = self.client.post(reverse('ref-code'), data={'expiry_date': expiry_date}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.get(reverse('ref-info'))
+        self.assertEqual(response.data['referrals'], ['referral'])
+        self.assertTrue(resolve_referrer_id(ReferralCode.objects.using('default').get(user=self.user).code))
+
+    @mock.patch('testapi.routers.replica_lag', return_value=60.0)
+    def test_lagging_replica_falls_back_to_primary(self, lag):
+        self.assertTrue(USER_MODEL.objects.filter(username='referral').exists())
+        self.assertTrue(USER_MODEL.objects.filter(username='referral').exists())
+        lag.assert_called_once_with('replica')
+
+    @mock.patch('testapi.routers.replica_lag', side_effect=DatabaseError('connection refused'))
+    def test_unavailable_replica_falls_back_to_primary(self, lag):
+        self.assertTrue(USER_MODEL.objects.filter(username='referral').exists())
+        with override_settings(DATABASE_REPLICAS=['replica_missing']):
+            self.assertEqual(ReplicaRouter().db_for_read(USER_MODEL), 'default')
+
+
+
+class OpenAPISchemaTestCase(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        override = override_settings(OPENAPI_SCHEMA_DIR=self.directory)
+        override.enable()
+        self.addCleanup(override.disable)
+        load_schema.cache_clear()
+        self.addCleanup(load_schema.cache_clear)
+        call_command('generate_openapi_schema', stdout=mock.MagicMock())
+
+    def test_command_writes_compressed_files(self):
+        names = sorted(path.name for path in self.directory.iterdir())
+        self.assertEqual(names, ['openapi.json', 'openapi.json.br', 'openapi.json.gz',
+                                 'openapi.yaml', 'openapi.yaml.br', 'openapi.yaml.gz'])
+        schema = json.loads((self.directory / 'openapi.json').read_bytes())
+        self.assertIn('/register/', schema['paths'])
+        referrals = schema['paths']['/ref-info/']['get']['responses']['200']['schema']['properties']['referrals']
+        self.assertEqual((referrals['type'], referrals['items']['type']), ('array', 'string'))
+        self.assertEqual(gzip.decompress((self.directory / 'openapi.json.gz').read_bytes()),
+                         (self.directory / 'openapi.json').read_bytes())
+
+    def test_schema_lists_routes_served_by_async_views(self):
+        import testapi.urls
+
+        def reload_urls():
+            importlib.reload(testapi.urls)
+            clear_url_caches()
+
+        self.addCleanup(reload_urls)
+        with mock.patch.object(SETTINGS, 'async_views', True):
+            reload_urls()
+        self.assertIs(resolve('/ref-info/').func.view_class, AsyncReferralInfoView)
+        paths = json.loads(render_schema('json'))['paths']
+        for route in ('/register/', '/login/', '/ref-code/', '/ref-info/'):
+            self.assertIn(route, paths)
+
+    def test_content_negotiation_and_cache_headers(self):
+        identity = (self.directory / 'openapi.json').read_bytes()
+        response = self.client.get(reverse('openapi-json'), headers={'Accept-Encoding': 'gzip, br'})
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), identity)
+        self.assertIn('max-age=', response['Cache-Control'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+        response = self.client.get(reverse('openapi-json'), headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        response = self.client.get(reverse('openapi-json'))
+        self.assertEqual(response.content, identity)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        response = self.client.get(reverse('openapi-yaml'))
+        self.assertEqual(response['Content-Type'], 'application/yaml')
+
+    def test_etag_revalidation(self):
+        etag = self.client.get(reverse('openapi-json'))['ETag']
+        response = self.client.get(reverse('openapi-json'), headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        response = self.client.get(reverse('openapi-json'), headers={'If-None-Match': etag,
+                                                                      'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_missing_files_are_built_in_memory(self):
+        for path in self.directory.iterdir():
+            path.unlink()
+        load_schema.cache_clear()
+        with self.assertLogs('testapi.openapi', 'WARNING'):
+            response = self.client.get(reverse('openapi-json'))
+        self.assertIn('/login/', json.loads(response.content)['paths'])
+
+    def test_swagger_ui_uses_static_schema(self):
+        response = self.client.get(reverse('schema-swagger-ui'))
+        self.assertContains(response, reverse('openapi-json'))
+
+
+class ConditionalReferralTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = USER_MODEL.objects.create_user(username=VALID_USERNAME, password=PASSWORD, email=VALID_EMAIL)
+        Referral.objects.create(referrer=self.user, referral=USER_MODEL.objects.create_user(username='first'))
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_unchanged_poll_only_loads_user(self):
+        response = self.client.get(reverse('ref-info'))
+        self.assertEqual(response.data['referrals'], ['first'])
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        etag = response['ETag']
+        # Единственный запрос - чтение пользователя из JWT
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('ref-info'), headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('ref-info'))
+        self.assertEqual(response.data['referrals'], ['first'])
+        response = self.client.get(reverse('ref-info'), {'page_size': 1}, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_new_referral_changes_version(self):
+        etag = self.client.get(reverse('ref-info'))['ETag']
+        version = get_version(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            Referral.objects.create(referrer=self.user, referral=USER_MODEL.objects.create_user(username='second'))
+        self.assertNotEqual(get_version(self.user.id), version)
+        response = self.client.get(reverse('ref-info'), headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['referrals'], ['first', 'second'])
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_renamed_referral_changes_version(self):
+        etag = self.client.get(reverse('ref-info'))['ETag']
+        referral = USER_MODEL.objects.get(username='first')
+        referral.username = 'renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            referral.save()
+        response = self.client.get(reverse('ref-info'), headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['referrals'], ['renamed'])
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            referral.save(update_fields=['last_login'])
+        response = self.client.get(reverse('ref-info'), headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_referral_code_get_always_sends_email(self):
+        ReferralCode.objects.create(user=self.user, code='conditional', expiry_date=timezone.now() + timedelta(days=1))
+        response = self.client.get(reverse('ref-code'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('ETag', response)
+        response = self.client.get(reverse('ref-code'), headers={'If-None-Match': '*'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        request = AsyncRequestFactory().get(reverse('ref-code'), headers={
+            'Authorization': f'Bearer {AccessToken.for_user(self.user)}', 'If-None-Match': '*'})
+        response = async_to_sync(AsyncReferralCodeView.as_view())(request)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(EmailOutbox.objects.count(), 3)
+
+    def test_deactivated_or_deleted_user_loses_access(self):
+        self.client.get(reverse('ref-info'))
+        USER_MODEL.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.client.get(reverse('ref-info'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        USER_MODEL.objects.filter(pk=self.user.pk).delete()
+        response = self.client.get(reverse('ref-info'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_async_view_shares_versions(self):
+        etag = self.client.get(reverse('ref-info'))['ETag']
+        request = AsyncRequestFactory().get(reverse('ref-info'), headers={
+            'Authorization': f'Bearer {AccessToken.for_user(self.user)}', 'If-None-Match': etag})
+        response = async_to_sync(AsyncReferralInfoView.as_view())(request)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class PerformanceMiddlewareTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = USER_MODEL.objects.create_user(username=VALID_USERNAME, password=PASSWORD, email=VALID_EMAIL)
+        self.client.force_authenticate(user=self.user)
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_server_timing_and_histograms(self):
+        requests = self.sample('testapi_requests_total', view='ref-info', method='GET', status='200')
+        queries = self.sample('testapi_db_queries_sum', view='ref-info')
+        response = self.client.get(reverse('ref-info'))
+        timing = response['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn('desc="1 queries"', timing)
+        self.assertIn('total;dur=', timing)
+        self.assertEqual(self.sample('testapi_requests_total', view='ref-info', method='GET', status='200'),
+                         requests + 1)
+        self.assertEqual(self.sample('testapi_db_queries_sum', view='ref-info'), queries + 1)
+
+    def test_outbound_calls_are_attributed_to_view(self):
+        with HunterStubServer(delay=0.05) as hunter, mock.patch.object(SETTINGS, 'eh_api_url', hunter.url):
+            get_verifier_client.cache_clear()
+            self.addCleanup(get_verifier_client.cache_clear)
+            verification_cache.clear()
+            response = self.client.post(reverse('registration'), data={
+                'username': 'timed', 'password': PASSWORD, 'email': 'timed@example.com'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertRegex(response['Server-Timing'], r'http;dur=\d{2,}')
+        self.assertGreater(self.sample('testapi_external_duration_seconds_count',
+                                       view='registration', component='http'), 0)
+
+    def test_smtp_time_is_recorded_outside_requests(self):
+        count = self.sample('testapi_external_call_duration_seconds_count', component='smtp')
+        ReferralCode.objects.create(user=self.user, expiry_date=timezone.now() + timedelta(days=1))
+        self.client.get(reverse('ref-code'))
+        OutboxSender().drain()
+        self.assertEqual(self.sample('testapi_external_call_duration_seconds_count', component='smtp'), count + 1)
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('ref-info'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(b'testapi_request_duration_seconds_bucket{', response.content)
+        with mock.patch.object(SETTINGS, 'metrics_token', 'secret'):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+            response = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer secret'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class ProfilingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        override = override_settings(PROFILES_DIR=self.directory)
+        override.enable()
+        self.addCleanup(override.disable)
+        get_store.cache_clear()
+        self.addCleanup(get_store.cache_clear)
+        set_sample_rate(0)
+        self.client = APIClient()
+        self.user = USER_MODEL.objects.create_user(username=VALID_USERNAME, password=PASSWORD)
+        self.client.force_authenticate(user=self.user)
+
+    def test_signed_header_profiles_request(self):
+        self.assertFalse(self.client.get(reverse('ref-info')).has_header(HEADER))
+        response = self.client.get(reverse('ref-info'), headers={HEADER: 'forged'})
+        self.assertFalse(response.has_header(HEADER))
+        response = self.client.get(reverse('ref-info'), headers={HEADER: make_token()})
+        name = response[HEADER]
+        self.assertTrue((self.directory / name).is_file())
+        self.assertEqual([profile.name for profile in get_store().slowest_by_view(10)['ref-info']], [name])
+        self.assertIn('function calls', get_store().report(name))
+
+    def test_sample_rate_and_rotation(self):
+        set_sample_rate(1)
+        with mock.patch.object(SETTINGS, 'profiling_max_files', 3):
+            get_store.cache_clear()
+            for _ in range(5):
+                # Имя профиля не раскрывается запросу без подписанного заголовка от не персонала
+                self.assertFalse(self.client.get(reverse('ref-info')).has_header(HEADER))
+                time.sleep(0.002)
+        self.assertEqual(len(list(self.directory.glob('*.prof'))), 3)
+
+    def test_request_during_profiling_is_not_profiled(self):
+        with _profiler_lock:
+            response = self.client.get(reverse('ref-info'), headers={HEADER: make_token()})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.has_header(HEADER))
+        with mock.patch('cProfile.Profile.enable', side_effect=ValueError('Another profiling tool is already active')):
+            response = self.client.get(reverse('ref-info'), headers={HEADER: make_token()})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.has_header(HEADER))
+        self.assertEqual(get_store().profiles(), [])
+
+    def test_sample_rate_is_shared_between_processes(self):
+        set_sample_rate(0.25)
+        self.assertEqual((self.directory / 'sample_rate').read_text(), '0.25')
+        # Другой воркер: своего кэша нет, а кэш Django у него отдельный
+        _sample_rates.clear()
+        cache.clear()
+        self.assertEqual(get_sample_rate(), 0.25)
+        (self.directory / 'sample_rate').unlink()
+        _sample_rates.clear()
+        self.assertEqual(get_sample_rate(), SETTINGS.profiling_sample_rate)
+
+    def test_profiles_with_same_timing_do_not_collide(self):
+        import cProfile
+
+        store = get_store()
+        paths = {store.save(cProfile.Profile(), 1700000000.0, 0.01, 'GET', 'ref-info') for _ in range(2)}
+        self.assertEqual(len(paths), 2)
+        self.assertEqual({profile.view for profile in store.profiles()}, {'ref-info'})
+
+    def test_admin_view_lists_slowest_profiles(self):
+        self.client.get(reverse('ref-info'), headers={HEADER: make_token()})
+        self.assertEqual(self.client.get(reverse('admin-profiles')).status_code, status.HTTP_302_FOUND)
+        admin = USER_MODEL.objects.create_superuser(username='admin', password=PASSWORD)
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin-profiles'))
+        self.assertContains(response, 'ref-info')
+        name = get_store().profiles()[0].name
+        response = self.client.get(reverse('admin-profiles'), {'profile': name})
+        self.assertContains(response, 'cumulative')
+        response = self.client.get(reverse('admin-profile-download', args=[name]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.post(reverse('admin-profiles'), {'sample_rate': '0.25'})
+        response = self.client.get(reverse('admin-profiles'))
+        self.assertEqual(response.context['sample_rate'], 0.25)
+
+
+class StartupImportsTestCase(unittest.TestCase):
+    def test_worker_boot_skips_heavy_modules(self):
+        budget = json.loads((Path(__file__).resolve().parent.parent / 'benchmarks' / 'startup_budget.json').read_text())
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='testapi.settings')
+        result = subprocess.run(
+            [sys.executable, '-c', 'import json, sys, testapi.wsgi; json.dump(sorted(sys.modules), sys.stdout)'],
+            env=env, capture_output=True, text=True, check=True)
+        loaded = set(json.loads(result.stdout))
+        self.assertEqual([module for module in budget['forbidden_at_boot'] if module in loaded], [])
+
+
+class GunicornConfigTestCase(unittest.TestCase):
+    def test_worker_count_by_model(self):
+        self.assertEqual(worker_count('sync', 4), 9)
+        self.assertEqual(worker_count('gthread', 4), 5)
+        self.assertEqual(worker_count('asgi', 4), 4)
+
+    def test_cgroup_cpu_limit(self):
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory)
+            self.assertIsNone(cgroup_cpu_limit(root))
+            (root / 'cpu.max').write_text('max 100000\n')
+            self.assertIsNone(cgroup_cpu_limit(root))
+            (root / 'cpu.max').write_text('150000 100000\n')
+            self.assertEqual(cgroup_cpu_limit(root), 1.5)
+            (root / 'cpu.max').unlink()
+            (root / 'cpu').mkdir()
+            (root / 'cpu' / 'cpu.cfs_quota_us').write_text('200000\n')
+            (root / 'cpu' / 'cpu.cfs_period_us').write_text('100000\n')
+            self.assertEqual(cgroup_cpu_limit(root), 2.0)
+        self.assertGreaterEqual(cpu_count(), 1)
+
+    def test_gunicorn_options(self):
+        options = gunicorn_options(SETTINGS.model_copy(update={'gunicorn_worker_class': 'sync', 'gunicorn_workers': 0}),
+                                   cpus=2)
+        self.assertEqual((options['wsgi_app'], options['workers'], options['threads']),
+                         ('testapi.wsgi:application', 5, 1))
+        options = gunicorn_options(SETTINGS.model_copy(update={'gunicorn_worker_class': 'asgi', 'gunicorn_workers': 3}),
+                                   cpus=2)
+        self.assertEqual((options['wsgi_app'], options['worker_class'], options['workers']),
+                         ('testapi.asgi:application', 'uvicorn.workers.UvicornWorker', 3))
@@ -17,13 +17,55 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 from testapi import views
-from swagger_docs import schema_view
+from testapi.instrumentation import metrics_view
+from testapi.openapi import openapi_schema, swagger_ui
+from testapi.profiling import profile_download_view, profiles_view
+from config import get_app_settings
+
+SETTINGS = get_app_settings()
+
+# Асинхронные представления импортируются, только если включены
+if SETTINGS.async_views or SETTINGS.password_hash_offload:
+    from testapi import async_views
+
+    registration_view = async_views.AsyncUserRegistrationView
+    login_view = async_views.AsyncUserLoginView
+else:
+    registration_view = views.UserRegistrationView
+    login_view = views.UserLoginView
+if SETTINGS.async_views:
+    referral_code_view = async_views.AsyncReferralCodeView
+    referral_info_view = async_views.AsyncReferralInfoView
+else:
+    referral_code_view = views.ReferralCodeView
+    referral_info_view = views.ReferralInfoView
+
+def api_patterns(registration_view, login_view, referral_code_view, referral_info_view) -> list:
+    return [
+        path('register/', registration_view.as_view(), name='registration'),
+        path('register/bulk/', views.BulkRegistrationView.as_view(), name='bulk-registration'),
+        path('register/status/<uuid:registration_id>/', views.RegistrationStatusView.as_view(),
+             name='registration-status'),
+        path('login/', login_view.as_view(), name='login'),
+        path('ref-code/', referral_code_view.as_view(), name='ref-code'),
+        path('ref-info/', referral_info_view.as_view(), name='ref-info'),
+        path('ref-tree/', views.ReferralTreeView.as_view(), name='ref-tree'),
+        path('leaderboard/', views.LeaderboardView.as_view(), name='leaderboard'),
+    ]
+
+
+# Схема OpenAPI всегда строится по APIView из testapi.views: асинхронные представления - обычные
+# View Django, и drf_yasg их пропускает, а контракт у них тот же
+schema_patterns = api_patterns(views.UserRegistrationView, views.UserLoginView,
+                               views.ReferralCodeView, views.ReferralInfoView)
 
 urlpatterns = [
+    path('admin/profiles/', profiles_view, name='admin-profiles'),
+    path('admin/profiles/<str:name>', profile_download_view, name='admin-profile-download'),
     path('admin/', admin.site.urls),
-    path('register/', views.UserRegistrationView.as_view(), name='registration'),
-    path('login/', views.UserLoginView.as_view(), name='login'),
-    path('ref-code/', views.ReferralCodeView.as_view(), name='ref-code'),
-    path('ref-info/', views.ReferralInfoView.as_view(), name='ref-info'),
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
+    *api_patterns(registration_view, login_view, referral_code_view, referral_info_view),
+    path('openapi.json', openapi_schema, {'fmt': 'json'}, name='openapi-json'),
+    path('openapi.yaml', openapi_schema, {'fmt': 'yaml'}, name='openapi-yaml'),
+    path('metrics', metrics_view, name='metrics'),
+    path('swagger/', swagger_ui, name='schema-swagger-ui'),
 ]
@@ -0,0 +1,97 @@
+from config import get_app_settings
+from testapi.cache import TTLCache
+from testapi.coalescing import AsyncSingleFlight, SingleFlight
+from testapi.quota import SharedQuota
+from testapi.verifier_client import VerifierUnavailable, get_async_verifier_client, get_verifier_client
+
+
+SETTINGS = get_app_settings()
+
+verification_cache = TTLCache(max_size=SETTINGS.eh_cache_size,
+                              default_ttl=SETTINGS.eh_cache_valid_ttl)
+inflight = SingleFlight()
+ainflight = AsyncSingleFlight()
+quota = (SharedQuota('hunter.io', capacity=SETTINGS.eh_quota_requests, period=SETTINGS.eh_quota_period)
+         if SETTINGS.eh_quota_requests > 0 else None)
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+def fetch_email_status(email: str) -> str:
+    """
+    Запрашивает статус адреса электронной почты в API hunter.io через пул соединений клиента.
+
+    Возвращает:
+        Строку статуса из ответа hunter.io ('valid', 'invalid', 'accept_all' и т.д.).
+
+    Исключения:
+        VerifierUnavailable: При сетевой ошибке, таймауте, ответе с кодом ошибки
+            или разомкнутом выключателе (см. testapi.verifier_client).
+    """
+    return get_verifier_client().get_status(email)
+
+
+def _lookup_status(email: str) -> str:
+    if quota is not None and not quota.acquire(timeout=SETTINGS.eh_quota_wait):
+        raise VerifierUnavailable('hunter.io request quota exhausted')
+    return fetch_email_status(email)
+
+
+def verify_email(email: str) -> bool:
+    """
+    Проверяет адрес электронной почты с кэшированием результата.
+
+    Результаты хранятся по нормализованному адресу: положительные в течение
+    eh_cache_valid_ttl секунд, отрицательные в течение eh_cache_invalid_ttl.
+    При попадании в кэш запрос к hunter.io не выполняется. Одновременные
+    проверки одного адреса объединяются в один запрос, а число запросов
+    ограничено общей для всех процессов квотой eh_quota_requests за eh_quota_period секунд.
+
+    Аргументы:
+        email: Адрес электронной почты.
+
+    Возвращает:
+        True, если hunter.io считает адрес действительным.
+
+    Исключения:
+        VerifierUnavailable: hunter.io недоступен или квота исчерпана.
+    """
+    key = normalize_email(email)
+    is_valid = verification_cache.get(key)
+    if is_valid is not None:
+        return is_valid
+
+    is_valid = inflight.do(key, lambda: _lookup_status(key)) == 'valid'
+    ttl = SETTINGS.eh_cache_valid_ttl if is_valid else SETTINGS.eh_cache_invalid_ttl
+    verification_cache.set(key, is_valid, ttl=ttl)
+    return is_valid
+
+
+async def _alookup_status(email: str) -> str:
+    if quota is not None and not await quota.aacquire(timeout=SETTINGS.eh_quota_wait):
+        raise VerifierUnavailable('hunter.io request quota exhausted')
+    return await get_async_verifier_client().get_status(email)
+
+
+async def averify_email(email: str) -> bool:
+    """
+    Асинхронный вариант verify_email для асинхронных представлений.
+
+    Использует тот же кэш, квоту и выключатель, но запрос к hunter.io выполняется
+    асинхронным клиентом, а одновременные проверки одного адреса объединяются
+    в пределах цикла событий.
+
+    Исключения:
+        VerifierUnavailable: hunter.io недоступен или квота исчерпана.
+    """
+    key = normalize_email(email)
+    is_valid = verification_cache.get(key)
+    if is_valid is not None:
+        return is_valid
+
+    is_valid = await ainflight.do(key, lambda: _alookup_status(key)) == 'valid'
+    ttl = SETTINGS.eh_cache_valid_ttl if is_valid else SETTINGS.eh_cache_invalid_ttl
+    verification_cache.set(key, is_valid, ttl=ttl)
+    return is_valid
@@ -0,0 +1,280 @@
+import asyncio
+import threading
+import time
+import weakref
+from functools import lru_cache
+
+from config import get_app_settings
+from testapi import instrumentation
+
+
+SETTINGS = get_app_settings()
+
+
+class VerifierUnavailable(OSError):
+    """
+    Сервис проверки email недоступен: сетевая ошибка, таймаут или ответ с кодом ошибки.
+
+    Наследуется от OSError, как requests.RequestException, чтобы модуль не импортировал
+    requests и httpx до первого запроса к сервису.
+    """
+
+
+class CircuitOpenError(VerifierUnavailable):
+    """
+    Запрос не выполнялся, так как автоматический выключатель разомкнут.
+    """
+
+
+class CircuitBreaker:
+    """
+    Автоматический выключатель для внешнего сервиса.
+
+    После failure_threshold ошибок подряд выключатель размыкается и в течение
+    reset_timeout секунд запросы сразу отклоняются. Затем пропускается один
+    пробный запрос: успех замыкает выключатель, ошибка снова размыкает его.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int, reset_timeout: float) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class VerifierMetrics:
+    """
+    Счетчики и задержки запросов к сервису проверки email.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.requests = 0
+        self.errors = 0
+        self.short_circuits = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def observe(self, latency: float, error: bool) -> None:
+        instrumentation.record('http', latency)
+        with self._lock:
+            self.requests += 1
+            self.errors += error
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+
+    def short_circuit(self) -> None:
+        with self._lock:
+            self.short_circuits += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'errors': self.errors,
+                'short_circuits': self.short_circuits,
+                'latency_avg': self.latency_total / self.requests if self.requests else 0.0,
+                'latency_max': self.latency_max,
+            }
+
+
+class EmailVerifierClient:
+    """
+    HTTP-клиент API hunter.io email-verifier.
+
+    Использует одну requests.Session с пулом keep-alive соединений размером
+    pool_size; при исчерпании пула запросы ждут свободного соединения, поэтому
+    число одновременных запросов к hunter.io ограничено. Каждый запрос
+    выполняется с таймаутами на подключение и чтение и проходит через
+    автоматический выключатель.
+
+    Атрибуты:
+        url: Адрес API email-verifier.
+        breaker: Автоматический выключатель.
+        metrics: Метрики запросов.
+    """
+
+    def __init__(self, url: str, api_key: str, connect_timeout: float, read_timeout: float,
+                 pool_size: int, breaker: CircuitBreaker) -> None:
+        self.url = url
+        self.api_key = api_key
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = breaker
+        self.metrics = VerifierMetrics()
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get_status(self, email: str) -> str:
+        """
+        Запрашивает статус адреса электронной почты.
+
+        Возвращает:
+            Строку статуса из ответа hunter.io.
+
+        Исключения:
+            CircuitOpenError: Выключатель разомкнут, запрос не выполнялся.
+            VerifierUnavailable: Сетевая ошибка, таймаут или ответ с кодом ошибки.
+                Ошибки выключателя учитывают только сетевые ошибки, таймауты и ответы 5xx/429.
+        """
+        if not self.breaker.allow():
+            self.metrics.short_circuit()
+            raise CircuitOpenError('Email verifier circuit is open')
+
+        import requests
+
+        started = time.perf_counter()
+        try:
+            response = self.session.get(self.url, params={'email': email, 'api_key': self.api_key},
+                                        timeout=self.timeout)
+        except requests.RequestException as exc:
+            self.metrics.observe(time.perf_counter() - started, error=True)
+            self.breaker.record_failure()
+            raise VerifierUnavailable(str(exc)) from exc
+
+        self.metrics.observe(time.perf_counter() - started, error=not response.ok)
+        if response.status_code >= 500 or response.status_code == 429:
+            self.breaker.record_failure()
+            raise VerifierUnavailable(f'Email verifier responded with {response.status_code}')
+        self.breaker.record_success()
+        if not response.ok:
+            raise VerifierUnavailable(f'Email verifier responded with {response.status_code}')
+        return response.json()['data'].get('status')
+
+    def close(self) -> None:
+        self.session.close()
+
+
+class AsyncEmailVerifierClient:
+    """
+    Асинхронный HTTP-клиент API hunter.io email-verifier на httpx.
+
+    Повторяет контракт EmailVerifierClient: пул из pool_size keep-alive соединений
+    (при исчерпании запросы ждут), таймауты на подключение и чтение и автоматический
+    выключатель. Ожидание ответа не занимает поток, поэтому один процесс может
+    держать много одновременных проверок.
+    """
+
+    def __init__(self, url: str, api_key: str, connect_timeout: float, read_timeout: float,
+                 pool_size: int, breaker: CircuitBreaker, metrics: VerifierMetrics | None = None) -> None:
+        self.url = url
+        self.api_key = api_key
+        self.breaker = breaker
+        self.metrics = metrics or VerifierMetrics()
+        import httpx
+
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout, pool=None),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    async def get_status(self, email: str) -> str:
+        """
+        Запрашивает статус адреса электронной почты.
+
+        Возвращает:
+            Строку статуса из ответа hunter.io.
+
+        Исключения:
+            CircuitOpenError: Выключатель разомкнут, запрос не выполнялся.
+            VerifierUnavailable: Сетевая ошибка, таймаут или ответ с кодом ошибки.
+        """
+        if not self.breaker.allow():
+            self.metrics.short_circuit()
+            raise CircuitOpenError('Email verifier circuit is open')
+
+        import httpx
+
+        started = time.perf_counter()
+        try:
+            response = await self.client.get(self.url, params={'email': email, 'api_key': self.api_key})
+        except httpx.HTTPError as exc:
+            self.metrics.observe(time.perf_counter() - started, error=True)
+            self.breaker.record_failure()
+            raise VerifierUnavailable(str(exc)) from exc
+
+        self.metrics.observe(time.perf_counter() - started, error=not response.is_success)
+        if response.status_code >= 500 or response.status_code == 429:
+            self.breaker.record_failure()
+            raise VerifierUnavailable(f'Email verifier responded with {response.status_code}')
+        self.breaker.record_success()
+        if not response.is_success:
+            raise VerifierUnavailable(f'Email verifier responded with {response.status_code}')
+        return response.json()['data'].get('status')
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+_async_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+@lru_cache
+def get_verifier_client() -> EmailVerifierClient:
+    return EmailVerifierClient(
+        url=SETTINGS.eh_api_url,
+        api_key=SETTINGS.eh_api_key,
+        connect_timeout=SETTINGS.eh_connect_timeout,
+        read_timeout=SETTINGS.eh_read_timeout,
+        pool_size=SETTINGS.eh_pool_size,
+        breaker=CircuitBreaker(failure_threshold=SETTINGS.eh_breaker_failure_threshold,
+                               reset_timeout=SETTINGS.eh_breaker_reset_timeout),
+    )
+
+
+def get_async_verifier_client() -> AsyncEmailVerifierClient:
+    """
+    Возвращает асинхронный клиент для текущего цикла событий.
+
+    Соединения httpx привязаны к циклу событий, поэтому клиент создается на каждый
+    цикл (под ASGI-сервером он один на процесс). Выключатель и метрики общие
+    с синхронным клиентом.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        sync_client = get_verifier_client()
+        client = _async_clients[loop] = AsyncEmailVerifierClient(
+            url=sync_client.url,
+            api_key=sync_client.api_key,
+            connect_timeout=SETTINGS.eh_connect_timeout,
+            read_timeout=SETTINGS.eh_read_timeout,
+            pool_size=SETTINGS.eh_pool_size,
+            breaker=sync_client.breaker,
+            metrics=sync_client.metrics,
+        )
+    return client
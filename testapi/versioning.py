@@ -0,0 +1,146 @@
+import hashlib
+import time
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.http import HttpRequest, HttpResponse, HttpResponseNotModified
+
+from django.contrib.auth import get_user_model
+
+from config import get_app_settings
+from testapi.models import Referral, ReferralCode
+
+
+SETTINGS = get_app_settings()
+USER_MODEL = get_user_model()
+
+
+def version_key(user_id) -> str:
+    return f'referral_version:{user_id}'
+
+
+def _new_version(changed_at: float = 0.0) -> str:
+    # Версия начинается с времени изменения данных в миллисекундах, см. is_recent
+    return f'{int(changed_at * 1000):x}-{uuid.uuid4().hex[:8]}'
+
+
+def is_recent(version: str) -> bool:
+    """
+    Проверяет, что версия сменена изменением данных меньше db_replica_max_lag секунд назад.
+
+    Реплика может еще не содержать изменения, которое сменило такую версию, поэтому данные для
+    кэширования под ней читаются с основной БД.
+    """
+    changed_at = int(version.split('-', 1)[0], 16) / 1000
+    return time.time() - changed_at < SETTINGS.db_replica_max_lag
+
+
+def get_version(user_id) -> str:
+    """
+    Возвращает текущую версию реферальных данных пользователя (рефералы и коды).
+
+    Версия хранится в кэше Django и меняется при каждом изменении Referral или
+    ReferralCode пользователя. Если версия вытеснена из кэша, создается новая,
+    поэтому устаревшие ETag и закэшированные ответы перестают совпадать.
+    """
+    key = version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = _new_version()
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key) or version
+    return version
+
+
+async def aget_version(user_id) -> str:
+    """
+    Асинхронный вариант get_version.
+    """
+    key = version_key(user_id)
+    version = await cache.aget(key)
+    if version is None:
+        version = _new_version()
+        if not await cache.aadd(key, version, timeout=None):
+            version = await cache.aget(key) or version
+    return version
+
+
+def bump_versions(*user_ids) -> None:
+    """
+    Меняет версии пользователей после фиксации текущей транзакции.
+
+    Смена до фиксации позволила бы параллельному запросу закэшировать старые
+    данные под новой версией.
+    """
+    keys = {version_key(user_id): _new_version(time.time()) for user_id in set(user_ids) if user_id is not None}
+    if keys:
+        transaction.on_commit(lambda: cache.set_many(keys, timeout=None))
+
+
+def make_etag(user_id, version: str, *variant) -> str:
+    digest = hashlib.blake2b(repr(variant).encode(), digest_size=6).hexdigest()
+    return f'"{user_id}.{version}.{digest}"'
+
+
+def response_key(view: str, user_id, version: str, *variant) -> str:
+    return f'response:{view}:{user_id}:{version}:' + ':'.join(map(str, variant))
+
+
+def etag_matches(request: HttpRequest, etag: str) -> bool:
+    header = request.headers.get('If-None-Match', '')
+    return header.strip() == '*' or etag in {tag.strip() for tag in header.split(',')}
+
+
+def not_modified(etag: str) -> HttpResponse:
+    response = HttpResponseNotModified()
+    set_validators(response, etag)
+    return response
+
+
+def set_validators(response: HttpResponse, etag: str) -> HttpResponse:
+    """
+    Добавляет ETag и Cache-Control: клиент хранит ответ у себя, но перепроверяет его при каждом опросе.
+    """
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@receiver(post_save, sender=Referral)
+@receiver(post_delete, sender=Referral)
+def bump_referrer_version(sender, instance, **kwargs):
+    bump_versions(instance.referrer_id)
+
+
+@receiver(post_save, sender=ReferralCode)
+@receiver(post_delete, sender=ReferralCode)
+def bump_code_owner_version(sender, instance, **kwargs):
+    bump_versions(instance.user_id)
+
+
+@receiver(post_init, sender=USER_MODEL)
+def remember_username(sender, instance, **kwargs):
+    # Через __dict__, чтобы отложенное поле username не загружалось отдельным запросом
+    instance._loaded_username = instance.__dict__.get('username')
+
+
+@receiver(post_save, sender=USER_MODEL)
+def bump_referrer_on_rename(sender, instance, created, update_fields=None, **kwargs):
+    # Имя реферала входит в ответы ref-info его реферера
+    if update_fields is not None and 'username' not in update_fields:
+        return
+    loaded, instance._loaded_username = instance._loaded_username, instance.username
+    if created or loaded is None or loaded == instance.username:
+        return
+    bump_versions(*Referral.objects.filter(referral=instance).values_list('referrer_id', flat=True))
+
+
+@receiver(post_save, sender=USER_MODEL)
+def reset_new_user_version(sender, instance, created, **kwargs):
+    # Идентификатор может достаться новому пользователю от удаленного (например, после отката
+    # транзакции в SQLite), поэтому версия и ответы, закэшированные для прежнего владельца, сбрасываются
+    if created:
+        cache.delete(version_key(instance.pk))
@@ -1,15 +1,25 @@
-import requests
-import swagger_docs 
 from rest_framework.request import Request
-from dateutil import parser
+from testapi.openapi import swagger_schema
 from testapi.serializers import UserSerializer, ReferralCodeSerializer
-from testapi.models import ReferralCode, Referral
+from testapi.models import ReferralCode, Referral, PendingRegistration, ReferralClosure, ReferralStats
+from testapi.verification import verify_email
+from testapi.verifier_client import VerifierUnavailable
+from testapi.outbox import enqueue_mail
+from testapi.bulk import CREATED, bulk_register
+from testapi.referral_cache import invalidate_referral_codes, resolve_referrer_id
+from testapi.versioning import (bump_versions, etag_matches, get_version, is_recent, make_etag, not_modified,
+                                response_key, set_validators)
 from config import get_app_settings
 from rest_framework import status, views
 from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
-from django.core.mail import send_mail
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count
+from django.utils import timezone
+from datetime import datetime, time
+from django.urls import reverse
 from django.contrib.auth import get_user_model, authenticate
 
 
@@ -17,6 +27,29 @@ SETTINGS = get_app_settings()
 USER_MODEL = get_user_model()
 
 
+def parse_expiry_date(value) -> datetime:
+    """
+    Приводит дату истечения срока действия кода к полуночи этого дня в текущем часовом поясе.
+
+    Исключения:
+        ValueError: Дата не указана, некорректна или не находится в будущем; текст ошибки
+            возвращается клиенту.
+    """
+    # dateutil нужен только здесь, поэтому импортируется при первом вызове, а не при запуске воркера
+    from dateutil import parser
+
+    if not value:
+        raise ValueError("Expiry date is required")
+    try:
+        date_object = parser.parse(str(value))
+    except (ValueError, OverflowError):
+        raise ValueError("Invalid expiry date")
+    expiry_date = timezone.make_aware(datetime.combine(date_object.date(), time.min))
+    if expiry_date <= timezone.now():
+        raise ValueError("Expiry date must be in the future")
+    return expiry_date
+
+
 class UserRegistrationView(views.APIView):
     """
     API-представление для регистрации пользователя.
@@ -32,14 +65,16 @@ class UserRegistrationView(views.APIView):
     permission_classes: list = [AllowAny]
 
 
-    @swagger_docs.user_registration_schema
+    @swagger_schema('user_registration_schema')
     def post(self, request: Request) -> Response:
         """
         Обрабатывает POST-запросы для регистрации пользователя.
 
         Этот метод проверяет данные пользователя с помощью UserSerializer. Если данные действительны,
-        он подтверждает адрес электронной почты с помощью API hunter.io. Если адрес электронной почты действителен,
+        он подтверждает адрес электронной почты с помощью API hunter.io (результат проверки кэшируется). Если адрес электронной почты действителен,
         он создает нового пользователя. Если предоставлен действительный реферальный код, он создает объект реферала.
+        Реферальный код проверяется по кэшу в памяти процесса (testapi.referral_cache): неактивные
+        и просроченные коды считаются недействительными.
 
         Аргументы:
             request: Объект запроса.
@@ -48,30 +83,39 @@ class UserRegistrationView(views.APIView):
             Объект Response. Если данные пользователя и адрес электронной почты действительны, и пользователь успешно создан,
             он возвращает статус 201 и сообщение об успехе. Если адрес электронной почты или реферальный код недействителен,
             он возвращает статус 400 и сообщение об ошибке. Если данные пользователя недействительны, он возвращает статус 400 и ошибки проверки.
+            Если hunter.io недоступен и EH_UNAVAILABLE_POLICY=reject, возвращает статус 503; при allow адрес считается действительным.
         """
         
         serializer = UserSerializer(data=request.data)
+        if serializer.is_valid() and SETTINGS.registration_async:
+            return self.accept_pending(request, serializer)
         if serializer.is_valid():
             email = serializer.validated_data.get("email")
-            response = requests.get(f"https://api.hunter.io/v2/email-verifier?email={email}&api_key={SETTINGS.eh_api_key}",
-                                    timeout=None)
-            
-            if response.json()['data'].get('status') != 'valid':
+            try:
+                is_valid = verify_email(email)
+            except VerifierUnavailable:
+                if SETTINGS.eh_unavailable_policy != 'allow':
+                    return Response({"error": "Email verification is temporarily unavailable"},
+                                    status=status.HTTP_503_SERVICE_UNAVAILABLE)
+                is_valid = True
+
+            if not is_valid:
                 return Response({"error": "Invalid email address"},
                                 status=status.HTTP_400_BAD_REQUEST)
 
             referral_code = request.data.get("referral_code")
             referrer = None
             if referral_code:
-                try:
-                    referrer = ReferralCode.objects.get(code=referral_code).user
-                except ReferralCode.DoesNotExist:
+                referrer = resolve_referrer_id(referral_code)
+                if referrer is None:
                     return Response({"error": "Invalid referral code"},
                                     status=status.HTTP_400_BAD_REQUEST)
 
-            user = USER_MODEL.objects.create_user(**serializer.validated_data)
+            with transaction.atomic():
+                user = USER_MODEL.objects.create_user(**serializer.validated_data)
+                if user and referrer:
+                    Referral.objects.create(referrer_id=referrer, referral=user)
             if user and referrer:
-                Referral.objects.create(referrer=referrer, referral=user)
                 return Response({'message': 'Successfully created a new user with referral code'},
                                 status=status.HTTP_201_CREATED)
             elif user:
@@ -79,6 +123,114 @@ class UserRegistrationView(views.APIView):
                                 status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    def accept_pending(self, request: Request, serializer: UserSerializer) -> Response:
+        """
+        Принимает регистрацию без ожидания проверки адреса электронной почты.
+
+        Создает неактивного пользователя и отложенную регистрацию, которую завершат
+        фоновые воркеры (testapi.workers). Используется при registration_async=True.
+
+        Аргументы:
+            request: Объект запроса.
+            serializer: Проверенный UserSerializer.
+
+        Возвращает:
+            Объект Response со статусом 202 и ссылкой на статус регистрации.
+        """
+
+        with transaction.atomic():
+            user = USER_MODEL.objects.create_user(**serializer.validated_data, is_active=False)
+            registration = PendingRegistration.objects.create(
+                user=user,
+                email=user.email,
+                referral_code=request.data.get("referral_code") or '',
+            )
+        status_url = request.build_absolute_uri(reverse('registration-status', args=[registration.id]))
+        return Response({'message': 'Registration accepted',
+                         'id': str(registration.id),
+                         'status_url': status_url},
+                        status=status.HTTP_202_ACCEPTED,
+                        headers={'Location': status_url})
+
+
+class BulkRegistrationView(views.APIView):
+    """
+    API-представление для пакетной регистрации пользователей.
+
+    Предназначено для загрузки партнерских когорт и доступно только администраторам.
+
+    Атрибуты:
+        permission_classes: Список классов разрешений, которые должно использовать представление.
+    """
+
+    permission_classes: list = [IsAdminUser]
+
+    @swagger_schema('bulk_registration_schema')
+    def post(self, request: Request) -> Response:
+        """
+        Обрабатывает POST-запросы для пакетной регистрации.
+
+        Регистрирует пользователей из списка users с помощью testapi.bulk.bulk_register: адреса
+        проверяются параллельно, пароли хешируются в пуле процессов, а строки вставляются пачками.
+        Ошибка в одной строке не отменяет регистрацию остальных.
+
+        Аргументы:
+            request: Объект запроса.
+
+        Возвращает:
+            Объект Response со статусом 200, количеством созданных и отклоненных строк и результатом
+            по каждой строке. Если users не список или в нем больше bulk_registration_max_size строк,
+            возвращает статус 400 и сообщение об ошибке.
+        """
+
+        users = request.data.get("users")
+        if not isinstance(users, list):
+            return Response({"error": "users must be a list"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(users) > SETTINGS.bulk_registration_max_size:
+            return Response({"error": f"Too many users: maximum is {SETTINGS.bulk_registration_max_size}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        results = bulk_register(users)
+        created = sum(1 for result in results if result['status'] == CREATED)
+        return Response({"created": created,
+                         "failed": len(results) - created,
+                         "results": results},
+                        status=status.HTTP_200_OK)
+
+
+class RegistrationStatusView(views.APIView):
+    """
+    API-представление для получения статуса отложенной регистрации.
+
+    Атрибуты:
+        permission_classes: Список классов разрешений, которые должно использовать представление.
+    """
+
+    permission_classes: list = [AllowAny]
+
+    @swagger_schema('registration_status_schema')
+    def get(self, request: Request, registration_id) -> Response:
+        """
+        Обрабатывает GET-запросы для получения статуса отложенной регистрации.
+
+        Аргументы:
+            request: Объект запроса.
+            registration_id: Идентификатор регистрации из ответа 202.
+
+        Возвращает:
+            Объект Response. Если регистрация найдена, возвращает статус 200, ее статус и ошибку (если есть).
+            Если регистрация не найдена, возвращает статус 404 и сообщение об ошибке.
+        """
+
+        try:
+            registration = PendingRegistration.objects.get(id=registration_id)
+        except PendingRegistration.DoesNotExist:
+            return Response({"error": "Registration not found"},
+                            status=status.HTTP_404_NOT_FOUND)
+        return Response({"id": str(registration.id),
+                         "status": registration.status,
+                         "error": registration.error},
+                        status=status.HTTP_200_OK)
 
 
 class UserLoginView(views.APIView):
@@ -95,7 +247,7 @@ class UserLoginView(views.APIView):
     permission_classes: list = [AllowAny]
     
     
-    @swagger_docs.user_login_schema
+    @swagger_schema('user_login_schema')
     def post(self, request: Request) -> Response:
         """
         Обрабатывает POST-запросы для входа пользователя.
@@ -137,12 +289,13 @@ class ReferralCodeView(views.APIView):
     permission_classes: list = [IsAuthenticated]
 
 
-    @swagger_docs.referral_code_get_schema
+    @swagger_schema('referral_code_get_schema')
     def get(self, request: Request) -> Response:
         """
         Обрабатывает GET-запросы для получения реферального кода пользователя.
 
-        Этот метод получает активный реферальный код пользователя и отправляет его на электронную почту пользователя.
+        Этот метод получает активный и не истекший реферальный код пользователя и ставит письмо с ним в исходящую очередь
+        (testapi.outbox). Письмо отправляет команда send_outbox, поэтому ответ не ждет почтового сервера.
 
         Аргументы:
             request: Объект запроса.
@@ -155,65 +308,62 @@ class ReferralCodeView(views.APIView):
         user = request.user
         email = user.email
 
-        try:
-            referral_code = ReferralCode.objects.get(user=user, is_active=True)
-        except ReferralCode.DoesNotExist:
-            return Response({"message": "No active code found for this user"},
-                            status=status.HTTP_404_NOT_FOUND)
+        with transaction.atomic():
+            try:
+                referral_code = ReferralCode.objects.active().get(user=user)
+            except ReferralCode.DoesNotExist:
+                return Response({"message": "No active code found for this user"},
+                                status=status.HTTP_404_NOT_FOUND)
 
-        send_mail(
-            'Your referral code',
-            f'Your referral code is {referral_code.code}',
-            SETTINGS.email_host_user,
-            [email], 
-            fail_silently=False,
-        )
+            enqueue_mail(
+                'Your referral code',
+                f'Your referral code is {referral_code.code}',
+                SETTINGS.email_host_user,
+                [email],
+            )
 
         return Response({"message": "Referral code has been sent to the email"},
                         status=status.HTTP_200_OK)
     
     
-    @swagger_docs.referral_code_post_schema
+    @swagger_schema('referral_code_post_schema')
     def post(self, request: Request) -> Response:
         """
         Обрабатывает POST-запросы для создания реферального кода пользователя.
 
-        Этот метод получает дату истечения срока действия из запроса, создает новый реферальный код с этой датой истечения
-        и делает все другие реферальные коды пользователя неактивными.
+        Этот метод получает дату истечения срока действия из запроса, проверяет ее и одной транзакцией
+        (ReferralCode.rotate) делает все другие реферальные коды пользователя неактивными и создает новый
+        код с этой датой истечения. Строка пользователя блокируется на время транзакции, поэтому
+        параллельные запросы одного пользователя выполняются по очереди и оставляют ровно один активный код.
 
         Аргументы:
             request: Объект запроса.
 
         Возвращает:
             Объект Response. Если реферальный код успешно создан, возвращает статус 201 и данные реферального кода.
-            Если дата истечения срока действия не предоставлена или находится в прошлом, возвращает статус 400 и сообщение об ошибке.
+            Если дата истечения срока действия не предоставлена, некорректна или находится в прошлом, возвращает
+            статус 400 и сообщение об ошибке; в этом случае текущий код остается активным.
         """
         
         user = request.user
         expiry_date = request.data.get("expiry_date")
         
 
-        if not expiry_date:
-            return Response({"error": "Expiry date is required"},
+        try:
+            expiry_date = parse_expiry_date(expiry_date)
+        except ValueError as exc:
+            return Response({"error": str(exc)},
                             status=status.HTTP_400_BAD_REQUEST)
 
-        date_object = parser.parse(expiry_date)
-        expiry_date = date_object.strftime("%Y-%m-%d")
-        
-        ReferralCode.objects.filter(user=user, is_active=True).update(is_active=False)
-
-        referral_code = ReferralCode.objects.create(user=user, expiry_date=expiry_date)
+        referral_code, previous_codes = ReferralCode.rotate(user, expiry_date)
+        invalidate_referral_codes(*previous_codes)
         serialize_code = ReferralCodeSerializer(referral_code)
         
-        if referral_code.is_expired():
-            return Response({"error": "Expiry date must be in the future"},
-                            status=status.HTTP_400_BAD_REQUEST)
-        
         return Response(serialize_code.data,
                         status=status.HTTP_201_CREATED)
     
     
-    @swagger_docs.referral_code_delete_schema
+    @swagger_schema('referral_code_delete_schema')
     def delete(self, request: Request) -> Response:
         """
         Обрабатывает DELETE-запросы для удаления активного реферального кода пользователя.
@@ -236,6 +386,8 @@ class ReferralCodeView(views.APIView):
         
         serialize_code = ReferralCodeSerializer(referral_code)
         ReferralCode.objects.filter(user=user, is_active=True).update(is_active=False)
+        invalidate_referral_codes(referral_code.code)
+        bump_versions(user.id)
         return Response({"message": "Code successfully delete",
                         "code": serialize_code.data},
                         status=status.HTTP_204_NO_CONTENT)
@@ -253,20 +405,177 @@ class ReferralInfoView(views.APIView):
     
     permission_classes:list = [IsAuthenticated]
     
-    @swagger_docs.referral_code_info_schema
+    @swagger_schema('referral_code_info_schema')
     def get(self, request: Request) -> Response:
         """
         Обрабатывает GET-запросы для получения информации о рефералах пользователя.
 
-        Этот метод получает все рефералы пользователя и возвращает их имена пользователей.
+        Этот метод возвращает страницу имен пользователей рефералов. Страницы выбираются по курсору
+        (идентификатору последнего реферала предыдущей страницы) одним запросом с JOIN, без OFFSET,
+        поэтому стоимость запроса не зависит от номера страницы. Общее количество рефералов
+        возвращается только при count=true и кэшируется на referral_count_ttl секунд.
+
+        Страница кэшируется на response_cache_ttl секунд под версией реферальных данных пользователя
+        (testapi.versioning), а ETag ответа строится из той же версии и параметров запроса. Повторный
+        опрос с If-None-Match получает 304, а опрос без него - страницу из кэша; в обоих случаях к БД
+        выполняется один запрос (пользователь из JWT), пока у пользователя не изменились рефералы,
+        их имена или коды.
 
         Аргументы:
-            request: Объект запроса.
+            request: Объект запроса. Параметры: cursor, page_size, count.
 
         Возвращает:
-            Объект Response. Возвращает статус 200 и список имен пользователей рефералов.
+            Объект Response. Возвращает статус 200, список имен пользователей рефералов и курсор следующей
+            страницы (null на последней странице) или статус 304, если страница не изменилась. Если курсор
+            или размер страницы некорректны, возвращает статус 400 и сообщение об ошибке.
         """
         
         user = request.user
-        referrals = Referral.objects.filter(referrer=user)
-        return Response({"referrals": [referral.referral.username for referral in referrals]}, status=status.HTTP_200_OK)
+        try:
+            cursor = int(request.query_params.get("cursor", 0))
+            page_size = int(request.query_params.get("page_size", SETTINGS.referral_page_size))
+        except ValueError:
+            return Response({"error": "Invalid cursor or page size"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if cursor < 0 or page_size < 1:
+            return Response({"error": "Invalid cursor or page size"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        page_size = min(page_size, SETTINGS.referral_page_size_max)
+        with_count = request.query_params.get("count") in ("1", "true")
+
+        version = get_version(user.id)
+        etag = make_etag(user.id, version, cursor, page_size, with_count)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        key = response_key('ref-info', user.id, version, cursor, page_size, with_count)
+        data = cache.get(key)
+        if data is None:
+            # Свежую версию читаем с основной БД, чтобы не закэшировать под ней отстающую реплику
+            referrals = Referral.objects.db_manager(DEFAULT_DB_ALIAS if is_recent(version) else None)
+            rows = list(
+                referrals
+                .filter(referrer=user, id__gt=cursor)
+                .order_by('id')
+                .values_list('id', 'referral__username')[:page_size + 1]
+            )
+            page = rows[:page_size]
+            data = {
+                "referrals": [username for _, username in page],
+                "next_cursor": str(page[-1][0]) if len(rows) > page_size else None,
+            }
+            if with_count:
+                data["count"] = cache.get_or_set(f"referral_count:{user.id}",
+                                                 lambda: referrals.filter(referrer=user).count(),
+                                                 SETTINGS.referral_count_ttl)
+            cache.set(key, data, SETTINGS.response_cache_ttl)
+        return set_validators(Response(data, status=status.HTTP_200_OK), etag)
+
+
+class ReferralTreeView(views.APIView):
+    """
+    API-представление для получения дерева рефералов пользователя на несколько уровней вглубь.
+
+    Данные читаются из таблицы замыкания ReferralClosure, поэтому выборка на любую глубину
+    выполняется одним запросом по индексу (ancestor, depth) без рекурсии.
+
+    Атрибуты:
+        permission_classes: Список классов разрешений, которые должно использовать представление.
+    """
+
+    permission_classes: list = [IsAuthenticated]
+
+    @swagger_schema('referral_tree_schema')
+    def get(self, request: Request) -> Response:
+        """
+        Обрабатывает GET-запросы для получения дерева рефералов.
+
+        Аргументы:
+            request: Объект запроса. Параметры: depth (глубина, по умолчанию 3), view (counts или tree).
+
+        Возвращает:
+            Объект Response. При view=counts возвращает статус 200 и количество рефералов на каждом уровне.
+            При view=tree возвращает статус 200 и вложенное дерево имен пользователей (не больше
+            referral_tree_max_nodes узлов, при превышении truncated=true).
+            Если параметры некорректны, возвращает статус 400 и сообщение об ошибке.
+        """
+
+        user = request.user
+        mode = request.query_params.get("view", "counts")
+        try:
+            depth = int(request.query_params.get("depth", 3))
+        except ValueError:
+            depth = 0
+        if not 1 <= depth <= SETTINGS.referral_tree_max_depth or mode not in ("counts", "tree"):
+            return Response({"error": f"depth must be between 1 and {SETTINGS.referral_tree_max_depth}, "
+                                      "view must be counts or tree"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        paths = ReferralClosure.objects.filter(ancestor=user, depth__lte=depth)
+        if mode == "counts":
+            levels = list(paths.values('depth').annotate(count=Count('id')).order_by('depth'))
+            return Response({"levels": levels, "total": sum(level['count'] for level in levels)},
+                            status=status.HTTP_200_OK)
+
+        limit = SETTINGS.referral_tree_max_nodes
+        rows = list(paths.order_by('depth', 'descendant_id')
+                    .values_list('descendant_id', 'descendant__username', 'depth')[:limit + 1])
+        truncated = len(rows) > limit
+        rows = rows[:limit]
+        parents = dict(ReferralClosure.objects
+                       .filter(descendant_id__in=[row[0] for row in rows if row[2] > 1], depth=1)
+                       .values_list('descendant_id', 'ancestor_id'))
+        nodes = {user.id: {"username": user.username, "children": []}}
+        for descendant_id, username, level in rows:
+            parent = nodes.get(user.id if level == 1 else parents.get(descendant_id))
+            if parent is None or descendant_id in nodes:
+                continue
+            nodes[descendant_id] = {"username": username, "children": []}
+            parent["children"].append(nodes[descendant_id])
+        return Response({"tree": nodes[user.id], "truncated": truncated},
+                        status=status.HTTP_200_OK)
+
+
+class LeaderboardView(views.APIView):
+    """
+    API-представление для получения рейтинга пользователей по количеству прямых рефералов.
+
+    Рейтинг читается из денормализованных счетчиков ReferralStats по индексу
+    (-direct_referrals, user), без агрегации по таблице Referral.
+
+    Атрибуты:
+        permission_classes: Список классов разрешений, которые должно использовать представление.
+    """
+
+    permission_classes: list = [IsAuthenticated]
+
+    @swagger_schema('leaderboard_schema')
+    def get(self, request: Request) -> Response:
+        """
+        Обрабатывает GET-запросы для получения рейтинга рефереров.
+
+        Аргументы:
+            request: Объект запроса. Параметр limit - количество мест (по умолчанию 10).
+
+        Возвращает:
+            Объект Response. Возвращает статус 200 и список пользователей с их счетчиками.
+            Если limit некорректен, возвращает статус 400 и сообщение об ошибке.
+        """
+
+        try:
+            limit = int(request.query_params.get("limit", 10))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= SETTINGS.leaderboard_max_limit:
+            return Response({"error": f"limit must be between 1 and {SETTINGS.leaderboard_max_limit}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        leaders = (ReferralStats.objects
+                   .filter(direct_referrals__gt=0)
+                   .order_by('-direct_referrals', 'user')
+                   .values('user__username', 'direct_referrals', 'signups', 'codes_issued')[:limit])
+        return Response({"leaderboard": [{"username": row['user__username'],
+                                          "direct_referrals": row['direct_referrals'],
+                                          "signups": row['signups'],
+                                          "codes_issued": row['codes_issued']} for row in leaders]},
+                        status=status.HTTP_200_OK)
+
@@ -0,0 +1,213 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from config import get_app_settings
+from testapi.models import PendingRegistration, Referral
+from testapi.referral_cache import resolve_referrer_id
+from testapi.verification import verify_email
+from testapi.verifier_client import VerifierUnavailable
+
+
+SETTINGS = get_app_settings()
+logger = logging.getLogger(__name__)
+
+LEASE_EXPIRED_ERROR = 'Processing did not finish before the lease expired'
+
+
+def retry_delay(attempts: int) -> float:
+    """
+    Экспоненциальная задержка перед повторной попыткой, ограниченная registration_retry_max_delay.
+    """
+    delay = SETTINGS.registration_retry_base_delay * (2 ** max(attempts - 1, 0))
+    return min(delay, SETTINGS.registration_retry_max_delay)
+
+
+def claim_registrations(limit: int) -> list:
+    """
+    Захватывает до limit ожидающих регистраций для обработки.
+
+    Строки блокируются с SKIP LOCKED, поэтому несколько процессов с воркерами
+    не получат одну и ту же регистрацию. Регистрации, застрявшие в статусе
+    processing дольше registration_lease_timeout (например, после падения
+    воркера), захватываются повторно; такое падение считается попыткой, и после
+    registration_max_attempts попыток регистрация переводится в failed.
+
+    Возвращает:
+        Список идентификаторов захваченных регистраций.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=SETTINGS.registration_lease_timeout)
+    with transaction.atomic():
+        rows = list(
+            PendingRegistration.objects
+            .select_for_update(skip_locked=True)
+            .filter(Q(status=PendingRegistration.PENDING, next_attempt_at__lte=now)
+                    | Q(status=PendingRegistration.PROCESSING, updated_at__lt=stale))
+            .order_by('next_attempt_at')
+            .values_list('id', 'status', 'attempts')[:limit]
+        )
+        abandoned = [(id, attempts) for id, status, attempts in rows if status == PendingRegistration.PROCESSING]
+        exhausted = [id for id, attempts in abandoned if attempts + 1 >= SETTINGS.registration_max_attempts]
+        if abandoned:
+            PendingRegistration.objects.filter(id__in=[id for id, _ in abandoned]).update(
+                attempts=F('attempts') + 1, error=LEASE_EXPIRED_ERROR)
+        for registration in PendingRegistration.objects.select_related('user').filter(id__in=exhausted):
+            _fail(registration, LEASE_EXPIRED_ERROR)
+        ids = [id for id, _, _ in rows if id not in exhausted]
+        PendingRegistration.objects.filter(id__in=ids).update(status=PendingRegistration.PROCESSING,
+                                                              updated_at=now)
+    return ids
+
+
+def _reject(registration: PendingRegistration, error: str) -> None:
+    with transaction.atomic():
+        user = registration.user
+        registration.user = None
+        registration.status = PendingRegistration.REJECTED
+        registration.error = error
+        registration.save(update_fields=['user', 'status', 'error', 'updated_at'])
+        if user is not None:
+            user.delete()
+
+
+def _fail(registration: PendingRegistration, error: str) -> None:
+    with transaction.atomic():
+        user = registration.user
+        registration.user = None
+        registration.status = PendingRegistration.FAILED
+        registration.error = error[:255]
+        registration.save(update_fields=['user', 'attempts', 'status', 'error', 'updated_at'])
+        if user is not None:
+            user.delete()
+
+
+def _schedule_retry(registration: PendingRegistration, error: str) -> None:
+    registration.attempts += 1
+    if registration.attempts >= SETTINGS.registration_max_attempts:
+        _fail(registration, error)
+        return
+    registration.error = error[:255]
+    registration.status = PendingRegistration.PENDING
+    registration.next_attempt_at = timezone.now() + timedelta(seconds=retry_delay(registration.attempts))
+    registration.save(update_fields=['attempts', 'status', 'error', 'next_attempt_at', 'updated_at'])
+
+
+def process_registration(registration_id) -> str:
+    """
+    Завершает отложенную регистрацию.
+
+    Проверяет адрес электронной почты через hunter.io, связывает пользователя
+    с реферером и активирует его. При недействительном адресе или реферальном
+    коде регистрация отклоняется, а созданный пользователь удаляется. При
+    сетевой ошибке попытка переносится с экспоненциальной задержкой.
+
+    Аргументы:
+        registration_id: Идентификатор PendingRegistration.
+
+    Возвращает:
+        Итоговый статус регистрации.
+    """
+    registration = PendingRegistration.objects.select_related('user').get(id=registration_id)
+    if registration.user is None:
+        registration.status = PendingRegistration.FAILED
+        registration.error = 'User no longer exists'
+        registration.save(update_fields=['status', 'error', 'updated_at'])
+        return registration.status
+
+    try:
+        is_valid = verify_email(registration.email)
+    except VerifierUnavailable as exc:
+        logger.warning('Email verification for %s failed: %s', registration.id, exc)
+        _schedule_retry(registration, f'Email verification unavailable: {exc}')
+        return registration.status
+
+    if not is_valid:
+        _reject(registration, 'Invalid email address')
+        return registration.status
+
+    referrer = None
+    if registration.referral_code:
+        referrer = resolve_referrer_id(registration.referral_code)
+        if referrer is None:
+            _reject(registration, 'Invalid referral code')
+            return registration.status
+
+    with transaction.atomic():
+        user = registration.user
+        if referrer:
+            Referral.objects.create(referrer_id=referrer, referral=user)
+        user.is_active = True
+        user.save(update_fields=['is_active'])
+        registration.status = PendingRegistration.ACTIVE
+        registration.error = ''
+        registration.save(update_fields=['status', 'error', 'updated_at'])
+    return registration.status
+
+
+def record_crash(registration_id, exc: Exception) -> None:
+    """
+    Учитывает непредвиденное исключение при обработке регистрации как неудачную попытку:
+    регистрация переносится с экспоненциальной задержкой или, после registration_max_attempts
+    попыток, переводится в failed.
+    """
+    with transaction.atomic():
+        registration = (PendingRegistration.objects.select_for_update(of=('self',)).select_related('user')
+                        .filter(id=registration_id, status=PendingRegistration.PROCESSING).first())
+        if registration is not None:
+            _schedule_retry(registration, f'Processing crashed: {exc!r}')
+
+
+class RegistrationWorkerPool:
+    """
+    Пул фоновых воркеров, завершающих отложенные регистрации.
+
+    Одновременно обрабатывается не больше concurrency регистраций, поэтому
+    медленный hunter.io не может занять больше потоков, чем выделено пулу.
+
+    Атрибуты:
+        concurrency: Максимальное количество одновременно обрабатываемых регистраций.
+        poll_interval: Пауза в секундах между опросами, когда очередь пуста.
+    """
+
+    def __init__(self, concurrency: int | None = None, poll_interval: float = 1.0) -> None:
+        self.concurrency = concurrency or SETTINGS.registration_workers
+        self.poll_interval = poll_interval
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency,
+                                            thread_name_prefix='registration-worker')
+        self._stop = threading.Event()
+
+    def _run(self, registration_id) -> None:
+        close_old_connections()
+        try:
+            process_registration(registration_id)
+        except Exception as exc:
+            logger.exception('Registration %s crashed', registration_id)
+            try:
+                record_crash(registration_id, exc)
+            except Exception:
+                logger.exception('Failed to record crash of registration %s', registration_id)
+        finally:
+            close_old_connections()
+
+    def run_once(self) -> int:
+        ids = claim_registrations(self.concurrency)
+        wait([self._executor.submit(self._run, registration_id) for registration_id in ids])
+        return len(ids)
+
+    def run_forever(self) -> None:
+        while not self._stop.is_set():
+            if not self.run_once():
+                self._stop.wait(self.poll_interval)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def shutdown(self) -> None:
+        self.stop()
+        self._executor.shutdown(wait=True)